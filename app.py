@@ -1,24 +1,21 @@
 import streamlit as st
-from streamlit_folium import st_folium, folium_static
+from streamlit_folium import st_folium
 import folium
-from folium.plugins import Draw, MeasureControl
+from folium.plugins import Draw, HeatMap
 from folium import LayerControl
-import rasterio
-import rasterio.warp
-from rasterio.plot import reshape_as_image
-from PIL import Image
-from rasterio.warp import transform_bounds, calculate_default_transform, reproject
 import numpy as np
-import geopandas as gpd
-from shapely.geometry import Polygon, Point, LineString, shape
+import copy
+import hashlib
 import json
-from io import BytesIO
-from rasterio.enums import Resampling
-import matplotlib.pyplot as plt
 import os
-import uuid  # Pour générer des identifiants uniques
-from rasterio.mask import mask
-from shapely.geometry import LineString as ShapelyLineString
+from raster_cache import RasterCache, file_digest
+from defect_store import defect_store
+from defect_density import DENSITY_MAX_ZOOM, density_pyramid
+from job_queue import JobQueue, DONE, FAILED, CANCELLED
+from feature_store import FeatureLayer
+import instrumentation
+# Les modules lourds (rasterio, geopandas, shapely, matplotlib, calculs...) sont importés
+# dans les fonctions qui les utilisent : le démarrage et les réexécutions ordinaires n'en dépendent pas.
 
 # Dictionnaire des couleurs pour les types de fichiers GeoJSON
 geojson_colors = {
@@ -36,63 +33,228 @@ geojson_colors = {
     "Polygonale": "pink"
 }
 
-# Fonction pour reprojeter un fichier TIFF avec un nom unique
-def reproject_tiff(input_tiff, target_crs):
-    """Reproject a TIFF file to a target CRS."""
-    with rasterio.open(input_tiff) as src:
-        transform, width, height = rasterio.warp.calculate_default_transform(
-            src.crs, target_crs, src.width, src.height, *src.bounds
-        )
-        kwargs = src.meta.copy()
-        kwargs.update({
-            "crs": target_crs,
-            "transform": transform,
-            "width": width,
-            "height": height,
-        })
-
-        # Générer un nom de fichier unique
-        unique_id = str(uuid.uuid4())[:8]
-        reprojected_tiff = f"reprojected_{unique_id}.tiff"
-        with rasterio.open(reprojected_tiff, "w", **kwargs) as dst:
-            for i in range(1, src.count + 1):
-                rasterio.warp.reproject(
-                    source=rasterio.band(src, i),
-                    destination=rasterio.band(dst, i),
-                    src_transform=src.transform,
-                    src_crs=src.crs,
-                    dst_transform=transform,
-                    dst_crs=target_crs,
-                    resampling=rasterio.warp.Resampling.nearest,
-                )
-    return reprojected_tiff
-
 # Fonction pour appliquer un gradient de couleur à un MNT/MNS
-def apply_color_gradient(tiff_path, output_path):
+@instrumentation.traced()
+def apply_color_gradient(tiff_path, output_path, max_size=None):
     """Apply a color gradient to the DEM TIFF and save it as a PNG."""
-    with rasterio.open(tiff_path) as src:
-        dem_data = src.read(1)
-        cmap = plt.get_cmap("terrain")
-        norm = plt.Normalize(vmin=dem_data.min(), vmax=dem_data.max())
-        colored_image = cmap(norm(dem_data))
-        plt.imsave(output_path, colored_image)
-        plt.close()
+    from rendering import OVERLAY_MAX_SIZE, rendered_png
+
+    with open(output_path, "wb") as f:
+        f.write(rendered_png(tiff_path, "terrain", max_size or OVERLAY_MAX_SIZE))
 
 # Fonction pour ajouter une image TIFF à la carte
-def add_image_overlay(map_object, tiff_path, bounds, name):
-    """Add a TIFF image overlay to a Folium map."""
-    with rasterio.open(tiff_path) as src:
-        image = reshape_as_image(src.read())
-        folium.raster_layers.ImageOverlay(
-            image=image,
-            bounds=[[bounds.bottom, bounds.left], [bounds.top, bounds.right]],
-            name=name,
-            opacity=0.6,
-        ).add_to(map_object)
+def add_image_overlay(map_object, tiff_path, bounds, name, colormap=None, max_size=None):
+    """Add a TIFF image overlay to a Folium map (rendu décimé et mis en cache)."""
+    from rendering import OVERLAY_MAX_SIZE, rendered_data_url
+
+    with instrumentation.span("rendered_data_url", layer=name):
+        image = rendered_data_url(tiff_path, colormap, max_size or OVERLAY_MAX_SIZE)
+    instrumentation.count("map_payload_bytes", len(image))
+    folium.raster_layers.ImageOverlay(
+        image=image,
+        bounds=[[bounds.bottom, bounds.left], [bounds.top, bounds.right]],
+        name=name,
+        opacity=0.6,
+    ).add_to(map_object)
+
+# Serveur de tuiles XYZ partagé entre les exécutions du script
+@st.cache_resource
+def get_tile_server():
+    """Démarre (une seule fois) le serveur de tuiles sur le cache des rasters."""
+    from raster_io import reprojection_cache
+    from tile_server import start_tile_server
+
+    return start_tile_server(reprojection_cache().directory)
+
+# Fonction pour obtenir l'index de recherche de points (reconstruit à chaque nouvelle version des données)
+@st.cache_resource(max_entries=4)
+def get_point_finder(network_version, layers_version, _layers):
+    """Retourne le ``PointFinder`` du réseau routier et des couches GeoJSON téléversées."""
+    from point_finder import PointFinder
+
+    return PointFinder.from_layers(_layers)
+
+# Carte de base (fonds satellite et topographique, outil de dessin), construite une seule fois
+@st.cache_resource
+def base_map():
+    """Retourne le modèle de carte, à copier (``copy.deepcopy``) avant d'y ajouter des couches."""
+    m = folium.Map(location=[7.5399, -5.5471], zoom_start=6)
+    folium.TileLayer(
+        tiles="https://server.arcgisonline.com/ArcGIS/rest/services/World_Imagery/MapServer/tile/{z}/{y}/{x}",
+        attr="Esri",
+        name="Satellite",
+    ).add_to(m)
+    folium.TileLayer(
+        tiles="https://{s}.tile.opentopomap.org/{z}/{x}/{y}.png",
+        attr="OpenTopoMap",
+        name="Topographique",
+    ).add_to(m)
+    draw = Draw(
+        draw_options={"polyline": True, "polygon": True, "circle": False, "rectangle": True, "marker": True, "circlemarker": False},
+        edit_options={"edit": True, "remove": True},
+    )
+    draw.add_to(m)
+    return m
+
+# File des tâches longues partagée entre les exécutions du script (et les sessions)
+@st.cache_resource
+def get_job_queue():
+    """Crée (une seule fois) la file des tâches de fond."""
+    return JobQueue()
+
+# Fonction pour calculer l'empreinte d'une liste d'entités GeoJSON
+def polygons_digest(features):
+    """Empreinte stable des géométries et propriétés d'entités (clé des tâches)."""
+    return hashlib.sha256(json.dumps(features, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+# Suivi d'une tâche en cours : seul ce fragment est réexécuté chaque seconde
+@st.fragment(run_every=1.0)
+def job_progress(job_key):
+    """Affiche la progression d'une tâche et un bouton d'annulation ; relance la page à la fin de la tâche."""
+    jobs = get_job_queue()
+    job = jobs.get(job_key)
+    if job is None or job.done:
+        st.rerun()
+    text = f"{job.label} ({job.status}, {job.elapsed():.0f} s)"
+    st.progress(job.progress, text=f"{text} — {job.message}" if job.message else text)
+    if st.button("Annuler", key=f"cancel_{job_key}"):
+        jobs.cancel(job_key)
+        st.rerun()
+
+# Fonction pour afficher l'issue d'une tâche échouée ou annulée
+def show_job_outcome(job):
+    if job.status == FAILED:
+        st.error(f"{job.label} : échec ({job.error})")
+    elif job.status == CANCELLED:
+        st.warning(f"{job.label} : tâche annulée.")
+
+# Fonction pour mesurer la sérialisation des entités GeoJSON envoyées à la carte (instrumentation active seulement)
+def count_map_payload(name, data):
+    if instrumentation.current_trace() is not None:
+        with instrumentation.span("geojson_serialization", layer=name, features=len(data["features"])):
+            instrumentation.count("map_payload_bytes", len(json.dumps(data)))
+
+# Entités d'une couche vectorielle pour une vue (emprise, zoom), mémorisées entre les exécutions
+@st.cache_data(max_entries=64, show_spinner=False)
+def view_geojson(vector_key, view, zoom):
+    """Retourne la FeatureCollection de la couche ``vector_key`` pour l'emprise ``view`` et le zoom."""
+    from vector_cache import VectorLayer
+
+    return VectorLayer(vector_key).geojson(view, zoom)
+
+# Fonction pour construire la couche d'une couche vectorielle limitée à la vue
+def vector_layer_group(vector_key, name, bounds, zoom, color="blue", tooltip_field=None):
+    """Retourne un FeatureGroup des seules entités de l'emprise, simplifiées pour le zoom courant."""
+    view = (bounds["_southWest"]["lng"], bounds["_southWest"]["lat"], bounds["_northEast"]["lng"], bounds["_northEast"]["lat"])
+    group = folium.FeatureGroup(name=name)
+    with instrumentation.span("view_geojson", layer=name):
+        data = view_geojson(vector_key, view, zoom)
+    if data["features"]:
+        count_map_payload(name, data)
+        folium.GeoJson(
+            data,
+            style_function=lambda x, color=color: {"color": color, "weight": 4, "opacity": 0.7},
+            tooltip=folium.GeoJsonTooltip(fields=[tooltip_field]) if tooltip_field else None,
+        ).add_to(group)
+    return group
+
+# Style des entités utilisateur selon le type de géométrie (lignes bleues, polygones verts)
+def user_feature_style(feature):
+    if feature["geometry"]["type"] in ("Polygon", "MultiPolygon"):
+        return {"color": "green", "fillColor": "green", "fillOpacity": 0.2, "weight": 3}
+    return {"color": "blue", "weight": 3}
+
+# Fonction pour construire la couche d'une couche utilisateur : un seul objet GeoJSON par couche
+def user_layer_group(name, layer):
+    """Retourne un FeatureGroup contenant la FeatureCollection (mémorisée par version) de ``layer``."""
+    group = folium.FeatureGroup(name=name, show=True)
+    if len(layer):
+        data = layer.geojson(f"{name} - Entité")
+        count_map_payload(name, data)
+        folium.GeoJson(
+            data,
+            style_function=user_feature_style,
+            marker=folium.CircleMarker(radius=6, color="blue", fill=True, fill_opacity=0.8),
+            popup=folium.GeoJsonPopup(fields=["name"], labels=False),
+        ).add_to(group)
+    return group
+
+# Fonction pour obtenir les couches des couches utilisateur, reconstruites seulement quand leur version change
+def user_layer_groups(layers):
+    """Retourne les FeatureGroup de ``layers`` ; ceux des couches inchangées (même objet, même version) sont réutilisés."""
+    previous = st.session_state.get("user_layer_groups", {})
+    groups = {}
+    for name, layer in layers.items():
+        cached_layer, version, group = previous.get(name, (None, None, None))
+        if cached_layer is not layer or version != layer.version:
+            group = user_layer_group(name, layer)
+        groups[name] = (layer, layer.version, group)
+    st.session_state["user_layer_groups"] = groups
+    return [group for _, _, group in groups.values()]
+
+# Couleur d'un défaut ou d'une cellule selon la gravité
+def gravity_color(gravity):
+    return {1: "green", 2: "orange"}.get(int(gravity), "red")
+
+# Fonction pour construire la couche de densité des défauts de l'emprise affichée
+def defect_density_group(bounds, categories=None, months=None, max_points=500):
+    """Retourne un FeatureGroup : carte de chaleur et cellules agrégées, ou défauts individuels si peu nombreux."""
+    south, west = bounds["_southWest"]["lat"], bounds["_southWest"]["lng"]
+    north, east = bounds["_northEast"]["lat"], bounds["_northEast"]["lng"]
+    pyramid = density_pyramid()
+    pyramid.refresh()
+    cells = pyramid.cells(south, west, north, east, categories=categories, months=months)
+    group = folium.FeatureGroup(name="Densité des défauts")
+    if cells["zoom"] == DENSITY_MAX_ZOOM and cells["nombre"].sum() <= max_points:
+        filters = {"categorie": categories[0]} if categories and len(categories) == 1 else {}
+        for defect in defect_store().in_bbox(west, south, east, north, **filters):
+            if categories and defect["categorie"] not in categories:
+                continue
+            if months and not months[0] <= defect["date"][:7] <= months[1]:
+                continue
+            folium.CircleMarker(
+                location=[defect["latitude"], defect["longitude"]], radius=5, color=gravity_color(defect["gravite"]),
+                fill=True, popup=f"{defect['categorie']} (gravité {defect['gravite']}) — {defect['route']}, {defect['date']}",
+            ).add_to(group)
+        return group
+    if len(cells["nombre"]):
+        HeatMap(np.column_stack([cells["lat"], cells["lon"], cells["nombre"] / cells["nombre"].max()]).tolist(),
+                radius=18).add_to(group)
+    for lat, lon, count, gravity in zip(cells["lat"], cells["lon"], cells["nombre"], cells["gravite_max"]):
+        folium.CircleMarker(
+            location=[lat, lon], radius=float(3 + 2 * np.log10(count)), color=gravity_color(gravity), weight=1,
+            fill=True, fill_opacity=0.5, tooltip=f"{count} défaut(s), gravité max {gravity}",
+        ).add_to(group)
+    return group
+
+# Fonction pour savoir si le navigateur peut joindre le serveur de tuiles
+def tiles_reachable():
+    """Vrai si le serveur a une URL publique ou si la page est ouverte sur la machine du serveur."""
+    from urllib.parse import urlparse
+
+    if get_tile_server().public:
+        return True
+    url = st.context.url
+    # Sans URL de page (exécution sans navigateur), le script tourne localement
+    return url is None or urlparse(url).hostname in ("localhost", "127.0.0.1", "::1")
+
+# Fonction pour ajouter un raster servi en tuiles XYZ à la carte
+def add_tile_layer(map_object, tiff_path, bounds, name, colormap=None):
+    """Ajoute une couche de tuiles produites à la demande par le serveur local."""
+    folium.TileLayer(
+        tiles=get_tile_server().tile_url(tiff_path, colormap),
+        attr=name,
+        name=name,
+        overlay=True,
+        opacity=0.6,
+        bounds=[[bounds.bottom, bounds.left], [bounds.top, bounds.right]],
+    ).add_to(map_object)
 
 # Fonction pour calculer les limites d'un GeoJSON
 def calculate_geojson_bounds(geojson_data):
     """Calculate bounds from a GeoJSON object."""
+    import geopandas as gpd
+
     geometries = [feature["geometry"] for feature in geojson_data["features"]]
     gdf = gpd.GeoDataFrame.from_features(geojson_data)
     return gdf.total_bounds
@@ -100,6 +262,9 @@ def calculate_geojson_bounds(geojson_data):
 # Fonction pour charger un fichier TIFF
 def load_tiff(tiff_path):
     """Charge un fichier TIFF et retourne les données et les bornes."""
+    import rasterio
+    from rasterio.warp import calculate_default_transform
+
     try:
         with rasterio.open(tiff_path) as src:
             data = src.read(1)
@@ -113,99 +278,90 @@ def load_tiff(tiff_path):
         st.error(f"Erreur lors du chargement du fichier TIFF : {e}")
         return None, None, None
 
-# Fonction de validation de projection et d'emprise
-def validate_projection_and_extent(raster_path, polygons_gdf, target_crs):
-    """Vérifie la projection et l'emprise des polygones par rapport au raster."""
-    with rasterio.open(raster_path) as src:
-        if src.crs != target_crs:
-            raise ValueError(f"Le raster {raster_path} n'est pas dans la projection {target_crs}")
-        polygons_gdf = polygons_gdf.to_crs(src.crs)
-        raster_bounds = src.bounds
-        for idx, row in polygons_gdf.iterrows():
-            if not row.geometry.intersects(Polygon.from_bounds(*raster_bounds)):
-                st.warning(f"Le polygone {idx} est en dehors de l'emprise du raster")
-    return polygons_gdf
-
-# Fonction pour calculer le volume et la surface pour chaque polygone (MNS - MNT)
-def calculate_volume_and_area_for_each_polygon(mns_path, mnt_path, polygons_gdf):
-    """Calcule le volume pour chaque polygone avec découpage précis."""
+# Fonction pour afficher les résultats de calcul de volume polygone par polygone
+def report_site_volumes(results, show_reference=False):
+    """Affiche chaque résultat (ou son erreur) et retourne les listes des volumes et surfaces calculés."""
     volumes = []
     areas = []
-    with rasterio.open(mns_path) as src:
-        polygons_gdf = polygons_gdf.to_crs(src.crs)
-    
-    for idx, polygon in polygons_gdf.iterrows():
-        try:
-            with rasterio.open(mns_path) as src:
-                mns_clipped, mns_transform = mask(src, [polygon.geometry], crop=True, nodata=np.nan)
-                mns_data = mns_clipped[0]
-                cell_area = abs(mns_transform.a * mns_transform.e)
-            with rasterio.open(mnt_path) as src:
-                mnt_clipped, _ = mask(src, [polygon.geometry], crop=True, nodata=np.nan)
-                mnt_data = mnt_clipped[0]
-            valid_mask = (~np.isnan(mns_data)) & (~np.isnan(mnt_data))
-            diff = np.where(valid_mask, mns_data - mnt_data, 0)
-            volume = np.sum(diff) * cell_area
-            area = np.count_nonzero(valid_mask) * cell_area
-            volumes.append(volume)
-            areas.append(area)
-            polygon_name = polygon.get("properties", {}).get("name", f"Polygone {idx + 1}")
-            st.write(f"{polygon_name} - Volume: {volume:.2f} m³, Surface: {area:.2f} m²")
-        except Exception as e:
-            st.error(f"Erreur sur le polygone {idx + 1}: {str(e)}")
-    
+    for idx, row in results.iterrows():
+        if row["error"]:
+            st.error(f"Erreur sur le polygone {idx + 1}: {row['error']}")
+            continue
+        volumes.append(row["volume_m3"])
+        areas.append(row["area_m2"])
+        message = f"{row['name']} - Volume: {row['volume_m3']:.2f} m³, Surface: {row['area_m2']:.2f} m²"
+        if show_reference:
+            message += f", Cote de référence: {row['reference_m']:.2f} m"
+        st.write(message)
     return volumes, areas
 
-# Fonction pour extraire les points sur les bords d'une polygonale
-def extract_boundary_points(polygon):
-    """Extrait les points situés sur les bords d'une polygonale."""
-    boundary = polygon.boundary
-    if isinstance(boundary, ShapelyLineString):
-        return list(boundary.coords)
-    else:
-        return list(polygon.exterior.coords)
+# Fonction (tâche de fond) pour reprojeter les rasters et calculer les volumes d'un site
+def site_volumes_job(job, mns_path, mns_resampling, method, mnt_path, mnt_resampling, polygons_gdf, reference_altitude, workers):
+    """Retourne (résultats de ``compute_site_volumes``, MNT national utilisé) ; sans appel à Streamlit."""
+    from dem_catalog import national_dem_catalog
+    from raster_io import cached_reproject_tiff
+    from volume_batch import compute_site_volumes
+
+    job.report(0, 1, "Reprojection du MNS...")
+    mns_utm_path = cached_reproject_tiff(mns_path, "EPSG:32630", resampling=mns_resampling,
+                                         progress=lambda done, total: job.report(done, total, "Reprojection du MNS..."))
+    mnt_utm_path = None
+    used_national_dem = False
+    if method == "Méthode 1 : MNS - MNT":
+        job.report(0, 1, "Reprojection du MNT...")
+        if mnt_path is None:
+            # Mosaïque limitée aux dalles nationales qui recoupent les polygonales
+            mnt_path = national_dem_catalog().mosaic_path(polygons_gdf.total_bounds, "EPSG:4326")
+            used_national_dem = True
+        mnt_utm_path = cached_reproject_tiff(mnt_path, "EPSG:32630", resampling=mnt_resampling,
+                                             progress=lambda done, total: job.report(done, total, "Reprojection du MNT..."))
+
+    def progress(done, total):
+        job.report(done, total, f"Calcul des volumes : lot {done}/{total}")
+
+    job.report(0, 1, "Calcul des volumes...")
+    results = compute_site_volumes(mns_utm_path, polygons_gdf, mnt_path=mnt_utm_path, reference_altitude=reference_altitude,
+                                   workers=workers, progress=progress)
+    return results, used_national_dem
+
+# Fonction (tâche de fond) pour calculer les courbes de niveau d'une couche
+def contours_job(job, tiff_path, interval, resolution):
+    """Retourne (GeoJSON des courbes en UTM, ``VectorLayer`` des courbes en WGS84)."""
+    from contours import cached_contours
+    from vector_cache import ingest_vector
+
+    job.report(0, 1, "Calcul des courbes...")
+    contours_path = cached_contours(tiff_path, interval, resolution=resolution,
+                                    progress=lambda done, total: job.report(done, total, "Calcul des courbes..."))
+    job.report(0, 1, "Simplification pour l'affichage...")
+    return contours_path, ingest_vector(contours_path, progress=lambda done, total: job.report(done, total, "Simplification pour l'affichage..."))
+
+# Fonction (tâche de fond) pour dessiner la carte statique
+def static_map_job(job, uploaded_layers, user_layers, polygons, page, dpi):
+    """Retourne (PNG de la carte statique, avertissements) ; sans appel à Streamlit."""
+    from static_export import render_static_map
+
+    return render_static_map(uploaded_layers, user_layers, polygons, page=page, dpi=dpi, colors=geojson_colors,
+                             progress=lambda done, total: job.report(done, total, "Tracé des couches..."))
+
+# Fonction (tâche de fond) pour extraire automatiquement les entités d'un site
+def feature_extraction_job(job, ortho_path, mns_path, mnt_path, classes, resolution, min_area, pile_height, workers):
+    """Retourne ({couche: [entités GeoJSON]}, statistiques) de ``extract_features`` ; sans appel à Streamlit."""
+    from feature_extraction import extract_features
+
+    job.report(0, 1, "Extraction des entités...")
+    return extract_features(ortho_path, mns_path, mnt_path, classes=classes, resolution=resolution, min_area=min_area,
+                            pile_height=pile_height, workers=workers,
+                            progress=lambda done, total: job.report(done, total, f"Extraction : lot {done}/{total}"))
 
 # Fonction pour calculer la cote moyenne des élévations sur les bords de la polygonale
-def calculate_average_elevation_on_boundary(mns_path, polygon):
-    """Calcule la cote moyenne des élévations sur les bords de la polygonale."""
-    with rasterio.open(mns_path) as src:
-        boundary_points = extract_boundary_points(polygon)
-        boundary_coords = [src.index(x, y) for (x, y) in boundary_points]
-        elevations = [src.read(1)[int(row), int(col)] for (row, col) in boundary_coords]
-        average_elevation = np.mean(elevations)
-    return average_elevation
-
-# Fonction pour calculer le volume et la surface pour chaque polygone (MNS seul)
-def calculate_volume_and_area_with_mns_only(mns_path, polygons_gdf, use_average_elevation=True, reference_altitude=None):
-    """Calcule le volume et la surface pour chaque polygone en utilisant uniquement le MNS."""
-    volumes = []
-    areas = []
+def calculate_average_elevation_on_boundary(mns_path, polygon, interpolation="bilinear"):
+    """Calcule la cote moyenne des élévations sur les bords (densifiés) de la polygonale."""
+    import rasterio
+    from volume_engine import average_boundary_elevation
+
     with rasterio.open(mns_path) as src:
-        polygons_gdf = polygons_gdf.to_crs(src.crs)
-    
-    for idx, polygon in polygons_gdf.iterrows():
-        try:
-            with rasterio.open(mns_path) as src:
-                mns_clipped, mns_transform = mask(src, [polygon.geometry], crop=True, nodata=np.nan)
-                mns_data = mns_clipped[0]
-                cell_area = abs(mns_transform.a * mns_transform.e)
-            if use_average_elevation:
-                reference_altitude = calculate_average_elevation_on_boundary(mns_path, polygon.geometry)
-            elif reference_altitude is None:
-                st.error("Veuillez fournir une altitude de référence.")
-                return [], []
-            valid_mask = ~np.isnan(mns_data)
-            diff = np.where(valid_mask, mns_data - reference_altitude, 0)
-            volume = np.sum(diff) * cell_area
-            area = np.count_nonzero(valid_mask) * cell_area
-            volumes.append(volume)
-            areas.append(area)
-            polygon_name = polygon.get("properties", {}).get("name", f"Polygone {idx + 1}")
-            st.write(f"{polygon_name} - Volume: {volume:.2f} m³, Surface: {area:.2f} m², Cote de référence: {reference_altitude:.2f} m")
-        except Exception as e:
-            st.error(f"Erreur sur le polygone {idx + 1}: {str(e)}")
-    
-    return volumes, areas
+        return average_boundary_elevation(src, polygon, interpolation=interpolation)
 
 # Fonction pour calculer le volume global
 def calculate_global_volume(volumes):
@@ -217,10 +373,16 @@ def calculate_global_area(areas):
 
 # Fonction pour rechercher des polygones dans les couches téléversées
 def find_polygons_in_layers(layers):
+    from vector_cache import VectorLayer
+
     polygons = []
-    for layer in layers:
+    for layer in list(layers):
         if layer["type"] == "GeoJSON":
-            geojson_data = layer["data"]
+            try:
+                geojson_data = VectorLayer(layer["vector"]).features()
+            except FileNotFoundError:
+                drop_missing_layer(layer)
+                continue
             for feature in geojson_data["features"]:
                 if feature["geometry"]["type"] == "Polygon":
                     polygons.append(feature)
@@ -237,6 +399,9 @@ def find_polygons_in_user_layers(layers):
 
 # Fonction pour convertir les polygones en GeoDataFrame
 def convert_polygons_to_gdf(polygons):
+    import geopandas as gpd
+    from shapely.geometry import shape
+
     geometries = [shape(polygon["geometry"]) for polygon in polygons]
     properties = [polygon.get("properties", {}) for polygon in polygons]
     gdf = gpd.GeoDataFrame(geometry=geometries, crs="EPSG:4326")
@@ -245,6 +410,9 @@ def convert_polygons_to_gdf(polygons):
 
 # Fonction pour convertir les entités dessinées en GeoDataFrame
 def convert_drawn_features_to_gdf(features):
+    import geopandas as gpd
+    from shapely.geometry import shape
+
     geometries = []
     properties = []
     for feature in features:
@@ -255,13 +423,54 @@ def convert_drawn_features_to_gdf(features):
     gdf["properties"] = properties
     return gdf
 
+# Fonction pour retirer de la session une couche dont le fichier a disparu du cache
+def drop_missing_layer(layer):
+    if layer in st.session_state["uploaded_layers"]:
+        st.session_state["uploaded_layers"].remove(layer)
+    st.warning(f"Le fichier de la couche {layer['name']} n'est plus disponible : veuillez la téléverser à nouveau.")
+
+# Fonction pour lister les fichiers du cache d'une couche téléversée (le fichier principal en premier)
+def layer_files(layer):
+    if layer["type"] == "TIFF":
+        return [layer["path"]]
+    from vector_cache import VectorLayer
+
+    return VectorLayer(layer["vector"]).paths()
+
+# Fonction pour protéger de l'éviction du cache disque les fichiers des couches de la session
+def pin_session_layers():
+    """Épingle les fichiers des couches téléversées ; retire (avec un avertissement) celles qui ont disparu du cache."""
+    layers = st.session_state["uploaded_layers"]
+    if not layers and not st.session_state.get("pinned_layers"):
+        return
+    from raster_io import reprojection_cache
+
+    pinned = []
+    for layer in list(layers):
+        files = layer_files(layer)
+        if os.path.exists(files[0]):
+            pinned.extend(files)
+        else:
+            drop_missing_layer(layer)
+    reprojection_cache().pin(st.session_state["session_id"], pinned)
+    st.session_state["pinned_layers"] = bool(layers)
+
 # Initialisation des couches et des entités dans la session Streamlit
+# (couches utilisateur : {nom: FeatureLayer}, entités indexées par empreinte de géométrie)
 if "layers" not in st.session_state:
     st.session_state["layers"] = {}
 if "uploaded_layers" not in st.session_state:
     st.session_state["uploaded_layers"] = []
 if "new_features" not in st.session_state:
-    st.session_state["new_features"] = []
+    st.session_state["new_features"] = FeatureLayer()
+if "session_id" not in st.session_state:
+    st.session_state["session_id"] = os.urandom(8).hex()
+pin_session_layers()
+
+# Mesures de cette exécution du script (aucune si l'instrumentation est désactivée) ; la trace de
+# l'exécution précédente, arrêtée par st.rerun ou st.stop avant la fin du script, est terminée ici
+instrumentation.finish_interrupted_trace(st.session_state.get("rerun_trace"))
+rerun_trace = st.session_state["rerun_trace"] = instrumentation.start_trace("exécution", session=st.session_state["session_id"])
 
 st.title("Carte Topographique et Analyse Spatiale")
 
@@ -276,7 +485,7 @@ with st.sidebar:
     new_layer_name = st.text_input("Nom de la nouvelle couche à ajouter", "")
     if st.button("Ajouter la couche", key="add_layer_button", help="Ajouter une nouvelle couche", type="primary") and new_layer_name:
         if new_layer_name not in st.session_state["layers"]:
-            st.session_state["layers"][new_layer_name] = []
+            st.session_state["layers"][new_layer_name] = FeatureLayer()
             st.success(f"La couche '{new_layer_name}' a été ajoutée.")
         else:
             st.warning(f"La couche '{new_layer_name}' existe déjà.")
@@ -293,29 +502,28 @@ with st.sidebar:
             st.write(f"- Entité {idx + 1}: {feature['geometry']['type']}")
 
     if st.button("Enregistrer les entités", key="save_features_button", type="primary") and st.session_state["layers"]:
-        current_layer = st.session_state["layers"][layer_name]
-        for feature in st.session_state["new_features"]:
-            if feature not in current_layer:
-                current_layer.append(feature)
-        st.session_state["new_features"] = []
+        st.session_state["layers"][layer_name].extend(st.session_state["new_features"])
+        st.session_state["new_features"] = FeatureLayer()
         st.success(f"Toutes les nouvelles entités ont été enregistrées dans la couche '{layer_name}'.")
 
     st.markdown("#### Gestion des entités dans les couches")
     if st.session_state["layers"]:
         selected_layer = st.selectbox("Choisissez une couche pour voir ses entités", list(st.session_state["layers"].keys()))
-        if st.session_state["layers"][selected_layer]:
-            entity_idx = st.selectbox("Sélectionnez une entité à gérer", range(len(st.session_state["layers"][selected_layer])),
-                                        format_func=lambda idx: f"Entité {idx + 1}: {st.session_state['layers'][selected_layer][idx]['geometry']['type']}")
-            selected_entity = st.session_state["layers"][selected_layer][entity_idx]
+        selected_features = st.session_state["layers"][selected_layer]
+        if selected_features:
+            entity_idx = st.selectbox("Sélectionnez une entité à gérer", range(len(selected_features)),
+                                        format_func=lambda idx: f"Entité {idx + 1}: {selected_features[idx]['geometry']['type']}")
+            selected_entity = selected_features[entity_idx]
             current_name = selected_entity.get("properties", {}).get("name", "")
             new_name = st.text_input("Nom de l'entité", current_name)
             if st.button("Modifier le nom", key=f"edit_{entity_idx}", type="primary"):
                 if "properties" not in selected_entity:
                     selected_entity["properties"] = {}
                 selected_entity["properties"]["name"] = new_name
+                selected_features.touch()
                 st.success(f"Le nom de l'entité a été mis à jour en '{new_name}'.")
             if st.button("Supprimer l'entité sélectionnée", key=f"delete_{entity_idx}", type="secondary"):
-                st.session_state["layers"][selected_layer].pop(entity_idx)
+                selected_features.pop(entity_idx)
                 st.success(f"L'entité sélectionnée a été supprimée de la couche '{selected_layer}'.")
         else:
             st.write("Aucune entité dans cette couche pour le moment.")
@@ -326,26 +534,40 @@ with st.sidebar:
     st.markdown("### 2- Téléverser des fichiers")
     tiff_type = st.selectbox("Sélectionnez le type de fichier TIFF", options=["MNT", "MNS", "Orthophoto"], index=None, placeholder="Veuillez sélectionner", key="tiff_selectbox")
     if tiff_type:
+        import rasterio
+        from raster_io import RESAMPLING_METHODS, DEFAULT_RESAMPLING, cached_reproject_tiff, cached_cog, ingest_upload
+
+        resampling_names = list(RESAMPLING_METHODS)
+        default_resampling = list(RESAMPLING_METHODS.values()).index(DEFAULT_RESAMPLING[tiff_type])
+        resampling_name = st.selectbox("Méthode de rééchantillonnage", options=resampling_names, index=default_resampling, key="resampling_selectbox")
+        resampling = RESAMPLING_METHODS[resampling_name]
         uploaded_tiff = st.file_uploader(f"Téléverser un fichier TIFF ({tiff_type})", type=["tif", "tiff"], key="tiff_uploader")
         if uploaded_tiff:
-            unique_id = str(uuid.uuid4())[:8]
-            tiff_path = f"uploaded_{unique_id}.tiff"
-            with open(tiff_path, "wb") as f:
-                f.write(uploaded_tiff.read())
-            st.write(f"Reprojection du fichier TIFF ({tiff_type})...")
+            # Copie par blocs dans le cache (une fois par fichier téléversé), empreinte calculée pendant la copie
+            ingested_uploads = st.session_state.setdefault("ingested_uploads", {})
+            ingested = ingested_uploads.get(uploaded_tiff.file_id)
             try:
-                reprojected_tiff = reproject_tiff(tiff_path, "EPSG:4326")
-                with rasterio.open(reprojected_tiff) as src:
-                    bounds = src.bounds
-                    if not any(layer["name"] == tiff_type and layer["type"] == "TIFF" for layer in st.session_state["uploaded_layers"]):
-                        st.session_state["uploaded_layers"].append({"type": "TIFF", "name": tiff_type, "path": reprojected_tiff, "bounds": bounds})
-                        st.success(f"Couche {tiff_type} ajoutée à la liste des couches.")
-                    else:
-                        st.warning(f"La couche {tiff_type} existe déjà.")
+                if ingested is None or not os.path.exists(ingested[0]):
+                    ingested = ingested_uploads[uploaded_tiff.file_id] = ingest_upload(uploaded_tiff)
+                source_path, digest, _ = ingested
+                existing = next((layer for layer in st.session_state["uploaded_layers"] if layer["name"] == tiff_type and layer["type"] == "TIFF"), None)
+                if existing is None:
+                    st.write(f"Reprojection du fichier TIFF ({tiff_type})...")
+                    reprojected_tiff = cached_reproject_tiff(source_path, "EPSG:4326", resampling=resampling)
+                    reprojected_tiff = cached_cog(reprojected_tiff)
+                    with rasterio.open(reprojected_tiff) as src:
+                        bounds = src.bounds
+                    st.session_state["uploaded_layers"].append({"type": "TIFF", "name": tiff_type, "path": reprojected_tiff, "bounds": bounds, "resampling": resampling, "digest": digest})
+                    pin_session_layers()
+                    st.success(f"Couche {tiff_type} ajoutée à la liste des couches.")
+                elif existing.get("digest") == digest:
+                    st.info(f"Ce fichier est déjà chargé comme couche {tiff_type}.")
+                else:
+                    st.warning(f"La couche {tiff_type} existe déjà.")
+            except ValueError as e:
+                st.error(f"Fichier TIFF invalide : {e}")
             except Exception as e:
                 st.error(f"Erreur lors de la reprojection : {e}")
-            finally:
-                os.remove(tiff_path)
 
     geojson_type = st.selectbox("Sélectionnez le type de fichier GeoJSON",
                                 options=["Polygonale", "Routes", "Cours d'eau", "Bâtiments", "Pistes", "Plantations",
@@ -354,10 +576,14 @@ with st.sidebar:
     if geojson_type:
         uploaded_geojson = st.file_uploader(f"Téléverser un fichier GeoJSON ({geojson_type})", type=["geojson"], key="geojson_uploader")
         if uploaded_geojson:
+            from vector_cache import ingest_geojson_bytes
+
             try:
-                geojson_data = json.load(uploaded_geojson)
                 if not any(layer["name"] == geojson_type and layer["type"] == "GeoJSON" for layer in st.session_state["uploaded_layers"]):
-                    st.session_state["uploaded_layers"].append({"type": "GeoJSON", "name": geojson_type, "data": geojson_data})
+                    # Conversion unique en FlatGeobuf (complet et simplifié par zoom) ; seule la clé est gardée en session
+                    vector = ingest_geojson_bytes(uploaded_geojson.getvalue())
+                    st.session_state["uploaded_layers"].append({"type": "GeoJSON", "name": geojson_type, "vector": vector.key})
+                    pin_session_layers()
                     st.success(f"Couche {geojson_type} ajoutée à la liste des couches.")
                 else:
                     st.warning(f"La couche {geojson_type} existe déjà.")
@@ -377,68 +603,74 @@ with st.sidebar:
     else:
         st.write("Aucune couche téléversée pour le moment.")
 
-# Carte de base
-m = folium.Map(location=[7.5399, -5.5471], zoom_start=6)
-folium.TileLayer(
-    tiles="https://server.arcgisonline.com/ArcGIS/rest/services/World_Imagery/MapServer/tile/{z}/{y}/{x}",
-    attr="Esri",
-    name="Satellite",
-).add_to(m)
-folium.TileLayer(
-    tiles="https://{s}.tile.opentopomap.org/{z}/{x}/{y}.png",
-    attr="OpenTopoMap",
-    name="Topographique",
-).add_to(m)
-
-for layer, features in st.session_state["layers"].items():
-    layer_group = folium.FeatureGroup(name=layer, show=True)
-    for feature in features:
-        feature_type = feature["geometry"]["type"]
-        coordinates = feature["geometry"]["coordinates"]
-        popup = feature.get("properties", {}).get("name", f"{layer} - Entité")
-        if feature_type == "Point":
-            lat, lon = coordinates[1], coordinates[0]
-            folium.Marker(location=[lat, lon], popup=popup).add_to(layer_group)
-        elif feature_type == "LineString":
-            folium.PolyLine(locations=[(lat, lon) for lon, lat in coordinates], color="blue", popup=popup).add_to(layer_group)
-        elif feature_type == "Polygon":
-            folium.Polygon(locations=[(lat, lon) for lon, lat in coordinates[0]], color="green", fill=True, popup=popup).add_to(layer_group)
-    layer_group.add_to(m)
+    st.markdown("### 3- Réseau et défauts routiers")
+    show_route_network = st.checkbox("Afficher le réseau routier (routeQSD)", key="show_route_network")
+    show_defects = st.checkbox("Afficher la densité des défauts", key="show_defect_density")
+    defect_categories, defect_months = None, None
+    if show_defects:
+        pyramid = density_pyramid()
+        pyramid.refresh()
+        defect_categories = st.multiselect("Catégories", pyramid.categories(), key="defect_categories") or None
+        months = pyramid.months()
+        if len(months) > 1:
+            defect_months = st.select_slider("Période", options=months, value=(months[0], months[-1]), key="defect_months")
+
+# Carte de base : copie du modèle partagé (la construction des fonds et de l'outil de dessin est coûteuse)
+m = copy.deepcopy(base_map())
+
+for group in user_layer_groups(st.session_state["layers"]):
+    group.add_to(m)
 
 for layer in st.session_state["uploaded_layers"]:
     if layer["type"] == "TIFF":
-        if layer["name"] in ["MNT", "MNS"]:
-            unique_id = str(uuid.uuid4())[:8]
-            temp_png_path = f"{layer['name'].lower()}_colored_{unique_id}.png"
-            apply_color_gradient(layer["path"], temp_png_path)
-            add_image_overlay(m, temp_png_path, layer["bounds"], layer["name"])
-            os.remove(temp_png_path)
+        from raster_io import reprojection_cache
+
+        colormap = "terrain" if layer["name"] in ["MNT", "MNS"] else None
+        in_cache = os.path.dirname(os.path.abspath(layer["path"])) == os.path.abspath(reprojection_cache().directory)
+        if in_cache and tiles_reachable():
+            add_tile_layer(m, layer["path"], layer["bounds"], layer["name"], colormap=colormap)
         else:
-            add_image_overlay(m, layer["path"], layer["bounds"], layer["name"])
+            add_image_overlay(m, layer["path"], layer["bounds"], layer["name"], colormap=colormap)
         bounds = [[layer["bounds"].bottom, layer["bounds"].left], [layer["bounds"].top, layer["bounds"].right]]
         m.fit_bounds(bounds)
-    elif layer["type"] == "GeoJSON":
-        color = geojson_colors.get(layer["name"], "blue")
-        folium.GeoJson(
-            layer["data"],
-            name=layer["name"],
-            style_function=lambda x, color=color: {"color": color, "weight": 4, "opacity": 0.7}
-        ).add_to(m)
-
-draw = Draw(
-    draw_options={"polyline": True, "polygon": True, "circle": False, "rectangle": True, "marker": True, "circlemarker": False},
-    edit_options={"edit": True, "remove": True},
-)
-draw.add_to(m)
-LayerControl(position="topleft", collapsed=True).add_to(m)
 
-# Affichage interactif de la carte
-output = st_folium(m, width=800, height=600, returned_objects=["last_active_drawing", "all_drawings", "bounds"])
+found_point = st.session_state.get("found_point")
+if found_point:
+    folium.Marker(location=[found_point["lat"], found_point["lon"]], popup=found_point["label"],
+                  icon=folium.Icon(color="red", icon="map-marker")).add_to(m)
+
+# Couches dépendant de la vue (emprise et zoom renvoyés par la carte au passage précédent) :
+# ajoutées dynamiquement pour ne pas recharger la carte à chaque déplacement
+map_state = st.session_state.get("carte") or {}
+map_bounds = map_state.get("bounds") or {}
+if None in (map_bounds.get("_southWest", {}).get("lat"), map_bounds.get("_northEast", {}).get("lat")):
+    map_bounds = {"_southWest": {"lat": 4.3, "lng": -8.6}, "_northEast": {"lat": 10.7, "lng": -2.5}}
+map_zoom = map_state.get("zoom") or 6
+view_groups = []
+if show_route_network:
+    from point_finder import ROUTE_NETWORK_PATH
+    from vector_cache import ingest_vector
+
+    view_groups.append(vector_layer_group(ingest_vector(ROUTE_NETWORK_PATH).key, "Réseau routier", map_bounds, map_zoom, color="orange", tooltip_field="ID"))
+for layer in list(st.session_state["uploaded_layers"]):
+    if layer["type"] == "GeoJSON":
+        try:
+            view_groups.append(vector_layer_group(layer["vector"], layer["name"], map_bounds, map_zoom,
+                                                  color=geojson_colors.get(layer["name"], "blue")))
+        except FileNotFoundError:
+            drop_missing_layer(layer)
+if show_defects:
+    view_groups.append(defect_density_group(map_bounds, defect_categories, defect_months))
+
+# Affichage interactif de la carte (rendu HTML et aller-retour avec le composant)
+with instrumentation.span("st_folium"):
+    output = st_folium(m, key="carte", width=800, height=600, feature_group_to_add=view_groups or None,
+                       layer_control=LayerControl(position="topleft", collapsed=True),
+                       returned_objects=["last_active_drawing", "all_drawings", "bounds", "zoom", "last_clicked"])
 
 if output and "last_active_drawing" in output and output["last_active_drawing"]:
     new_feature = output["last_active_drawing"]
-    if new_feature not in st.session_state["new_features"]:
-        st.session_state["new_features"].append(new_feature)
+    if st.session_state["new_features"].add(new_feature):
         st.info("Nouvelle entité ajoutée temporairement. Cliquez sur 'Enregistrer les entités' pour les ajouter à la couche.")
 
 if 'active_button' not in st.session_state:
@@ -454,46 +686,131 @@ def display_parameters(button_name):
             st.error("La couche MNS est manquante. Veuillez téléverser un fichier MNS.")
             return
         if method == "Méthode 1 : MNS - MNT" and not mnt_layer:
-            st.error("La couche MNT est manquante. Veuillez téléverser un fichier MNT.")
-            return
-        try:
-            mns_utm_path = reproject_tiff(mns_layer["path"], "EPSG:32630")
-            if method == "Méthode 1 : MNS - MNT":
-                mnt_utm_path = reproject_tiff(mnt_layer["path"], "EPSG:32630")
-        except Exception as e:
-            st.error(f"Échec de la reprojection : {e}")
-            return
+            use_national_dem = st.checkbox("Utiliser le MNT national (dalles de raster_files) à défaut de MNT téléversé", value=True, key="use_national_dem")
+            if not use_national_dem:
+                st.error("La couche MNT est manquante. Veuillez téléverser un fichier MNT.")
+                return
         polygons_uploaded = find_polygons_in_layers(st.session_state["uploaded_layers"])
         polygons_user_layers = find_polygons_in_user_layers(st.session_state["layers"])
-        polygons_drawn = st.session_state["new_features"]
+        polygons_drawn = list(st.session_state["new_features"])
         all_polygons = polygons_uploaded + polygons_user_layers + polygons_drawn
         if not all_polygons:
             st.error("Aucune polygonale disponible.")
             return
         polygons_gdf = convert_polygons_to_gdf(all_polygons)
-        try:
-            polygons_gdf_utm = validate_projection_and_extent(mns_utm_path, polygons_gdf, "EPSG:32630")
-            if method == "Méthode 1 : MNS - MNT":
-                volumes, areas = calculate_volume_and_area_for_each_polygon(mns_utm_path, mnt_utm_path, polygons_gdf_utm)
-            else:
-                use_average_elevation = st.checkbox("Utiliser la cote moyenne des élévations sur les bords de la polygonale comme référence", value=True, key="use_average_elevation")
-                reference_altitude = None
-                if not use_average_elevation:
-                    reference_altitude = st.number_input("Entrez l'altitude de référence (en mètres) :", value=0.0, step=0.1, key="reference_altitude")
-                volumes, areas = calculate_volume_and_area_with_mns_only(mns_utm_path, polygons_gdf_utm, use_average_elevation=use_average_elevation, reference_altitude=reference_altitude)
-            global_volume = calculate_global_volume(volumes)
-            global_area = calculate_global_area(areas)
-            st.write(f"Volume global : {global_volume:.2f} m³")
-            st.write(f"Surface globale : {global_area:.2f} m²")
-            os.remove(mns_utm_path)
-            if method == "Méthode 1 : MNS - MNT":
-                os.remove(mnt_utm_path)
-        except Exception as e:
-            st.error(f"Erreur lors du calcul : {e}")
-            if os.path.exists(mns_utm_path):
-                os.remove(mns_utm_path)
-            if method == "Méthode 1 : MNS - MNT" and os.path.exists(mnt_utm_path):
-                os.remove(mnt_utm_path)
+        cpu_count = os.cpu_count() or 1
+        workers = st.number_input("Nombre de processus de calcul", min_value=1, max_value=cpu_count, value=min(4, cpu_count), step=1, key="volume_workers")
+        reference_altitude = None
+        if method == "Méthode 2 : MNS seul":
+            use_average_elevation = st.checkbox("Utiliser la cote moyenne des élévations sur les bords de la polygonale comme référence", value=True, key="use_average_elevation")
+            if not use_average_elevation:
+                reference_altitude = st.number_input("Entrez l'altitude de référence (en mètres) :", value=0.0, step=0.1, key="reference_altitude")
+        mnt_path = mnt_layer["path"] if method == "Méthode 1 : MNS - MNT" and mnt_layer else None
+        from raster_io import DEFAULT_RESAMPLING
+
+        mns_resampling = mns_layer.get("resampling", DEFAULT_RESAMPLING["MNS"])
+        mnt_resampling = mnt_layer.get("resampling", DEFAULT_RESAMPLING["MNT"]) if mnt_path else DEFAULT_RESAMPLING["MNT"]
+        # Le nombre de processus ne change pas le résultat : il n'entre pas dans la clé
+        job_key = RasterCache.make_key(
+            "volumes", file_digest(mns_layer["path"]), mns_resampling, method,
+            file_digest(mnt_path) if mnt_path else None, mnt_resampling, reference_altitude, polygons_digest(all_polygons),
+        )
+        jobs = get_job_queue()
+        job = jobs.get(job_key)
+        if job is None or job.status in (FAILED, CANCELLED):
+            if job is not None:
+                show_job_outcome(job)
+            if not st.button("Lancer le calcul", key="run_volumes", type="primary"):
+                return
+            job = jobs.submit(
+                job_key, site_volumes_job, mns_layer["path"], mns_resampling, method, mnt_path, mnt_resampling,
+                polygons_gdf, reference_altitude, workers, label="Calcul des volumes", session=st.session_state["session_id"],
+            )
+        if not job.done:
+            job_progress(job_key)
+            return
+        if job.status != DONE:
+            show_job_outcome(job)
+            return
+        results, used_national_dem = job.result
+        if used_national_dem:
+            st.info("MNT national utilisé pour la méthode 1.")
+        volumes, areas = report_site_volumes(results, show_reference=method == "Méthode 2 : MNS seul")
+        st.write(f"Volume global : {calculate_global_volume(volumes):.2f} m³")
+        st.write(f"Surface globale : {calculate_global_area(areas):.2f} m²")
+        st.caption(f"Calculé en {job.elapsed():.1f} s")
+    elif button_name == "Carte de contours":
+        st.markdown("### Génération des courbes de niveau")
+        dem_layers = [layer for layer in st.session_state["uploaded_layers"] if layer["type"] == "TIFF" and layer["name"] in ["MNT", "MNS"]]
+        if not dem_layers:
+            st.error("Aucune couche MNT ou MNS disponible. Veuillez téléverser un fichier MNT ou MNS.")
+            return
+        dem_name = st.selectbox("Couche source", [layer["name"] for layer in dem_layers], key="contour_layer")
+        dem_layer = next(layer for layer in dem_layers if layer["name"] == dem_name)
+        interval = st.number_input("Équidistance des courbes (m)", min_value=0.1, value=1.0, step=0.5, key="contour_interval")
+        resolution = st.number_input("Résolution de calcul (m, 0 = résolution native)", min_value=0.0, value=0.0, step=0.5, key="contour_resolution")
+        job_key = RasterCache.make_key("contours", file_digest(dem_layer["path"]), interval, resolution)
+        jobs = get_job_queue()
+        job = jobs.get(job_key)
+        if job is None or job.status in (FAILED, CANCELLED):
+            if job is not None:
+                show_job_outcome(job)
+            if not st.button("Générer les courbes", key="generate_contours", type="primary"):
+                return
+            job = jobs.submit(job_key, contours_job, dem_layer["path"], interval, resolution or None, label="Calcul des courbes de niveau",
+                              session=st.session_state["session_id"])
+        if not job.done:
+            job_progress(job_key)
+            return
+        if job.status != DONE:
+            show_job_outcome(job)
+            return
+        from contours import contours_to_dxf
+
+        contours_path, contours_vector = job.result
+        contours_geojson = contours_vector.features()
+        st.success(f"{len(contours_geojson['features'])} courbes de niveau générées (équidistance {interval:g} m).")
+        contour_layer_name = f"Courbes {dem_name} ({interval:g} m)"
+        if not any(layer["name"] == contour_layer_name for layer in st.session_state["uploaded_layers"]):
+            st.session_state["uploaded_layers"].append({"type": "GeoJSON", "name": contour_layer_name, "vector": contours_vector.key})
+            pin_session_layers()
+        st.download_button("Télécharger en GeoJSON", data=json.dumps(contours_geojson), file_name="courbes_de_niveau.geojson", mime="application/geo+json")
+        st.download_button("Télécharger en DXF", data=contours_to_dxf(contours_path, interval), file_name="courbes_de_niveau.dxf", mime="application/dxf")
+    elif button_name == "Trouver un point":
+        st.markdown("### Recherche de points sur le réseau routier")
+        from point_finder import ROUTE_NETWORK_PATH, format_pk
+
+        # Seules les couches téléversées par l'utilisateur sont indexées (pas les courbes de niveau)
+        line_layers = [layer for layer in st.session_state["uploaded_layers"] if layer["type"] == "GeoJSON" and layer["name"] in geojson_colors]
+        layers_version = tuple((layer["name"], layer["vector"]) for layer in line_layers)
+        finder = get_point_finder(file_digest(ROUTE_NETWORK_PATH), layers_version, line_layers)
+        mode = st.radio("Type de recherche", ("Coordonnée → PK", "PK → coordonnée"), horizontal=True, key="point_mode")
+        if mode == "Coordonnée → PK":
+            clicked = (output or {}).get("last_clicked") or {}
+            lat = st.number_input("Latitude", value=float(clicked.get("lat", 5.35)), format="%.6f", key=f"point_lat_{clicked.get('lat')}")
+            lon = st.number_input("Longitude", value=float(clicked.get("lng", -4.0)), format="%.6f", key=f"point_lon_{clicked.get('lng')}")
+            st.caption("Cliquez sur la carte pour renseigner la coordonnée.")
+            result = finder.nearest(lon, lat)
+            if result is None:
+                st.error("Aucune route indexée.")
+                return
+            label = f"{result['route']} — {format_pk(result['pk'])}"
+            st.write(f"Route la plus proche : **{label}**")
+            st.write(f"Distance à la route : {result['distance']:.1f} m — point projeté : {result['lat']:.6f}, {result['lon']:.6f}")
+        else:
+            route = st.selectbox("Route", finder.routes, format_func=lambda name: f"{name} ({format_pk(finder.route_length(name))})", key="point_route")
+            pk = st.number_input("PK (m)", min_value=0.0, value=0.0, step=100.0, key="point_pk")
+            try:
+                lon, lat = finder.locate(route, pk)
+            except ValueError as e:
+                st.error(str(e))
+                return
+            label = f"{route} — {format_pk(pk)}"
+            st.write(f"Coordonnée : **{lat:.6f}, {lon:.6f}**")
+            result = {"lat": lat, "lon": lon}
+        if st.button("Afficher sur la carte", key="show_found_point"):
+            st.session_state["found_point"] = {"lat": result["lat"], "lon": result["lon"], "label": label}
+            st.rerun()
     elif button_name == "Télécharger la carte":
         st.sidebar.markdown("### Paramètres de la carte statique")
         display_options = {}
@@ -501,56 +818,92 @@ def display_parameters(button_name):
             display_options[layer_name] = st.sidebar.checkbox(f"Afficher la couche {layer_name}", value=True)
         for layer in st.session_state["uploaded_layers"]:
             display_options[layer["name"]] = st.sidebar.checkbox(f"Afficher la couche {layer['name']}", value=True)
+        from static_export import DEFAULT_DPI, DEFAULT_PAGE, PAGE_SIZES
+
+        page = st.sidebar.selectbox("Format de page", list(PAGE_SIZES), index=list(PAGE_SIZES).index(DEFAULT_PAGE), key="export_page")
+        dpi = st.sidebar.select_slider("Résolution (points par pouce)", options=[72, 100, 150, 200, 300], value=DEFAULT_DPI, key="export_dpi")
         st.markdown("### Génération de la carte statique")
-        fig, ax = plt.subplots(figsize=(10, 10))
-        for layer in st.session_state["uploaded_layers"]:
-            if display_options.get(layer["name"], False):
-                if layer["type"] == "TIFF":
-                    with rasterio.open(layer["path"]) as src:
-                        img = src.read(1)
-                        b = layer["bounds"]
-                        extent = [b.left, b.right, b.bottom, b.top]
-                        ax.imshow(img, extent=extent, cmap="terrain", origin="upper")
-                elif layer["type"] == "GeoJSON":
-                    try:
-                        gdf = gpd.GeoDataFrame.from_features(layer["data"]["features"])
-                        gdf.plot(ax=ax, edgecolor=geojson_colors.get(layer["name"], "blue"), facecolor="none", linewidth=2)
-                    except Exception as e:
-                        st.error(f"Erreur lors du tracé de la couche {layer['name']} : {e}")
-        for layer_name, features in st.session_state["layers"].items():
-            if display_options.get(layer_name, False):
-                for feature in features:
-                    geom = shape(feature["geometry"])
-                    if feature["geometry"]["type"] == "Point":
-                        ax.plot(geom.x, geom.y, 'o', color="red", markersize=5)
-                    elif feature["geometry"]["type"] == "LineString":
-                        xs, ys = geom.xy
-                        ax.plot(xs, ys, color="blue", linewidth=2)
-                    elif feature["geometry"]["type"] == "Polygon":
-                        xs, ys = geom.exterior.xy
-                        ax.plot(xs, ys, color="green", linewidth=2)
         # Calcul de l'emprise à partir de toutes les polygonales (téléversées ou dessinées)
         polygons_uploaded = find_polygons_in_layers(st.session_state["uploaded_layers"])
         polygons_user_layers = find_polygons_in_user_layers(st.session_state["layers"])
-        polygons_drawn = st.session_state["new_features"]
+        polygons_drawn = list(st.session_state["new_features"])
         all_polygons = polygons_uploaded + polygons_user_layers + polygons_drawn
-        if all_polygons:
-            polygons_gdf = convert_polygons_to_gdf(all_polygons)
-            minx, miny, maxx, maxy = polygons_gdf.total_bounds
-            utm_bounds = transform_bounds("EPSG:4326", "EPSG:32630", minx, miny, maxx, maxy)
-            ax.set_xlim(utm_bounds[0], utm_bounds[2])
-            ax.set_ylim(utm_bounds[1], utm_bounds[3])
-        else:
-            st.warning("Aucune polygonale trouvée pour recadrer la carte, affichage complet de la figure.")
-        ax.set_xlabel("UTM X")
-        ax.set_ylabel("UTM Y")
-        ax.set_title("Carte Statique")
-        ax.grid(True)
-        buf = BytesIO()
-        fig.savefig(buf, format="png", bbox_inches="tight")
-        buf.seek(0)
-        st.image(buf, caption="Aperçu de la carte statique")
-        st.download_button("Télécharger l'image", data=buf, file_name="carte_statique.png", mime="image/png")
+        uploaded_layers = [dict(layer) for layer in st.session_state["uploaded_layers"] if display_options.get(layer["name"], False)]
+        user_layers = {name: list(features) for name, features in st.session_state["layers"].items() if display_options.get(name, False)}
+        job_key = RasterCache.make_key(
+            "static_map", [(layer["name"], layer.get("vector") or file_digest(layer["path"])) for layer in uploaded_layers],
+            polygons_digest(user_layers), polygons_digest(all_polygons), page, dpi,
+        )
+        jobs = get_job_queue()
+        job = jobs.get(job_key)
+        if job is None or job.status in (FAILED, CANCELLED):
+            if job is not None:
+                show_job_outcome(job)
+            if not st.button("Générer la carte", key="generate_static_map", type="primary"):
+                return
+            job = jobs.submit(job_key, static_map_job, uploaded_layers, user_layers, all_polygons, page, dpi,
+                              label="Génération de la carte statique", session=st.session_state["session_id"])
+        if not job.done:
+            job_progress(job_key)
+            return
+        if job.status != DONE:
+            show_job_outcome(job)
+            return
+        png, warnings = job.result
+        for warning in warnings:
+            st.warning(warning)
+        st.image(png, caption="Aperçu de la carte statique")
+        st.download_button("Télécharger l'image", data=png, file_name="carte_statique.png", mime="image/png")
+    elif button_name == "Dessin automatique":
+        st.markdown("### Extraction automatique des entités")
+        from feature_extraction import BUILDINGS, DEFAULT_MIN_AREA, DEFAULT_PILE_HEIGHT, DEFAULT_RESOLUTION, ROAD_EDGES, STOCKPILES
+
+        layers_by_name = {layer["name"]: layer for layer in st.session_state["uploaded_layers"] if layer["type"] == "TIFF"}
+        ortho_layer, mns_layer, mnt_layer = (layers_by_name.get(name) for name in ("Orthophoto", "MNS", "MNT"))
+        available = ([BUILDINGS, ROAD_EDGES] if ortho_layer else []) + ([STOCKPILES] if mns_layer and mnt_layer else [])
+        if not available:
+            st.error("Téléversez une orthophoto (bâtiments, bords de route) ou un MNS et un MNT (tas).")
+            return
+        classes = st.multiselect("Entités à extraire", available, default=available, key="extraction_classes")
+        if not classes:
+            return
+        resolution = st.number_input("Résolution d'analyse (m)", min_value=0.05, value=DEFAULT_RESOLUTION, step=0.05, key="extraction_resolution")
+        min_area = st.number_input("Surface minimale d'une entité (m²)", min_value=1.0, value=DEFAULT_MIN_AREA, step=1.0, key="extraction_min_area")
+        pile_height = DEFAULT_PILE_HEIGHT
+        if STOCKPILES in classes:
+            pile_height = st.number_input("Hauteur minimale d'un tas (m, MNS - MNT)", min_value=0.1, value=DEFAULT_PILE_HEIGHT, step=0.1, key="extraction_pile_height")
+        cpu_count = os.cpu_count() or 1
+        workers = st.number_input("Nombre de processus de calcul", min_value=1, max_value=cpu_count, value=min(4, cpu_count), step=1, key="extraction_workers")
+        paths = [layer["path"] if layer else None for layer in (ortho_layer, mns_layer, mnt_layer)]
+        # Le nombre de processus ne change pas le résultat : il n'entre pas dans la clé
+        job_key = RasterCache.make_key("extraction", *(file_digest(path) if path else None for path in paths),
+                                       sorted(classes), resolution, min_area, pile_height)
+        jobs = get_job_queue()
+        job = jobs.get(job_key)
+        if job is None or job.status in (FAILED, CANCELLED):
+            if job is not None:
+                show_job_outcome(job)
+            if not st.button("Lancer l'extraction", key="run_extraction", type="primary"):
+                return
+            job = jobs.submit(job_key, feature_extraction_job, *paths, tuple(classes), resolution, min_area, pile_height, workers,
+                              label="Extraction automatique des entités", session=st.session_state["session_id"])
+        if not job.done:
+            job_progress(job_key)
+            return
+        if job.status != DONE:
+            show_job_outcome(job)
+            return
+        features, stats = job.result
+        # Les couches automatiques sont remplacées une seule fois par résultat (pas à chaque réexécution)
+        merged = st.session_state.setdefault("merged_extractions", set())
+        if job_key not in merged:
+            for name, layer_features in features.items():
+                st.session_state["layers"][name] = FeatureLayer(copy.deepcopy(layer_features))
+            merged.add(job_key)
+            st.rerun()
+        for name, layer_features in features.items():
+            st.write(f"{name} : {len(layer_features)} entités")
+        st.caption(f"{stats['tiles']} tuiles en {stats['seconds']:.1f} s ({stats['tiles_per_second']:.1f} tuiles/s)")
     else:
         st.write("Aucun paramètre spécifique pour ce bouton.")
 
@@ -576,3 +929,38 @@ parameters_placeholder = st.empty()
 if st.session_state['active_button']:
     with parameters_placeholder.container():
         display_parameters(st.session_state['active_button'])
+
+# Fonction pour afficher les intervalles et compteurs d'une trace
+def show_trace(trace):
+    st.dataframe([
+        {"étape": "· " * span["depth"] + span["name"], "début (ms)": span["start_ms"], "durée (ms)": span["duration_ms"],
+         "mémoire (Mo)": span["rss_mb"], "Δ mémoire (Mo)": span["rss_delta_mb"],
+         "détails": json.dumps(span.get("attributes") or {}, ensure_ascii=False, default=str)}
+        for span in sorted(trace.spans, key=lambda span: span["start_ms"])
+    ], hide_index=True)
+    if trace.counters:
+        st.dataframe([{"compteur": name, "valeur": value} for name, value in sorted(trace.counters.items())], hide_index=True)
+    st.download_button("Exporter (JSON lines)", trace.to_jsonl(), file_name=f"trace_{trace.id}.jsonl",
+                       mime="application/x-ndjson", on_click="ignore", key=f"export_trace_{trace.id}")
+
+# Panneau de débogage : mesures de l'exécution courante et des dernières tâches de fond
+with st.expander("Débogage : temps et mémoire par étape"):
+    # L'activation vaut pour toutes les sessions : seul un déploiement administré la propose
+    if instrumentation.ADMIN_TOGGLE:
+        measuring = st.toggle("Mesurer les étapes (toutes les sessions)", value=instrumentation.enabled())
+        if measuring != instrumentation.enabled():
+            instrumentation.enable(measuring)
+            st.rerun()
+    if rerun_trace is not None:
+        st.markdown("**Exécution courante**")
+        show_trace(rerun_trace)
+        job_traces = {trace.id: trace for trace in instrumentation.recent_traces(st.session_state["session_id"])
+                      if "job" in trace.attributes}
+        if job_traces:
+            trace_id = st.selectbox("Tâche de fond", list(job_traces), format_func=lambda trace_id: job_traces[trace_id].name,
+                                    key="debug_job_trace")
+            show_trace(job_traces[trace_id])
+    else:
+        st.caption("Instrumentation désactivée : aucune mesure (variable d'environnement APP_INSTRUMENTATION).")
+
+instrumentation.finish_trace(rerun_trace)
@@ -0,0 +1,90 @@
+"""Benchmark : démarrage à froid et réexécution de app.py (imports et rendu).
+
+Deux mesures, chacune dans un interpréteur neuf :
+
+- ``python -X importtime`` sur ``import app`` (script exécuté en mode « bare ») :
+  temps total et modules les plus coûteux, regroupés par paquet racine ;
+- ``streamlit.testing.v1.AppTest`` : première exécution du script (imports
+  compris), puis médiane de ``--reruns`` réexécutions.
+
+Usage : python benchmarks/bench_app_startup.py [--top 15] [--reruns 10]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+from collections import defaultdict
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+RERUN_SCRIPT = """
+import json, statistics, sys, time
+from streamlit.testing.v1 import AppTest
+at = AppTest.from_file("app.py", default_timeout=300)
+start = time.perf_counter()
+at.run()
+first = time.perf_counter() - start
+times = []
+for _ in range({reruns}):
+    start = time.perf_counter()
+    at.run()
+    times.append(time.perf_counter() - start)
+print(json.dumps({{"first": first, "rerun": statistics.median(times) if times else None,
+                  "exceptions": [e.value for e in at.exception], "modules": len(sys.modules)}}))
+"""
+
+
+# Fonction pour mesurer les imports d'une instruction dans un interpréteur neuf
+def import_times(code):
+    """Retourne (durée totale en s, [(self µs, cumulé µs, profondeur, module)]) de ``python -X importtime -c code``."""
+    start = time.perf_counter()
+    completed = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=ROOT_DIR,
+                               capture_output=True, text=True)
+    elapsed = time.perf_counter() - start
+    entries = []
+    for line in completed.stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        entries.append((int(self_us), int(cumulative_us), depth, name.strip()))
+    return elapsed, entries
+
+
+# Fonction pour mesurer l'exécution puis les réexécutions du script Streamlit
+def rerun_times(reruns):
+    """Retourne le dictionnaire (first, rerun, exceptions, modules) mesuré par AppTest dans un interpréteur neuf."""
+    completed = subprocess.run([sys.executable, "-c", RERUN_SCRIPT.format(reruns=reruns)], cwd=ROOT_DIR,
+                               capture_output=True, text=True)
+    if completed.returncode != 0:
+        raise RuntimeError(completed.stderr.strip().splitlines()[-1])
+    return json.loads(completed.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--top", type=int, default=15, help="nombre de paquets les plus coûteux affichés")
+    parser.add_argument("--reruns", type=int, default=10)
+    args = parser.parse_args()
+
+    elapsed, entries = import_times("import app")
+    by_package = defaultdict(int)
+    for self_us, _, _, name in entries:
+        by_package[name.split(".")[0]] += self_us
+    total_us = sum(by_package.values())
+    print(f"import app (bare) : {elapsed:.2f} s au total, {total_us / 1e6:.2f} s d'imports, {len(entries)} modules")
+    print(f"{'paquet':>20} {'imports (ms)':>13} {'part':>6}")
+    for package, self_us in sorted(by_package.items(), key=lambda item: -item[1])[:args.top]:
+        print(f"{package:>20} {self_us / 1000:>13.0f} {self_us / total_us:>6.0%}")
+
+    result = rerun_times(args.reruns)
+    print(f"\nAppTest : première exécution {result['first']:.2f} s, réexécution (médiane) "
+          f"{result['rerun'] * 1000:.0f} ms, {result['modules']} modules chargés")
+    for exception in result["exceptions"]:
+        print(f"exception : {exception}")
+
+
+if __name__ == "__main__":
+    main()
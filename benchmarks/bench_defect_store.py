@@ -0,0 +1,80 @@
+"""Benchmark : ingestion et requêtes par emprise de ``defect_store`` (R*Tree) vs parcours complet.
+
+Mesure l'ingestion en masse (``executemany`` par lots) face à l'insertion ligne
+à ligne avec une transaction par défaut, puis le temps moyen d'une requête par
+emprise via l'index R*Tree face au parcours complet de la table.
+
+Usage : python benchmarks/bench_defect_store.py --rows 1000000
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.synthetic import DEFECT_BOUNDS, make_defects  # noqa: E402
+from defect_store import DEFAUTS_SCHEMA, DefectStore  # noqa: E402
+
+
+# Fonction pour tirer des emprises de requête de taille donnée
+def random_bboxes(count, size, seed=1):
+    """Retourne ``count`` emprises carrées de ``size`` degrés dans l'emprise des défauts."""
+    rng = np.random.default_rng(seed)
+    left, bottom, right, top = DEFECT_BOUNDS
+    xs = rng.uniform(left, right - size, count)
+    ys = rng.uniform(bottom, top - size, count)
+    return [(x, y, x + size, y + size) for x, y in zip(xs, ys)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--row-by-row", type=int, default=20_000, help="lignes pour la mesure ligne à ligne")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--bbox-sizes", type=float, nargs="+", default=[0.01, 0.05, 0.2])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # Insertion ligne à ligne (une transaction par défaut), sur un échantillon
+        naive = sqlite3.connect(os.path.join(tmp, "naive.db"))
+        naive.execute(DEFAUTS_SCHEMA)
+        sample = list(make_defects(args.row_by_row, seed=2))
+        start = time.perf_counter()
+        for row in sample:
+            naive.execute("INSERT INTO Defauts (route, categorie, gravite, latitude, longitude, date, heure, ville) "
+                          "VALUES (?, ?, ?, ?, ?, ?, ?, ?)", row)
+            naive.commit()
+        naive_rate = args.row_by_row / (time.perf_counter() - start)
+        naive.close()
+        print(f"insertion ligne à ligne : {naive_rate:>10.0f} lignes/s ({args.row_by_row} lignes)")
+
+        store = DefectStore(os.path.join(tmp, "defauts.db"))
+        rows = list(make_defects(args.rows))
+        start = time.perf_counter()
+        store.ingest(rows)
+        elapsed = time.perf_counter() - start
+        print(f"ingestion par lots      : {args.rows / elapsed:>10.0f} lignes/s ({args.rows} lignes, {elapsed:.1f} s)")
+
+        print(f"{'emprise (°)':>11} {'résultats':>10} {'R*Tree (ms)':>12} {'parcours (ms)':>14} {'gain':>7}")
+        for size in args.bbox_sizes:
+            bboxes = random_bboxes(args.queries, size)
+            start = time.perf_counter()
+            found = [len(store.in_bbox(*bbox)) for bbox in bboxes]
+            indexed = (time.perf_counter() - start) / len(bboxes)
+            scan_bboxes = bboxes[:max(1, len(bboxes) // 20)]
+            start = time.perf_counter()
+            scanned = [len(store.query("SELECT * FROM Defauts WHERE longitude BETWEEN ? AND ? AND latitude BETWEEN ? AND ?",
+                                       (x0, x1, y0, y1))) for x0, y0, x1, y1 in scan_bboxes]
+            scan = (time.perf_counter() - start) / len(scan_bboxes)
+            assert scanned == found[:len(scan_bboxes)], "résultats différents entre R*Tree et parcours complet"
+            print(f"{size:>11g} {np.mean(found):>10.0f} {indexed * 1000:>12.2f} {scan * 1000:>14.2f} {scan / indexed:>6.0f}x")
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""Benchmark : extraction automatique des entités d'un site synthétique par tuiles.
+
+Génère un site (orthophoto, MNS, MNT) avec bâtiments, routes et tas connus,
+puis mesure ``feature_extraction.extract_features`` pour plusieurs nombres de
+processus : durée, débit (tuiles par seconde), mémoire résidente maximale
+(processus principal et processus de calcul) et nombre d'entités trouvées.
+Chaque mesure tourne dans un processus neuf.
+
+Usage : python benchmarks/bench_feature_extraction.py --size 4096 --workers 1 4
+"""
+import argparse
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.synthetic import generate_isolated, make_site_scene  # noqa: E402
+
+
+def measure(paths, resolution, workers, tile_size, queue):
+    from feature_extraction import extract_features
+
+    features, stats = extract_features(*paths, resolution=resolution, workers=workers, tile_size=tile_size)
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss, resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    queue.put((stats, {name: len(layer_features) for name, layer_features in features.items()}, peak / 1024))
+
+
+# Fonction pour mesurer une extraction dans un processus neuf
+def run_isolated(paths, resolution, workers, tile_size):
+    """Retourne (statistiques, nombres d'entités par couche, mémoire résidente maximale en Mo)."""
+    context = multiprocessing.get_context("spawn")
+    queue = context.Queue()
+    process = context.Process(target=measure, args=(paths, resolution, workers, tile_size, queue))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", type=int, default=4096, help="côté du site synthétique (pixels)")
+    parser.add_argument("--resolution", type=float, default=0.25, help="résolution du site et de l'analyse (m)")
+    parser.add_argument("--tile-size", type=int, default=1024)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        ortho_path, mns_path, mnt_path, truth = generate_isolated(make_site_scene, directory, args.size, args.resolution)
+        print(f"site {args.size} px à {args.resolution} m : {truth['buildings']} bâtiments, "
+              f"{truth['roads']} routes, {truth['piles']} tas")
+        print(f"{'processus':>9} {'tuiles':>7} {'durée (s)':>10} {'tuiles/s':>9} {'mémoire max (Mo)':>17}  entités")
+        for workers in args.workers:
+            stats, counts, peak = run_isolated((ortho_path, mns_path, mnt_path), args.resolution, workers, args.tile_size)
+            found = ", ".join(f"{name} {count}" for name, count in counts.items())
+            print(f"{workers:>9} {stats['tiles']:>7} {stats['seconds']:>10.2f} {stats['tiles_per_second']:>9.2f} "
+                  f"{peak:>17.0f}  {found}")
+
+
+if __name__ == "__main__":
+    main()
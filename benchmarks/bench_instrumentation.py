@@ -0,0 +1,94 @@
+"""Benchmark : coût de l'instrumentation (points de mesure désactivés et actifs).
+
+Mesure le coût unitaire d'un ``span``, d'un ``count`` et d'un appel décoré
+par ``traced`` sans trace courante (instrumentation désactivée) et avec une
+trace, comparé à une fonction vide ; puis la durée d'un calcul de volumes
+(``compute_polygon_volumes``, qui compte les octets lus à chaque lot de
+tuiles) sans et avec instrumentation.
+
+Usage : python benchmarks/bench_instrumentation.py --calls 1000000 --size 2048
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import rasterio
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import instrumentation  # noqa: E402
+from benchmarks.synthetic import generate_isolated, make_dem_pair, make_polygons  # noqa: E402
+from volume_engine import compute_polygon_volumes  # noqa: E402
+
+
+def noop():
+    pass
+
+
+traced_noop = instrumentation.traced("noop")(noop)
+
+
+def with_span():
+    with instrumentation.span("noop"):
+        pass
+
+
+def with_count():
+    instrumentation.count("noop", 1)
+
+
+# Fonction pour mesurer le coût moyen d'un appel (en nanosecondes)
+def per_call(function, calls):
+    start = time.perf_counter()
+    for _ in range(calls):
+        function()
+    return (time.perf_counter() - start) / calls * 1e9
+
+
+# Fonction pour mesurer la meilleure durée de plusieurs répétitions
+def best_of(repeat, function, *args):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(*args)
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--calls", type=int, default=1000000)
+    parser.add_argument("--size", type=int, default=2048, help="côté des MNS / MNT synthétiques (pixels)")
+    parser.add_argument("--polygons", type=int, default=200)
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    print(f"{'point de mesure':>16} {'désactivé (ns)':>15} {'actif (ns)':>11}")
+    baseline = per_call(noop, args.calls)
+    print(f"{'fonction vide':>16} {baseline:>15.0f} {'':>11}")
+    for name, function in (("span", with_span), ("count", with_count), ("traced", traced_noop)):
+        instrumentation.enable(False)
+        instrumentation.start_trace("benchmark")
+        disabled = per_call(function, args.calls)
+        instrumentation.enable(True)
+        instrumentation.start_trace("benchmark")
+        # Les intervalles actifs sont conservés dans la trace : moins d'appels pour borner la mémoire
+        enabled = per_call(function, args.calls // 10)
+        print(f"{name:>16} {disabled:>15.0f} {enabled:>11.0f}")
+
+    with tempfile.TemporaryDirectory() as directory:
+        mns_path, mnt_path = generate_isolated(make_dem_pair, directory, args.size)
+        with rasterio.open(mns_path) as src:
+            polygons = make_polygons(args.polygons, src.bounds)
+        print(f"\n{'volumes':>16} {'durée (s)':>10}")
+        for label, flag in (("désactivé", False), ("actif", True)):
+            instrumentation.enable(flag)
+            instrumentation.start_trace("benchmark")
+            elapsed = best_of(args.repeat, compute_polygon_volumes, mns_path, mnt_path, polygons)
+            print(f"{label:>16} {elapsed:>10.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""Benchmark : export de la carte statique d'une orthophoto volumineuse.
+
+Compare, pour des orthophotos RGB synthétiques (tuilées, avec aperçus
+internes), la lecture pleine résolution suivie d'``imshow`` et l'export par
+``static_export.render_static_map`` (grille de sortie calculée depuis la page
+et la résolution). Chaque mesure tourne dans un processus neuf : durée et
+mémoire résidente maximale.
+
+Usage : python benchmarks/bench_static_export.py --sizes 4096 16384 --dpi 150
+"""
+import argparse
+import multiprocessing
+import os
+import resource
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.synthetic import generate_isolated, write_orthophoto  # noqa: E402
+
+
+# Ancienne méthode : bandes lues en pleine résolution puis affichées telles quelles
+def export_full_resolution(path, dpi):
+    import rasterio
+    from matplotlib.figure import Figure
+
+    fig = Figure(figsize=(10, 10), dpi=dpi)
+    ax = fig.subplots()
+    with rasterio.open(path) as src:
+        image = src.read().transpose(1, 2, 0)
+        ax.imshow(image, extent=[src.bounds.left, src.bounds.right, src.bounds.bottom, src.bounds.top])
+    fig.savefig(os.devnull, format="png")
+
+
+# Nouvelle méthode : lecture décimée et reprojetée sur la grille de la page
+def export_on_grid(path, dpi):
+    import rasterio
+    from rasterio.warp import transform_bounds
+    from static_export import render_static_map
+
+    with rasterio.open(path) as src:
+        bounds = transform_bounds(src.crs, "EPSG:4326", *src.bounds)
+    layer = {"type": "TIFF", "name": "Orthophoto", "path": path, "bounds": bounds}
+    render_static_map([layer], {}, [], dpi=dpi)
+
+
+def measure(function, path, dpi, queue):
+    start = time.perf_counter()
+    function(path, dpi)
+    queue.put((time.perf_counter() - start, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024))
+
+
+# Fonction pour mesurer une méthode dans un processus neuf
+def run_isolated(function, path, dpi):
+    """Retourne (durée en s, mémoire résidente maximale en Mo) de ``function(path, dpi)``."""
+    context = multiprocessing.get_context("spawn")
+    queue = context.Queue()
+    process = context.Process(target=measure, args=(function, path, dpi, queue))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[4096, 16384])
+    parser.add_argument("--dpi", type=int, default=150)
+    parser.add_argument("--full-max", type=int, default=8192,
+                        help="taille maximale pour la méthode pleine résolution (mémoire)")
+    args = parser.parse_args()
+
+    print(f"{'taille':>7} {'source (Mo)':>12} {'méthode':>18} {'durée (s)':>10} {'mémoire max (Mo)':>17}")
+    with tempfile.TemporaryDirectory() as directory:
+        for size in args.sizes:
+            path = generate_isolated(write_orthophoto, os.path.join(directory, f"ortho_{size}.tif"), size)
+            raw_size = 3 * size * size / 1024 ** 2
+            methods = [("grille de la page", export_on_grid)]
+            if size <= args.full_max:
+                methods.insert(0, ("pleine résolution", export_full_resolution))
+            for name, function in methods:
+                elapsed, peak = run_isolated(function, path, args.dpi)
+                print(f"{size:>7} {raw_size:>12.0f} {name:>18} {elapsed:>10.2f} {peak:>17.0f}")
+
+
+if __name__ == "__main__":
+    main()
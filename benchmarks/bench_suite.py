@@ -0,0 +1,296 @@
+"""Benchmark : suite de référence (volumes, rendu, export) comparée à une base JSON.
+
+Génère hors ligne un jeu de données synthétique (MNS / MNT de taille et de
+CRS choisis, polygones de 1 à 10 000 entités, réseau de routes GeoJSON sur le
+modèle de ``routeQSD.txt``), puis mesure chaque cas dans un processus neuf :
+meilleure durée sur ``--repeat`` essais et mémoire résidente maximale.
+
+Cas mesurés :
+
+- ``reproject_tiff`` : reprojection du MNS en EPSG:4326 ;
+- ``compute_polygon_volumes[n]`` et ``compute_polygon_volumes_mns_only[n]``
+  (cote de référence moyenne du contour de chaque polygone) ;
+- ``average_boundary_elevation[n]`` : cote moyenne du contour, polygone par
+  polygone (corps de ``calculate_average_elevation_on_boundary`` dans app.py) ;
+- ``apply_color_gradient`` et ``add_image_overlay`` : rendu PNG du MNS (cache
+  vidé), superposé à une carte folium pour le second ;
+- ``ingest_vector`` et ``vector_view`` : conversion du réseau de routes, puis
+  lecture d'une vue simplifiée ;
+- ``render_static_map`` : export de la carte statique (MNS et routes).
+
+Les fonctions d'app.py ne sont pas importables sans exécuter le script
+Streamlit : les cas appellent les fonctions des modules qu'elles enveloppent.
+
+Les résultats sont écrits en JSON (``--output``) et comparés à la base
+(``--baseline``) : un cas régresse si sa durée dépasse la référence de plus
+de ``thresholds.seconds`` (fraction, et d'au moins ``thresholds.min_seconds``)
+ou sa mémoire de plus de ``thresholds.peak_rss_mb`` (fraction). Le code de
+sortie vaut 1 en cas de régression. ``--update-baseline`` remplace la base
+par les mesures courantes (à régénérer sur la machine d'intégration : les
+durées dépendent du matériel).
+
+Usage : python benchmarks/bench_suite.py --size 2048 --polygons 1 100 10000 --baseline benchmarks/baseline.json
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.synthetic import (  # noqa: E402
+    generate_isolated, make_dem_pair, make_polygons, make_route_network, write_geojson,
+)
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+# Seuils de régression par défaut (fractions de la référence ; durée minimale en secondes)
+DEFAULT_THRESHOLDS = {"seconds": 0.3, "min_seconds": 0.05, "peak_rss_mb": 0.2}
+
+
+# Fonction pour générer le jeu de données de la suite
+def make_suite_data(directory, size, crs, routes):
+    """Écrit MNS, MNT et réseau de routes ; retourne les chemins et l'emprise (lon/lat) du MNS."""
+    import rasterio
+    from rasterio.warp import transform_bounds
+
+    mns_path, mnt_path = make_dem_pair(directory, size=size, crs=crs)
+    with rasterio.open(mns_path) as src:
+        left, bottom, right, top = transform_bounds(src.crs, "EPSG:4326", *src.bounds)
+    # Réseau plus étendu que le MNS : la vue et l'export n'en lisent qu'une partie
+    width, height = right - left, top - bottom
+    network_bounds = (left - width, bottom - height, right + width, top + height)
+    network_path = write_geojson(os.path.join(directory, "routes.geojson"), make_route_network(routes, network_bounds))
+    return {"directory": directory, "mns": mns_path, "mnt": mnt_path, "routes": network_path,
+            "bounds": (left, bottom, right, top)}
+
+
+# Fonction pour générer les polygones d'un cas dans l'emprise du MNS
+def suite_polygons(data, count):
+    import rasterio
+
+    with rasterio.open(data["mns"]) as src:
+        return make_polygons(count, src.bounds, seed=count)
+
+
+# Chaque cas prépare ses entrées (non chronométré) et retourne l'appel à chronométrer
+def case_reproject_tiff(data, count):
+    from raster_io import reproject_tiff
+
+    output_path = os.path.join(data["directory"], "reprojected.tif")
+    return lambda: reproject_tiff(data["mns"], "EPSG:4326", output_path=output_path)
+
+
+def case_compute_polygon_volumes(data, count):
+    from volume_engine import compute_polygon_volumes
+
+    polygons = suite_polygons(data, count)
+    return lambda: compute_polygon_volumes(data["mns"], data["mnt"], polygons)
+
+
+def case_compute_polygon_volumes_mns_only(data, count):
+    from volume_engine import compute_polygon_volumes_mns_only
+
+    polygons = suite_polygons(data, count)
+    return lambda: compute_polygon_volumes_mns_only(data["mns"], polygons)
+
+
+def case_average_boundary_elevation(data, count):
+    import rasterio
+    from volume_engine import average_boundary_elevation
+
+    polygons = suite_polygons(data, count)
+
+    def run():
+        for polygon in polygons:
+            with rasterio.open(data["mns"]) as src:
+                average_boundary_elevation(src, polygon)
+    return run
+
+
+def case_apply_color_gradient(data, count):
+    from rendering import OVERLAY_MAX_SIZE, _rendered_png, rendered_png
+
+    output_path = os.path.join(data["directory"], "gradient.png")
+
+    def run():
+        _rendered_png.cache_clear()
+        with open(output_path, "wb") as f:
+            f.write(rendered_png(data["mns"], "terrain", OVERLAY_MAX_SIZE))
+    return run
+
+
+def case_add_image_overlay(data, count):
+    import folium
+    from rendering import OVERLAY_MAX_SIZE, _rendered_png, rendered_data_url
+
+    left, bottom, right, top = data["bounds"]
+
+    def run():
+        _rendered_png.cache_clear()
+        m = folium.Map(location=[(bottom + top) / 2, (left + right) / 2], zoom_start=15)
+        folium.raster_layers.ImageOverlay(
+            image=rendered_data_url(data["mns"], "terrain", OVERLAY_MAX_SIZE),
+            bounds=[[bottom, left], [top, right]], name="MNS", opacity=0.6,
+        ).add_to(m)
+        m.get_root().render()
+    return run
+
+
+def case_ingest_vector(data, count):
+    from raster_cache import RasterCache
+    from vector_cache import ingest_vector
+
+    def run():
+        with tempfile.TemporaryDirectory(dir=data["directory"]) as directory:
+            ingest_vector(data["routes"], RasterCache(directory))
+    return run
+
+
+def case_vector_view(data, count):
+    from vector_cache import VectorLayer, ingest_vector
+
+    layer = ingest_vector(data["routes"])
+    left, bottom, right, top = data["bounds"]
+    width, height = right - left, top - bottom
+    view = (left - width / 2, bottom - height / 2, right + width / 2, top + height / 2)
+
+    def run():
+        json.dumps(VectorLayer(layer.key).geojson(view, 14))
+    return run
+
+
+def case_render_static_map(data, count):
+    from static_export import render_static_map
+    from vector_cache import ingest_vector
+
+    layer = ingest_vector(data["routes"])
+    left, bottom, right, top = data["bounds"]
+    layers = [{"type": "TIFF", "name": "MNS", "path": data["mns"], "bounds": data["bounds"]},
+              {"type": "GeoJSON", "name": "Routes", "vector": layer.key}]
+    frame = {"type": "Feature", "properties": {}, "geometry": {"type": "Polygon", "coordinates": [[
+        [left, bottom], [right, bottom], [right, top], [left, top], [left, bottom]]]}}
+    return lambda: render_static_map(layers, {}, [frame])
+
+
+# Cas de la suite : (nom, préparation, dépend du nombre de polygones)
+CASES = [
+    ("reproject_tiff", case_reproject_tiff, False),
+    ("compute_polygon_volumes", case_compute_polygon_volumes, True),
+    ("compute_polygon_volumes_mns_only", case_compute_polygon_volumes_mns_only, True),
+    ("average_boundary_elevation", case_average_boundary_elevation, True),
+    ("apply_color_gradient", case_apply_color_gradient, False),
+    ("add_image_overlay", case_add_image_overlay, False),
+    ("ingest_vector", case_ingest_vector, False),
+    ("vector_view", case_vector_view, False),
+    ("render_static_map", case_render_static_map, False),
+]
+
+
+def _measure(setup, data, count, repeat, queue):
+    function = setup(data, count)
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    queue.put((min(timings), resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024))
+
+
+# Fonction pour mesurer un cas dans un processus neuf
+def run_case(setup, data, count, repeat):
+    """Retourne {"seconds": meilleure durée, "peak_rss_mb": mémoire résidente maximale du processus}."""
+    context = multiprocessing.get_context("spawn")
+    queue = context.Queue()
+    process = context.Process(target=_measure, args=(setup, data, count, repeat, queue))
+    process.start()
+    seconds, peak = queue.get()
+    process.join()
+    return {"seconds": round(seconds, 4), "peak_rss_mb": round(peak, 1)}
+
+
+# Fonction pour comparer les mesures à la base de référence
+def compare(results, baseline):
+    """Retourne [(cas, mesure, référence, valeur, régression)] pour les cas présents dans la base."""
+    thresholds = {**DEFAULT_THRESHOLDS, **baseline.get("thresholds", {})}
+    rows = []
+    for name, result in results.items():
+        reference = baseline["results"].get(name)
+        if reference is None:
+            continue
+        slower = (result["seconds"] > reference["seconds"] * (1 + thresholds["seconds"])
+                  and result["seconds"] - reference["seconds"] > thresholds["min_seconds"])
+        rows.append((name, "seconds", reference["seconds"], result["seconds"], slower))
+        heavier = result["peak_rss_mb"] > reference["peak_rss_mb"] * (1 + thresholds["peak_rss_mb"])
+        rows.append((name, "peak_rss_mb", reference["peak_rss_mb"], result["peak_rss_mb"], heavier))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", type=int, default=2048, help="côté des MNS / MNT synthétiques (pixels)")
+    parser.add_argument("--crs", default="EPSG:32630", help="CRS des MNS / MNT synthétiques")
+    parser.add_argument("--polygons", type=int, nargs="+", default=[1, 100, 10000])
+    parser.add_argument("--routes", type=int, default=20000, help="nombre de routes du réseau GeoJSON")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--cases", nargs="+", help="cas à mesurer (par défaut : tous)")
+    parser.add_argument("--output", help="fichier JSON des mesures")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="base de référence JSON")
+    parser.add_argument("--update-baseline", action="store_true", help="remplacer la base par les mesures")
+    args = parser.parse_args()
+
+    parameters = {"size": args.size, "crs": args.crs, "polygons": args.polygons, "routes": args.routes}
+    results = {}
+    with tempfile.TemporaryDirectory() as directory:
+        # Cache des rasters et couches vectorielles des processus de mesure (hérité par leur environnement)
+        os.environ["RASTER_CACHE_DIR"] = os.path.join(directory, "cache")
+        start = time.perf_counter()
+        data = generate_isolated(make_suite_data, directory, args.size, args.crs, args.routes)
+        print(f"données : {time.perf_counter() - start:.1f} s ({args.size} px, {args.crs}, {args.routes} routes)")
+        print(f"{'cas':>40} {'durée (s)':>10} {'mémoire max (Mo)':>17}")
+        for name, setup, by_count in CASES:
+            if args.cases and name not in args.cases:
+                continue
+            for count in args.polygons if by_count else [None]:
+                label = f"{name}[{count}]" if by_count else name
+                results[label] = run_case(setup, data, count, args.repeat)
+                print(f"{label:>40} {results[label]['seconds']:>10.3f} {results[label]['peak_rss_mb']:>17.0f}")
+
+    report = {"parameters": parameters, "machine": {"python": platform.python_version(), "platform": platform.platform(),
+                                                     "cpus": os.cpu_count()}, "results": results}
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    if args.update_baseline:
+        thresholds = DEFAULT_THRESHOLDS
+        if os.path.exists(args.baseline):
+            with open(args.baseline, encoding="utf-8") as f:
+                thresholds = json.load(f).get("thresholds", thresholds)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump({**report, "thresholds": thresholds}, f, indent=2)
+            f.write("\n")
+        print(f"base de référence mise à jour : {args.baseline}")
+        return
+    if not os.path.exists(args.baseline):
+        print("aucune base de référence : comparaison ignorée")
+        return
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    if baseline.get("parameters") != parameters:
+        print(f"paramètres différents de la base ({baseline.get('parameters')}) : comparaison ignorée")
+        return
+    rows = compare(results, baseline)
+    print(f"\n{'cas':>40} {'mesure':>12} {'référence':>10} {'mesuré':>10} {'écart':>7}")
+    for name, metric, reference, value, regression in rows:
+        change = (value / reference - 1) * 100 if reference else 0.0
+        print(f"{name:>40} {metric:>12} {reference:>10.3f} {value:>10.3f} {change:>6.0f}%{'  RÉGRESSION' if regression else ''}")
+    if any(row[-1] for row in rows):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""Benchmark : superposition d'image (ImageOverlay) vs tuiles XYZ du serveur local.
+
+Mesure, pour un MNT synthétique, le temps jusqu'au premier affichage (page HTML
+plus tuiles visibles dans une vue 800x600) et la taille de la page envoyée.
+
+Usage : python benchmarks/bench_tile_server.py --sizes 2048 4096
+"""
+import argparse
+import hashlib
+import math
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.request import urlopen
+
+import folium
+import rasterio
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.synthetic import synthetic_surface, write_dem  # noqa: E402
+from raster_io import convert_to_cog, reproject_tiff  # noqa: E402
+from rendering import _rendered_png, rendered_data_url  # noqa: E402
+from tile_server import TILE_SIZE, start_tile_server  # noqa: E402
+
+VIEWPORT = (800, 600)
+
+
+# Fonction pour lister les tuiles visibles quand la carte est cadrée sur une emprise
+def visible_tiles(bounds):
+    """Retourne le zoom de cadrage et les tuiles (z, x, y) couvrant la vue."""
+    def to_tile(lat, lon, z):
+        n = 2 ** z
+        return (lon + 180) / 360 * n, (1 - math.asinh(math.tan(math.radians(lat))) / math.pi) / 2 * n
+
+    for z in range(22, -1, -1):
+        x0, y0 = to_tile(bounds.top, bounds.left, z)
+        x1, y1 = to_tile(bounds.bottom, bounds.right, z)
+        if (x1 - x0) * TILE_SIZE <= VIEWPORT[0] and (y1 - y0) * TILE_SIZE <= VIEWPORT[1]:
+            return z, [(z, x, y) for x in range(int(x0), int(x1) + 1) for y in range(int(y0), int(y1) + 1)]
+    return 0, [(0, 0, 0)]
+
+
+# Fonction pour produire le HTML de la carte avec une superposition d'image
+def overlay_page(image, bounds):
+    m = folium.Map(location=[(bounds.top + bounds.bottom) / 2, (bounds.left + bounds.right) / 2])
+    folium.raster_layers.ImageOverlay(image=image, bounds=[[bounds.bottom, bounds.left], [bounds.top, bounds.right]],
+                                      opacity=0.6).add_to(m)
+    return m.get_root().render()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[2048, 4096])
+    args = parser.parse_args()
+
+    import matplotlib.pyplot as plt
+
+    print(f"{'taille':>7} {'mode':>22} {'1er affichage (s)':>18} {'page (Ko)':>10}")
+    with tempfile.TemporaryDirectory() as directory:
+        server = start_tile_server(directory)
+        for size in args.sizes:
+            utm_path = write_dem(os.path.join(directory, f"utm_{size}.tif"), synthetic_surface(size, size))
+            wgs84_path = reproject_tiff(utm_path, "EPSG:4326", output_path=os.path.join(directory, f"wgs84_{size}.tif"))
+            cog_path = os.path.join(directory, hashlib.sha256(str(size).encode()).hexdigest() + ".tif")
+            convert_to_cog(wgs84_path, cog_path)
+            with rasterio.open(cog_path) as src:
+                bounds = src.bounds
+
+            # Ancienne superposition : bande entière colorée en RGBA float64 (plage calculée
+            # hors nodata, sinon l'image est quasi uniforme et la page artificiellement petite)
+            start = time.perf_counter()
+            with rasterio.open(cog_path) as src:
+                data = src.read(1, masked=True)
+            colored = plt.get_cmap("terrain")(plt.Normalize(vmin=data.min(), vmax=data.max())(data.filled(data.min())))
+            page = overlay_page(colored, bounds)
+            print(f"{size:>7} {'overlay pleine résolution':>22} {time.perf_counter() - start:>18.3f} {len(page) / 1024:>10.0f}")
+
+            # Superposition décimée (cache vidé pour mesurer un premier affichage)
+            _rendered_png.cache_clear()
+            start = time.perf_counter()
+            page = overlay_page(rendered_data_url(cog_path, "terrain"), bounds)
+            print(f"{size:>7} {'overlay décimée':>22} {time.perf_counter() - start:>18.3f} {len(page) / 1024:>10.0f}")
+
+            # Tuiles XYZ : page + tuiles visibles chargées en parallèle comme un navigateur
+            start = time.perf_counter()
+            m = folium.Map(location=[(bounds.top + bounds.bottom) / 2, (bounds.left + bounds.right) / 2])
+            url = server.tile_url(cog_path, "terrain")
+            folium.TileLayer(tiles=url, attr="bench", overlay=True, opacity=0.6).add_to(m)
+            page = m.get_root().render()
+            _, tiles = visible_tiles(bounds)
+            with ThreadPoolExecutor(max_workers=6) as pool:
+                tile_bytes = sum(pool.map(lambda t: len(urlopen(url.format(z=t[0], x=t[1], y=t[2])).read()), tiles))
+            elapsed = time.perf_counter() - start
+            print(f"{size:>7} {'tuiles XYZ':>22} {elapsed:>18.3f} {len(page) / 1024:>10.0f}"
+                  f"  ({len(tiles)} tuiles, {tile_bytes / 1024:.0f} Ko chargés à la demande)")
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+"""Benchmark : enregistrement d'un GeoTIFF téléversé (copie, empreinte, doublons).
+
+Le fichier téléversé est simulé par un ``BytesIO`` (comme l'``UploadedFile``
+de Streamlit). Compare l'ancienne écriture (``f.write(fichier.read())``, puis
+empreinte relue sur disque pour la clé de reprojection) et
+``raster_io.ingest_upload`` (copie par blocs avec empreinte), au premier
+téléversement puis à un second téléversement du même contenu. La mémoire est
+le pic des allocations Python mesuré par ``tracemalloc``.
+
+Usage : python benchmarks/bench_upload_ingest.py --size 8192
+"""
+import argparse
+import io
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.synthetic import write_orthophoto  # noqa: E402
+from raster_cache import RasterCache, file_digest  # noqa: E402
+from raster_io import ingest_upload  # noqa: E402
+
+
+# Ancienne méthode : contenu entier lu puis écrit, empreinte calculée ensuite (clé de reprojection)
+def write_whole(fileobj, directory):
+    path = os.path.join(directory, "uploaded.tiff")
+    with open(path, "wb") as f:
+        f.write(fileobj.read())
+    file_digest(path)
+    os.remove(path)
+
+
+# Fonction pour mesurer la durée et le pic d'allocations d'un appel
+def measure(function, *args):
+    """Retourne (durée en s, pic des allocations Python en Mo) de ``function(*args)``."""
+    tracemalloc.start()
+    start = time.perf_counter()
+    function(*args)
+    elapsed = time.perf_counter() - start
+    peak = tracemalloc.get_traced_memory()[1] / 1024 ** 2
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", type=int, default=8192, help="côté de l'orthophoto synthétique (pixels)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        source = write_orthophoto(os.path.join(directory, "ortho.tif"), args.size)
+        with open(source, "rb") as f:
+            upload = io.BytesIO(f.read())
+        cache = RasterCache(os.path.join(directory, "cache"))
+        print(f"fichier : {len(upload.getvalue()) / 1024 ** 2:.0f} Mo")
+        print(f"{'méthode':>28} {'durée (s)':>10} {'pic mémoire (Mo)':>17}")
+        upload.seek(0)
+        rows = [("lecture entière + écriture", measure(write_whole, upload, directory)),
+                ("copie par blocs (nouveau)", measure(ingest_upload, upload, cache)),
+                ("copie par blocs (doublon)", measure(ingest_upload, upload, cache))]
+        for name, (elapsed, peak) in rows:
+            print(f"{name:>28} {elapsed:>10.2f} {peak:>17.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""Benchmark : enregistrement et rendu des couches d'entités dessinées par l'utilisateur.
+
+Pour ``n`` points relevés (plus quelques lignes et polygones), compare :
+
+- l'enregistrement sans doublon dans une liste (``feature not in couche``,
+  comparaison profonde, O(n²)) et dans une ``feature_store.FeatureLayer``
+  (empreinte de géométrie, O(n)) ;
+- la construction et le rendu HTML de la carte folium avec un objet par
+  entité (ancienne boucle ``Marker`` / ``PolyLine`` / ``Polygon``) et avec une
+  seule FeatureCollection par couche (``user_layer_group`` de l'application).
+
+Usage : python benchmarks/bench_user_layers.py --counts 1000 5000 10000
+"""
+import argparse
+import os
+import sys
+import time
+
+import folium
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from feature_store import FeatureLayer  # noqa: E402
+
+
+# Fonction pour générer des entités relevées (points, lignes et polygones)
+def make_features(count, seed=0):
+    rng = np.random.default_rng(seed)
+    lons, lats = rng.uniform(-4.1, -3.9, count), rng.uniform(5.3, 5.4, count)
+    features = [{"type": "Feature", "properties": {"name": f"Point {i}"},
+                 "geometry": {"type": "Point", "coordinates": [float(lon), float(lat)]}}
+                for i, (lon, lat) in enumerate(zip(lons, lats))]
+    for i in range(max(1, count // 100)):
+        lon, lat = float(lons[i]), float(lats[i])
+        features.append({"type": "Feature", "properties": {},
+                         "geometry": {"type": "LineString", "coordinates": [[lon, lat], [lon + 0.001, lat + 0.001]]}})
+        features.append({"type": "Feature", "properties": {}, "geometry": {"type": "Polygon", "coordinates": [[
+            [lon, lat], [lon + 0.001, lat], [lon + 0.001, lat + 0.001], [lon, lat + 0.001], [lon, lat]]]}})
+    return features
+
+
+# Ancienne méthode : liste et test d'appartenance par comparaison profonde
+def save_in_list(features):
+    layer = []
+    for feature in features:
+        if feature not in layer:
+            layer.append(feature)
+    return layer
+
+
+# Ancienne méthode : un objet folium par entité
+def render_per_feature(name, features):
+    m = folium.Map(location=[5.35, -4.0], zoom_start=12)
+    group = folium.FeatureGroup(name=name, show=True)
+    for feature in features:
+        feature_type = feature["geometry"]["type"]
+        coordinates = feature["geometry"]["coordinates"]
+        popup = feature.get("properties", {}).get("name", f"{name} - Entité")
+        if feature_type == "Point":
+            folium.Marker(location=[coordinates[1], coordinates[0]], popup=popup).add_to(group)
+        elif feature_type == "LineString":
+            folium.PolyLine(locations=[(lat, lon) for lon, lat in coordinates], color="blue", popup=popup).add_to(group)
+        elif feature_type == "Polygon":
+            folium.Polygon(locations=[(lat, lon) for lon, lat in coordinates[0]], color="green", fill=True, popup=popup).add_to(group)
+    group.add_to(m)
+    return m.get_root().render()
+
+
+# Nouvelle méthode : une FeatureCollection par couche (comme ``user_layer_group`` dans app.py)
+def render_batched(name, layer):
+    m = folium.Map(location=[5.35, -4.0], zoom_start=12)
+    group = folium.FeatureGroup(name=name, show=True)
+    folium.GeoJson(
+        layer.geojson(f"{name} - Entité"),
+        style_function=lambda feature: {"color": "blue", "weight": 3},
+        marker=folium.CircleMarker(radius=6, color="blue", fill=True, fill_opacity=0.8),
+        popup=folium.GeoJsonPopup(fields=["name"], labels=False),
+    ).add_to(group)
+    group.add_to(m)
+    return m.get_root().render()
+
+
+# Fonction pour chronométrer un appel
+def timed(function, *args):
+    start = time.perf_counter()
+    result = function(*args)
+    return time.perf_counter() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--counts", type=int, nargs="+", default=[1000, 5000, 10000])
+    parser.add_argument("--list-max", type=int, default=6000, help="nombre maximal d'entités pour la méthode par liste (O(n²))")
+    args = parser.parse_args()
+
+    print(f"{'entités':>8} {'enreg. liste (s)':>17} {'enreg. index (s)':>17} {'rendu par entité (s)':>21} "
+          f"{'rendu groupé (s)':>17} {'HTML (Mo) avant/après':>22}")
+    for count in args.counts:
+        features = make_features(count)
+        list_time = timed(save_in_list, features)[0] if len(features) <= args.list_max else float("nan")
+        store_time, layer = timed(FeatureLayer, features)
+        per_feature_time, per_feature_html = timed(render_per_feature, "Relevés", features)
+        batched_time, batched_html = timed(render_batched, "Relevés", layer)
+        print(f"{len(features):>8} {list_time:>17.3f} {store_time:>17.3f} {per_feature_time:>21.3f} {batched_time:>17.3f} "
+              f"{len(per_feature_html) / 1024 ** 2:>10.1f} / {len(batched_html) / 1024 ** 2:<9.1f}")
+
+
+if __name__ == "__main__":
+    main()
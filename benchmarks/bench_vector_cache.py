@@ -0,0 +1,60 @@
+"""Benchmark : GeoJSON brut (json.load + folium.GeoJson) vs cache vectoriel FlatGeobuf simplifié.
+
+Mesure, pour ``routeQSD.txt`` et quelques vues types (emprise, zoom), le temps
+de lecture par rerun et la taille du GeoJSON envoyé à la page.
+
+Usage : python benchmarks/bench_vector_cache.py [--source routeQSD.txt]
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from point_finder import ROUTE_NETWORK_PATH  # noqa: E402
+from raster_cache import RasterCache  # noqa: E402
+from vector_cache import ingest_vector  # noqa: E402
+
+# Vues types : (nom, (ouest, sud, est, nord), zoom)
+VIEWS = [
+    ("pays", (-8.6, 4.3, -2.5, 10.7), 7),
+    ("agglomération", (-4.2, 5.2, -3.8, 5.5), 11),
+    ("quartier", (-4.1, 5.28, -3.95, 5.38), 13),
+    ("rue", (-4.03, 5.31, -4.0, 5.33), 15),
+]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--source", default=ROUTE_NETWORK_PATH)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    for _ in range(args.repeat):
+        with open(args.source, encoding="utf-8") as f:
+            raw = json.load(f)
+    raw_time = (time.perf_counter() - start) / args.repeat
+    raw_size = len(json.dumps(raw))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        cache = RasterCache(tmp)
+        start = time.perf_counter()
+        layer = ingest_vector(args.source, cache)
+        print(f"conversion initiale : {time.perf_counter() - start:.2f} s")
+        print(f"{'vue':>14} {'zoom':>5} {'lecture (ms)':>13} {'brut (ms)':>10} {'page (Ko)':>10} {'brut (Ko)':>10} {'gain':>6}")
+        for name, bounds, zoom in VIEWS:
+            start = time.perf_counter()
+            for _ in range(args.repeat):
+                data = layer.geojson(bounds, zoom)
+            elapsed = (time.perf_counter() - start) / args.repeat
+            size = len(json.dumps(data))
+            print(f"{name:>14} {zoom:>5} {elapsed * 1000:>13.1f} {raw_time * 1000:>10.1f} {size / 1024:>10.0f} "
+                  f"{raw_size / 1024:>10.0f} {raw_size / size:>5.0f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""Benchmark : découpage polygone par polygone vs moteur de volume en une passe.
+
+Usage : python benchmarks/bench_volume_engine.py --size 4096 --counts 10 50 200 500 --workers 4
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+import rasterio
+from rasterio.mask import mask
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.synthetic import make_dem_pair, make_polygons  # noqa: E402
+from volume_engine import compute_polygon_volumes  # noqa: E402
+
+
+# Fonction de référence : reprend la boucle historique de app.py (sans Streamlit)
+def legacy_volumes(mns_path, mnt_path, geometries):
+    """Découpe MNS et MNT avec ``rasterio.mask.mask`` pour chaque polygone."""
+    volumes = []
+    areas = []
+    for geometry in geometries:
+        with rasterio.open(mns_path) as src:
+            mns_clipped, mns_transform = mask(src, [geometry], crop=True, nodata=np.nan)
+            mns_data = mns_clipped[0]
+            cell_area = abs(mns_transform.a * mns_transform.e)
+        with rasterio.open(mnt_path) as src:
+            mnt_clipped, _ = mask(src, [geometry], crop=True, nodata=np.nan)
+            mnt_data = mnt_clipped[0]
+        valid_mask = (~np.isnan(mns_data)) & (~np.isnan(mnt_data))
+        diff = np.where(valid_mask, mns_data - mnt_data, 0)
+        volumes.append(np.sum(diff, dtype=np.float64) * cell_area)
+        areas.append(np.count_nonzero(valid_mask) * cell_area)
+    return np.array(volumes), np.array(areas)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size", type=int, default=4096, help="côté du raster synthétique (pixels)")
+    parser.add_argument("--counts", type=int, nargs="+", default=[10, 50, 200, 500])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--workers", type=int, default=4, help="processus pour le mode parallèle")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        mns_path, mnt_path = make_dem_pair(directory, size=args.size)
+        with rasterio.open(mns_path) as src:
+            bounds = src.bounds
+            cell_area = abs(src.transform.a * src.transform.e)
+        print(f"Raster {args.size}x{args.size} px")
+        print(f"{'polygones':>10} {'par polygone (s)':>17} {'une passe (s)':>14} {'accélération':>13}"
+              f" {f'{args.workers} processus (s)':>16}")
+        for count in args.counts:
+            geometries = make_polygons(count, bounds, seed=count)
+            legacy_time = batch_time = parallel_time = float("inf")
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                legacy_volume, legacy_area = legacy_volumes(mns_path, mnt_path, geometries)
+                legacy_time = min(legacy_time, time.perf_counter() - start)
+                start = time.perf_counter()
+                volumes, areas, _ = compute_polygon_volumes(mns_path, mnt_path, geometries)
+                batch_time = min(batch_time, time.perf_counter() - start)
+                start = time.perf_counter()
+                parallel_volumes, parallel_areas, _ = compute_polygon_volumes(mns_path, mnt_path, geometries,
+                                                                              workers=args.workers)
+                parallel_time = min(parallel_time, time.perf_counter() - start)
+            # Un pixel dont le centre tombe sur un bord (à la précision flottante près) peut
+            # basculer selon l'origine de la fenêtre de rasterisation : on tolère 2 pixels.
+            np.testing.assert_allclose(areas, legacy_area, rtol=0, atol=2 * cell_area)
+            np.testing.assert_allclose(volumes, legacy_volume, rtol=1e-3, atol=1.0)
+            np.testing.assert_array_equal(parallel_volumes, volumes)
+            np.testing.assert_array_equal(parallel_areas, areas)
+            print(f"{count:>10} {legacy_time:>17.3f} {batch_time:>14.3f} {legacy_time / batch_time:>12.1f}x"
+                  f" {parallel_time:>16.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,266 @@
+"""Génération de données synthétiques pour les benchmarks (hors ligne)."""
+import json
+import multiprocessing
+import os
+
+import numpy as np
+import rasterio
+from rasterio.crs import CRS
+from rasterio.enums import Resampling
+from rasterio.features import rasterize
+from rasterio.transform import from_origin
+from rasterio.warp import transform as transform_coordinates
+from rasterio.windows import Window, transform as window_transform
+from shapely.geometry import LineString, Polygon, box
+
+# Origine par défaut : Abidjan en UTM 30N (EPSG:32630)
+DEFAULT_ORIGIN = (380000.0, 600000.0)
+DEFAULT_ORIGIN_CRS = "EPSG:32630"
+# Longueur approximative d'un degré de latitude (m)
+METERS_PER_DEGREE = 111320.0
+
+
+def _generate(function, args, queue):
+    queue.put(function(*args))
+
+
+# Fonction pour générer des données dans un processus neuf
+def generate_isolated(function, *args):
+    """Retourne ``function(*args)`` exécutée dans un processus neuf.
+
+    La mémoire résidente maximale (``ru_maxrss``) est conservée par Linux à
+    travers ``fork`` et ``exec`` : générer les données dans le processus du
+    benchmark gonflerait les mesures des processus de calcul lancés ensuite.
+    """
+    context = multiprocessing.get_context("spawn")
+    queue = context.Queue()
+    process = context.Process(target=_generate, args=(function, args, queue))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+
+# Fonction pour générer une surface de terrain lisse et reproductible
+def synthetic_surface(height, width, seed=0):
+    """Retourne un relief float32 combinant pente régionale et ondulations."""
+    rng = np.random.default_rng(seed)
+    rows, cols = np.mgrid[0:height, 0:width].astype(np.float32)
+    surface = 50.0 + 0.01 * rows + 0.02 * cols
+    for _ in range(4):
+        fy, fx = rng.uniform(0.002, 0.02, size=2)
+        phase = rng.uniform(0, 2 * np.pi)
+        surface += rng.uniform(1.0, 5.0) * np.sin(fy * rows + fx * cols + phase)
+    return surface.astype(np.float32)
+
+
+# Fonction pour écrire un GeoTIFF synthétique
+def write_dem(path, data, crs="EPSG:32630", resolution=0.5, origin=DEFAULT_ORIGIN, nodata=-9999.0):
+    """Écrit une grille float32 mono-bande en GeoTIFF et retourne son chemin."""
+    profile = {
+        "driver": "GTiff",
+        "dtype": "float32",
+        "count": 1,
+        "width": data.shape[1],
+        "height": data.shape[0],
+        "crs": crs,
+        "transform": from_origin(origin[0], origin[1], resolution, resolution),
+        "nodata": nodata,
+        "tiled": True,
+        "blockxsize": 256,
+        "blockysize": 256,
+    }
+    with rasterio.open(path, "w", **profile) as dst:
+        dst.write(data, 1)
+    return path
+
+
+# Fonction pour exprimer l'origine et la résolution par défaut dans un CRS quelconque
+def grid_origin(crs, resolution):
+    """Retourne (origine, résolution) dans les unités de ``crs`` ; ``resolution`` est en mètres."""
+    crs = CRS.from_user_input(crs)
+    if crs == CRS.from_user_input(DEFAULT_ORIGIN_CRS):
+        return DEFAULT_ORIGIN, resolution
+    xs, ys = transform_coordinates(DEFAULT_ORIGIN_CRS, crs, [DEFAULT_ORIGIN[0]], [DEFAULT_ORIGIN[1]])
+    if crs.is_geographic:
+        resolution = resolution / METERS_PER_DEGREE
+    return (xs[0], ys[0]), resolution
+
+
+# Fonction pour générer un couple MNS / MNT aligné
+def make_dem_pair(directory, size=2048, crs="EPSG:32630", resolution=0.5, seed=0):
+    """Crée un MNT et un MNS (MNT + stocks) de ``size`` pixels de côté ; ``resolution`` est en mètres."""
+    origin, resolution = grid_origin(crs, resolution)
+    rng = np.random.default_rng(seed)
+    mnt = synthetic_surface(size, size, seed=seed)
+    rows, cols = np.mgrid[0:size, 0:size]
+    mns = mnt.copy()
+    for _ in range(max(1, size // 128)):
+        cy, cx = rng.uniform(0, size, size=2)
+        radius = rng.uniform(10, size / 16)
+        dome = rng.uniform(2, 15) * np.clip(1 - ((rows - cy) ** 2 + (cols - cx) ** 2) / radius ** 2, 0, None)
+        mns += dome.astype(np.float32)
+    # Quelques trous de données pour exercer la gestion des nodata
+    holes = rng.random((size, size)) < 0.001
+    mns[holes] = -9999.0
+    mnt_path = write_dem(os.path.join(directory, "mnt.tif"), mnt, crs=crs, resolution=resolution, origin=origin)
+    mns_path = write_dem(os.path.join(directory, "mns.tif"), mns, crs=crs, resolution=resolution, origin=origin)
+    return mns_path, mnt_path
+
+
+# Fonction pour générer un ensemble de polygones dans une emprise
+def make_polygons(count, bounds, mean_radius=None, vertices=12, seed=0):
+    """Génère ``count`` polygones étoilés (éventuellement chevauchants) dans ``bounds``."""
+    rng = np.random.default_rng(seed)
+    left, bottom, right, top = bounds
+    if mean_radius is None:
+        mean_radius = min(right - left, top - bottom) / (4 * np.sqrt(count) + 4)
+    polygons = []
+    for _ in range(count):
+        cx = rng.uniform(left + mean_radius, right - mean_radius)
+        cy = rng.uniform(bottom + mean_radius, top - mean_radius)
+        angles = np.sort(rng.uniform(0, 2 * np.pi, size=vertices))
+        radii = mean_radius * rng.uniform(0.5, 1.0, size=vertices)
+        polygons.append(Polygon(np.column_stack([cx + radii * np.cos(angles), cy + radii * np.sin(angles)])))
+    return polygons
+
+
+# Fonction pour générer un réseau de routes GeoJSON (sur le modèle de routeQSD.txt)
+def make_route_network(count, bounds, step=0.0002, seed=0):
+    """Retourne une FeatureCollection de ``count`` lignes (propriété ``ID``) dans ``bounds`` (lon/lat).
+
+    Comme dans ``routeQSD.txt``, chaque route est une polyligne de 2 à 60
+    sommets espacés d'une vingtaine de mètres, aux coordonnées arrondies à
+    7 décimales.
+    """
+    rng = np.random.default_rng(seed)
+    left, bottom, right, top = bounds
+    features = []
+    for index in range(count):
+        vertices = int(rng.integers(2, 61))
+        heading = rng.uniform(0, 2 * np.pi) + np.cumsum(rng.normal(0, 0.2, vertices - 1))
+        xs = np.concatenate([[rng.uniform(left, right)], step * np.cos(heading)]).cumsum()
+        ys = np.concatenate([[rng.uniform(bottom, top)], step * np.sin(heading)]).cumsum()
+        coordinates = np.round(np.column_stack([np.clip(xs, left, right), np.clip(ys, bottom, top)]), 7)
+        features.append({"type": "Feature", "properties": {"ID": f"Route {index}"},
+                         "geometry": {"type": "LineString", "coordinates": coordinates.tolist()}})
+    return {"type": "FeatureCollection", "features": features}
+
+
+# Fonction pour écrire une FeatureCollection (indentée, comme routeQSD.txt)
+def write_geojson(path, data, indent=2):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=indent)
+    return path
+
+
+# Fonction pour écrire une orthophoto synthétique volumineuse, par blocs
+def write_orthophoto(path, size, crs="EPSG:32630", resolution=0.05, origin=DEFAULT_ORIGIN, block=1024, seed=0):
+    """Écrit une image RGB uint8 tuilée de ``size`` pixels de côté, avec ses aperçus internes (comme un COG)."""
+    rng = np.random.default_rng(seed)
+    profile = {
+        "driver": "GTiff", "dtype": "uint8", "count": 3, "width": size, "height": size, "crs": crs,
+        "transform": from_origin(origin[0], origin[1], resolution, resolution),
+        "tiled": True, "blockxsize": 512, "blockysize": 512, "compress": "deflate", "photometric": "RGB",
+    }
+    with rasterio.open(path, "w", **profile) as dst:
+        for row in range(0, size, block):
+            height = min(block, size - row)
+            base = (np.arange(size, dtype=np.uint16)[None, :] + row) % 256
+            texture = rng.integers(0, 32, (3, height, size), dtype=np.uint16)
+            dst.write((base[None, :, :] // 2 + texture).astype(np.uint8), window=Window(0, row, size, height))
+        factors = []
+        factor = 2
+        while size // factor >= 256:
+            factors.append(factor)
+            factor *= 2
+        dst.build_overviews(factors, Resampling.average)
+    return path
+
+
+# Couleurs (RGB) des classes de la scène synthétique : végétation, route, tas, toits
+SCENE_COLORS = np.array([[60, 120, 50], [128, 128, 124], [165, 120, 80], [205, 85, 65]], dtype=np.int16)
+
+
+# Fonction pour générer un site synthétique (orthophoto, MNS, MNT) avec bâtiments, routes et tas
+def make_site_scene(directory, size=4096, resolution=0.25, origin=DEFAULT_ORIGIN, block=1024, seed=0):
+    """Crée une orthophoto RGB et un couple MNS / MNT alignés ; retourne (ortho, mns, mnt, nombres d'objets).
+
+    L'orthophoto est écrite par blocs ; les objets sont des routes (bandes
+    grises), des bâtiments (toits rectangulaires de 3 à 8 m de haut) et des
+    tas (dômes de terre de 2 à 6 m).
+    """
+    rng = np.random.default_rng(seed)
+    extent = size * resolution
+    left, top = origin
+    roads = []
+    for _ in range(max(1, size // 1024)):
+        y0, y1 = rng.uniform(0.1, 0.9, size=2) * extent
+        roads.append(LineString([(left, top - y0), (left + extent, top - y1)]).buffer(rng.uniform(3, 5), cap_style="flat"))
+    buildings, piles = [], []
+    for _ in range(size ** 2 // 40000):
+        x, y = rng.uniform(0.02, 0.98, size=2) * extent
+        candidate = box(left + x, top - y, left + x + rng.uniform(8, 25), top - y + rng.uniform(8, 20))
+        if not any(candidate.buffer(3).intersects(other) for other in roads + buildings):
+            buildings.append(candidate)
+    for _ in range(size ** 2 // 200000 + 1):
+        x, y = rng.uniform(0.05, 0.95, size=2) * extent
+        candidate = LineString([(left + x, top - y), (left + x, top - y)]).buffer(rng.uniform(5, 15))
+        if not any(candidate.buffer(3).intersects(other) for other in roads + buildings + piles):
+            piles.append(candidate)
+    shapes_ = ([(road, 1) for road in roads] + [(pile, 2) for pile in piles]
+               + [(building, 3) for building in buildings])
+    transform = from_origin(left, top, resolution, resolution)
+    profile = {
+        "driver": "GTiff", "dtype": "uint8", "count": 3, "width": size, "height": size, "crs": "EPSG:32630",
+        "transform": transform, "tiled": True, "blockxsize": 512, "blockysize": 512, "compress": "deflate",
+        "photometric": "RGB",
+    }
+    ortho_path = os.path.join(directory, "orthophoto.tif")
+    with rasterio.open(ortho_path, "w", **profile) as dst:
+        for row in range(0, size, block):
+            window = Window(0, row, size, min(block, size - row))
+            labels = rasterize(shapes_, out_shape=(int(window.height), size), transform=window_transform(window, transform),
+                               fill=0, dtype="uint8")
+            noise = rng.integers(-12, 13, (3, int(window.height), size), dtype=np.int16)
+            dst.write(np.clip(SCENE_COLORS[labels].transpose(2, 0, 1) + noise, 0, 255).astype(np.uint8), window=window)
+    mnt = synthetic_surface(size, size, seed=seed)
+    heights = np.zeros((size, size), dtype=np.float32)
+    building_heights = rng.uniform(3, 8, size=len(buildings))
+    if buildings:
+        heights += rasterize(zip(buildings, building_heights), out_shape=(size, size), transform=transform,
+                             fill=0, dtype="float32")
+    for pile in piles:
+        (cx, cy), radius = pile.centroid.coords[0], np.sqrt(pile.area / np.pi)
+        col0, row0 = (max(int(v), 0) for v in ~transform * (cx - radius, cy + radius))
+        col1, row1 = (min(int(v) + 1, size) for v in ~transform * (cx + radius, cy - radius))
+        rows, cols = np.mgrid[row0:row1, col0:col1]
+        xs, ys = transform * (cols + 0.5, rows + 0.5)
+        dome = rng.uniform(2, 6) * np.clip(1 - ((xs - cx) ** 2 + (ys - cy) ** 2) / radius ** 2, 0, None)
+        heights[row0:row1, col0:col1] += dome.astype(np.float32)
+    mnt_path = write_dem(os.path.join(directory, "mnt.tif"), mnt, resolution=resolution, origin=origin)
+    mns_path = write_dem(os.path.join(directory, "mns.tif"), mnt + heights, resolution=resolution, origin=origin)
+    return ortho_path, mns_path, mnt_path, {"roads": len(roads), "buildings": len(buildings), "piles": len(piles)}
+
+
+# Emprise approximative du réseau routier de référence (lon/lat)
+DEFECT_BOUNDS = (-5.6, 5.1, -3.2, 6.9)
+DEFECT_ROUTES = ["A1(anyama-abengourou)", "A3(abidjan-yamoussoukro)", "BVD lagunaire", "la cotière(ABJ-SP)"]
+DEFECT_CATEGORIES = ["assainissement", "chaussée", "signalisation", "accotement"]
+
+
+# Fonction pour générer des défauts routiers (schéma de routes_defauts.db)
+def make_defects(count, bounds=DEFECT_BOUNDS, seed=0):
+    """Génère ``count`` tuples (route, categorie, gravite, latitude, longitude, date, heure, ville)."""
+    rng = np.random.default_rng(seed)
+    left, bottom, right, top = bounds
+    routes = rng.integers(0, len(DEFECT_ROUTES), count)
+    categories = rng.integers(0, len(DEFECT_CATEGORIES), count)
+    gravities = rng.integers(1, 4, count)
+    lats = rng.uniform(bottom, top, count)
+    lons = rng.uniform(left, right, count)
+    days = rng.integers(0, 365, count)
+    minutes = rng.integers(0, 24 * 60, count)
+    for i in range(count):
+        yield (DEFECT_ROUTES[routes[i]], DEFECT_CATEGORIES[categories[i]], int(gravities[i]), float(lats[i]), float(lons[i]),
+               str(np.datetime64("2024-01-01") + days[i]), f"{minutes[i] // 60:02d}:{minutes[i] % 60:02d}", "Abidjan")
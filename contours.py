@@ -0,0 +1,167 @@
+"""Génération de courbes de niveau par tuiles, avec raccord aux jointures et cache disque.
+
+Le MNT/MNS est reprojeté dans une projection métrique (à la résolution
+demandée), puis parcouru par tuiles qui se recouvrent d'une ligne et d'une
+colonne. Les courbes de chaque tuile sont extraites par marching squares
+(``skimage.measure.find_contours``) ; comme les tuiles voisines partagent la
+ligne de jointure, les extrémités y coïncident et ``linemerge`` recoud les
+courbes. Le résultat est mis en cache par (contenu, équidistance, résolution).
+"""
+import json
+import math
+import os
+from collections import defaultdict
+from decimal import Decimal
+from io import StringIO
+
+import numpy as np
+import rasterio
+import shapely
+from rasterio import windows
+from shapely.geometry import LineString, MultiLineString, mapping, shape
+from shapely.ops import linemerge
+from skimage.measure import find_contours
+
+import instrumentation
+from raster_cache import RasterCache, file_digest
+from raster_io import DEFAULT_RESAMPLING, cached_reproject_tiff, reprojection_cache
+
+# Projection métrique des courbes (UTM 30N, Côte d'Ivoire)
+CONTOUR_CRS = "EPSG:32630"
+DEFAULT_TILE_SIZE = 1024
+# Précision (en pixels) utilisée pour faire coïncider les extrémités aux jointures
+SEAM_DECIMALS = 6
+# Une courbe sur MAJOR_EVERY est une courbe maîtresse
+MAJOR_EVERY = 5
+# Version du contenu mis en cache (à incrémenter quand le GeoJSON produit change)
+CACHE_VERSION = 2
+
+
+# Fonction pour découper un raster en tuiles qui se recouvrent d'un pixel
+def overlapping_tiles(width, height, tile_size=DEFAULT_TILE_SIZE):
+    """Génère des fenêtres de ``tile_size`` pixels partageant leur dernière ligne et colonne."""
+    step = tile_size - 1
+    for row_off in range(0, max(height - 1, 1), step):
+        for col_off in range(0, max(width - 1, 1), step):
+            yield windows.Window(col_off, row_off, min(tile_size, width - col_off), min(tile_size, height - row_off))
+
+
+# Fonction pour calculer le nombre de décimales d'une équidistance (0.25 → 2, 10 → 0)
+def interval_decimals(interval):
+    return max(0, -Decimal(repr(float(interval))).normalize().as_tuple().exponent)
+
+
+# Fonction pour extraire les courbes d'une tuile
+def tile_contours(data, valid, interval):
+    """Retourne {cote: [tableaux (n, 2) de coordonnées (ligne, colonne)]} pour une tuile.
+
+    Les cotes sont arrondies aux décimales de l'équidistance (0.3 et non 0.30000000000000004).
+    """
+    if not valid.any() or min(data.shape) < 2:
+        return {}
+    low, high = data[valid].min(), data[valid].max()
+    filled = np.where(valid, data, low)
+    lines = {}
+    decimals = interval_decimals(interval)
+    for k in range(math.ceil(low / interval), math.floor(high / interval) + 1):
+        level = round(k * interval, decimals)
+        found = find_contours(filled, level, mask=valid)
+        if found:
+            lines[level] = found
+    return lines
+
+
+# Fonction pour générer toutes les courbes d'un raster métrique
+@instrumentation.traced()
+def generate_contours(tiff_path, interval, tile_size=DEFAULT_TILE_SIZE, progress=None):
+    """Retourne {cote: [LineString]} dans le CRS du raster, courbes raccordées entre tuiles.
+
+    ``progress(tuiles_traitées, total)`` est appelé après chaque tuile.
+    """
+    segments = defaultdict(list)
+    counter = f"bytes_read:{os.path.basename(tiff_path)}"
+    with rasterio.open(tiff_path) as src:
+        transform = src.transform
+        tiles = list(overlapping_tiles(src.width, src.height, tile_size))
+        for done, window in enumerate(tiles, 1):
+            data = src.read(1, window=window, masked=True)
+            instrumentation.count(counter, data.nbytes)
+            values = np.ma.getdata(data).astype(np.float64)
+            valid = ~np.ma.getmaskarray(data) & np.isfinite(values)
+            for level, found in tile_contours(values, valid, interval).items():
+                for line in found:
+                    if len(line) < 2:
+                        continue
+                    # Coordonnées pixel globales, arrondies pour raccorder les jointures
+                    pixels = np.round(line + [window.row_off, window.col_off], SEAM_DECIMALS)
+                    segments[level].append(LineString(pixels[:, ::-1]))
+            if progress:
+                progress(done, len(tiles))
+
+    def to_world(coords):
+        xs, ys = transform * (coords[:, 0] + 0.5, coords[:, 1] + 0.5)
+        return np.column_stack([xs, ys])
+
+    contours = {}
+    for level, lines in sorted(segments.items()):
+        merged = linemerge(MultiLineString(lines)) if len(lines) > 1 else lines[0]
+        parts = list(merged.geoms) if hasattr(merged, "geoms") else [merged]
+        contours[level] = [shapely.transform(part, to_world) for part in parts]
+    return contours
+
+
+# Fonction pour convertir les courbes en GeoJSON
+def contours_to_geojson(contours, crs=CONTOUR_CRS):
+    """Retourne une FeatureCollection (une entité par cote) avec le CRS indiqué en membre ``crs``."""
+    features = [
+        {"type": "Feature", "properties": {"elevation": level},
+         "geometry": mapping(MultiLineString(lines) if len(lines) > 1 else lines[0])}
+        for level, lines in contours.items()
+    ]
+    return {"type": "FeatureCollection", "crs": {"type": "name", "properties": {"name": crs}}, "features": features}
+
+
+# Fonction pour obtenir (depuis le cache si possible) les courbes d'une couche
+def cached_contours(tiff_path, interval, resolution=None, tile_size=DEFAULT_TILE_SIZE, progress=None):
+    """Retourne le chemin du GeoJSON (en CONTOUR_CRS) des courbes d'une couche raster.
+
+    ``progress`` est transmis à la reprojection puis au calcul des courbes.
+    """
+    key = RasterCache.make_key("contours", CACHE_VERSION, file_digest(tiff_path), interval, resolution)
+    cached = reprojection_cache().get(key, suffix=".geojson")
+    if cached is not None:
+        return cached
+    metric_path = cached_reproject_tiff(tiff_path, CONTOUR_CRS, resampling=DEFAULT_RESAMPLING["MNT"], resolution=resolution,
+                                        progress=progress)
+
+    def write_contours(output_path):
+        with open(output_path, "w", encoding="utf-8") as f:
+            json.dump(contours_to_geojson(generate_contours(metric_path, interval, tile_size, progress)), f)
+
+    return reprojection_cache().get_or_create(key, write_contours, suffix=".geojson")
+
+
+# Fonction pour exporter des courbes en DXF
+def contours_to_dxf(geojson_path, interval):
+    """Retourne le texte DXF des courbes : polylignes 2D à l'élévation de leur cote."""
+    import ezdxf
+
+    with open(geojson_path, encoding="utf-8") as f:
+        collection = json.load(f)
+    doc = ezdxf.new("R2010")
+    doc.layers.add("COURBES", color=8)
+    doc.layers.add("COURBES_MAITRESSES", color=1)
+    msp = doc.modelspace()
+    for feature in collection["features"]:
+        level = feature["properties"]["elevation"]
+        major = round(level / interval) % MAJOR_EVERY == 0
+        geometry = shape(feature["geometry"])
+        for line in getattr(geometry, "geoms", [geometry]):
+            msp.add_lwpolyline(
+                list(line.coords),
+                dxfattribs={"layer": "COURBES_MAITRESSES" if major else "COURBES", "elevation": level},
+                close=line.is_closed,
+            )
+    stream = StringIO()
+    doc.write(stream)
+    return stream.getvalue()
@@ -0,0 +1,192 @@
+"""Pyramide de densité des défauts routiers, pré-agrégée par cellule de tuile.
+
+Pour chaque niveau de zoom de ``DENSITY_MIN_ZOOM`` à ``DENSITY_MAX_ZOOM``, la
+table ``Defauts_densite`` compte les défauts et retient leur gravité maximale
+par cellule (tuile Web Mercator x, y du niveau), par catégorie et par mois.
+La mise à jour est incrémentale : seuls les défauts d'identifiant supérieur au
+dernier agrégé sont lus. Une suppression ou une modification d'un défaut déjà
+agrégé marque la pyramide à reconstruire (déclencheurs).
+
+La carte lit les cellules du niveau adapté à l'emprise affichée au lieu
+d'envoyer les défauts eux-mêmes au navigateur.
+"""
+import math
+from functools import lru_cache
+
+import numpy as np
+
+from defect_store import ROUTES_DEFAUTS_DB, defect_store
+
+DENSITY_MIN_ZOOM = 4
+DENSITY_MAX_ZOOM = 16
+# Nombre de cellules visées sur la largeur de la vue
+CELLS_PER_VIEW = 48
+REFRESH_CHUNK = 200000
+
+DENSITY_STATEMENTS = [
+    """CREATE TABLE IF NOT EXISTS Defauts_densite (
+        zoom INTEGER NOT NULL,
+        tile_x INTEGER NOT NULL,
+        tile_y INTEGER NOT NULL,
+        categorie TEXT NOT NULL,
+        mois TEXT NOT NULL,
+        nombre INTEGER NOT NULL,
+        gravite_max INTEGER NOT NULL,
+        PRIMARY KEY (zoom, tile_x, tile_y, categorie, mois)
+    ) WITHOUT ROWID""",
+    "CREATE TABLE IF NOT EXISTS Defauts_densite_etat (cle TEXT PRIMARY KEY, valeur INTEGER NOT NULL)",
+    "INSERT OR IGNORE INTO Defauts_densite_etat VALUES ('dernier_id', 0), ('a_reconstruire', 0)",
+    """CREATE TRIGGER IF NOT EXISTS Defauts_densite_delete AFTER DELETE ON Defauts
+    WHEN old.id <= (SELECT valeur FROM Defauts_densite_etat WHERE cle = 'dernier_id') BEGIN
+        UPDATE Defauts_densite_etat SET valeur = 1 WHERE cle = 'a_reconstruire';
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS Defauts_densite_update AFTER UPDATE ON Defauts
+    WHEN old.id <= (SELECT valeur FROM Defauts_densite_etat WHERE cle = 'dernier_id') BEGIN
+        UPDATE Defauts_densite_etat SET valeur = 1 WHERE cle = 'a_reconstruire';
+    END""",
+]
+
+# Lecture des défauts à agréger selon la variante de schéma : (id, lon, lat, catégorie, gravité, date)
+SOURCE_QUERIES = {
+    "routes_defauts": "SELECT id, longitude, latitude, categorie, gravite, date FROM Defauts "
+                      "WHERE id > ? ORDER BY id LIMIT ?",
+    "ageroute": "SELECT d.id, d.longitude, d.latitude, d.type_defaut, 0, COALESCE(m.date, '') FROM Defauts d "
+                "LEFT JOIN Missions m ON m.id = d.mission_id WHERE d.id > ? ORDER BY d.id LIMIT ?",
+}
+
+
+# Fonction pour calculer les indices de tuile Web Mercator de points
+def tile_indices(lons, lats, zoom):
+    """Retourne les indices (x, y) des tuiles du niveau ``zoom`` contenant les points."""
+    n = 2 ** zoom
+    lats = np.clip(np.asarray(lats, dtype=np.float64), -85.05112878, 85.05112878)
+    x = np.floor((np.asarray(lons, dtype=np.float64) + 180.0) / 360.0 * n)
+    y = np.floor((1.0 - np.arcsinh(np.tan(np.radians(lats))) / math.pi) / 2.0 * n)
+    return np.clip(x, 0, n - 1).astype(np.int64), np.clip(y, 0, n - 1).astype(np.int64)
+
+
+# Fonction pour calculer le centre (lat, lon) de cellules
+def cell_centers(tile_x, tile_y, zoom):
+    """Retourne les latitudes et longitudes des centres des tuiles (x, y) du niveau ``zoom``."""
+    n = 2 ** zoom
+    lons = (np.asarray(tile_x) + 0.5) / n * 360.0 - 180.0
+    lats = np.degrees(np.arctan(np.sinh(math.pi * (1 - 2 * (np.asarray(tile_y) + 0.5) / n))))
+    return lats, lons
+
+
+# Fonction pour choisir le niveau d'agrégation adapté à une emprise
+def zoom_for_bounds(south, west, north, east, cells=CELLS_PER_VIEW):
+    """Retourne le niveau dont environ ``cells`` cellules couvrent la largeur de l'emprise."""
+    width = max(east - west, 1e-9)
+    zoom = math.floor(math.log2(360.0 * cells / width))
+    return min(max(zoom, DENSITY_MIN_ZOOM), DENSITY_MAX_ZOOM)
+
+
+class DensityPyramid:
+    """Agrégats de densité des défauts d'une base ``DefectStore``."""
+
+    def __init__(self, store):
+        self.store = store
+        with store.transaction() as cursor:
+            for statement in DENSITY_STATEMENTS:
+                cursor.execute(statement)
+
+    def state(self, key):
+        return self.store.query("SELECT valeur FROM Defauts_densite_etat WHERE cle = ?", (key,))[0]["valeur"]
+
+    def refresh(self):
+        """Agrège les défauts ajoutés depuis la dernière mise à jour ; retourne leur nombre."""
+        if self.state("a_reconstruire"):
+            return self.rebuild()
+        added = 0
+        while True:
+            with self.store.transaction() as cursor:
+                last_id = cursor.execute("SELECT valeur FROM Defauts_densite_etat WHERE cle = 'dernier_id'").fetchone()[0]
+                rows = cursor.execute(SOURCE_QUERIES[self.store.kind], (last_id, REFRESH_CHUNK)).fetchall()
+                if not rows:
+                    return added
+                self.aggregate(cursor, rows)
+                cursor.execute("UPDATE Defauts_densite_etat SET valeur = ? WHERE cle = 'dernier_id'", (rows[-1][0],))
+            added += len(rows)
+
+    def aggregate(self, cursor, rows):
+        """Ajoute un lot de défauts (id, lon, lat, catégorie, gravité, date) à tous les niveaux."""
+        _, lons, lats, categories, gravities, dates = zip(*rows)
+        tile_x, tile_y = tile_indices(lons, lats, DENSITY_MAX_ZOOM)
+        category_names, category = np.unique(np.array(categories, dtype=str), return_inverse=True)
+        month_names, month = np.unique(np.array([str(date)[:7] for date in dates], dtype=str), return_inverse=True)
+        gravities = np.array(gravities, dtype=np.int64)
+        labels = len(category_names) * len(month_names)
+        # Les niveaux inférieurs se déduisent du niveau maximal par décalage de bits ;
+        # chaque niveau est agrégé en mémoire puis fusionné (une ligne par cellule)
+        for zoom in range(DENSITY_MIN_ZOOM, DENSITY_MAX_ZOOM + 1):
+            shift = DENSITY_MAX_ZOOM - zoom
+            cell = ((tile_x >> shift) << zoom) + (tile_y >> shift)
+            keys, inverse = np.unique(cell * labels + category.ravel() * len(month_names) + month.ravel(), return_inverse=True)
+            inverse = inverse.ravel()
+            counts = np.bincount(inverse)
+            maxima = np.full(len(keys), np.iinfo(np.int64).min)
+            np.maximum.at(maxima, inverse, gravities)
+            cells, label = np.divmod(keys, labels)
+            cursor.executemany(
+                "INSERT INTO Defauts_densite VALUES (?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT DO UPDATE SET nombre = nombre + excluded.nombre, "
+                "gravite_max = MAX(gravite_max, excluded.gravite_max)",
+                zip([zoom] * len(keys), (cells >> zoom).tolist(), (cells & ((1 << zoom) - 1)).tolist(),
+                    category_names[label // len(month_names)].tolist(), month_names[label % len(month_names)].tolist(),
+                    counts.tolist(), maxima.tolist()),
+            )
+
+    def rebuild(self):
+        """Recalcule toute la pyramide (après suppression ou modification de défauts)."""
+        with self.store.transaction() as cursor:
+            cursor.execute("DELETE FROM Defauts_densite")
+            cursor.execute("UPDATE Defauts_densite_etat SET valeur = 0")
+        return self.refresh()
+
+    def categories(self):
+        """Retourne les catégories présentes dans la pyramide."""
+        return [row["categorie"] for row in self.store.query(
+            "SELECT DISTINCT categorie FROM Defauts_densite WHERE zoom = ? ORDER BY categorie", (DENSITY_MIN_ZOOM,))]
+
+    def months(self):
+        """Retourne les mois (AAAA-MM) présents dans la pyramide."""
+        return [row["mois"] for row in self.store.query(
+            "SELECT DISTINCT mois FROM Defauts_densite WHERE zoom = ? ORDER BY mois", (DENSITY_MIN_ZOOM,))]
+
+    def cells(self, south, west, north, east, zoom=None, categories=None, months=None):
+        """Retourne les cellules de l'emprise : dictionnaire de tableaux lat, lon, nombre, gravite_max, zoom.
+
+        ``categories`` restreint aux catégories listées ; ``months`` est un couple
+        (premier, dernier) de mois AAAA-MM inclus.
+        """
+        if zoom is None:
+            zoom = zoom_for_bounds(south, west, north, east)
+        (x0, x1), (y0, y1) = tile_indices([west, east], [north, south], zoom)
+        sql = ("SELECT tile_x, tile_y, SUM(nombre) AS nombre, MAX(gravite_max) AS gravite_max FROM Defauts_densite "
+               "WHERE zoom = ? AND tile_x BETWEEN ? AND ? AND tile_y BETWEEN ? AND ?")
+        parameters = [zoom, int(x0), int(x1), int(y0), int(y1)]
+        if categories:
+            sql += f" AND categorie IN ({', '.join('?' * len(categories))})"
+            parameters.extend(categories)
+        if months:
+            sql += " AND mois BETWEEN ? AND ?"
+            parameters.extend(months)
+        rows = self.store.query(sql + " GROUP BY tile_x, tile_y", parameters)
+        tile_x = np.array([row["tile_x"] for row in rows], dtype=np.int64)
+        tile_y = np.array([row["tile_y"] for row in rows], dtype=np.int64)
+        lats, lons = cell_centers(tile_x, tile_y, zoom)
+        return {
+            "lat": lats,
+            "lon": lons,
+            "nombre": np.array([row["nombre"] for row in rows], dtype=np.int64),
+            "gravite_max": np.array([row["gravite_max"] for row in rows], dtype=np.int64),
+            "zoom": zoom,
+        }
+
+
+# Fonction pour obtenir la pyramide de densité d'une base (une par processus)
+@lru_cache(maxsize=None)
+def density_pyramid(path=ROUTES_DEFAUTS_DB):
+    """Retourne la ``DensityPyramid`` partagée de la base."""
+    return DensityPyramid(defect_store(path))
@@ -0,0 +1,210 @@
+"""Accès aux défauts routiers (``routes_defauts.db`` et ``ageroute.db``) avec index spatial.
+
+À l'ouverture, la base est mise en mode WAL et complétée (si besoin) :
+
+- d'une table virtuelle R*Tree ``Defauts_rtree`` sur les coordonnées des
+  défauts, remplie depuis les lignes existantes puis tenue à jour par des
+  déclencheurs, quel que soit l'auteur des écritures ;
+- d'index composites : (route, date) et (categorie, gravite) pour
+  ``routes_defauts.db`` ; (route_id, date) des missions et
+  (mission_id, type_defaut) des défauts pour ``ageroute.db``.
+
+Une seule connexion est partagée par base et par processus (verrou pour les
+fils d'exécution de Streamlit). L'ingestion en masse passe par ``executemany``
+par lots, chaque lot dans sa propre transaction.
+"""
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+from functools import lru_cache
+
+ROOT_DIR = os.path.dirname(os.path.abspath(__file__))
+ROUTES_DEFAUTS_DB = os.path.join(ROOT_DIR, "routes_defauts.db")
+AGEROUTE_DB = os.path.join(ROOT_DIR, "ageroute.db")
+DEFAULT_BATCH_SIZE = 10000
+
+# Schéma de ``routes_defauts.db`` (créé si la base est vide)
+DEFAUTS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS Defauts (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    route TEXT NOT NULL,
+    categorie TEXT NOT NULL,
+    gravite INTEGER NOT NULL,
+    latitude REAL NOT NULL,
+    longitude REAL NOT NULL,
+    date TEXT NOT NULL,
+    heure TEXT NOT NULL,
+    ville TEXT NOT NULL
+)
+"""
+
+# Table R*Tree et déclencheurs (insertion, mise à jour, suppression) qui la synchronisent
+RTREE_STATEMENTS = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS Defauts_rtree USING rtree(id, min_lon, max_lon, min_lat, max_lat)",
+    """CREATE TRIGGER IF NOT EXISTS Defauts_rtree_insert AFTER INSERT ON Defauts BEGIN
+        INSERT INTO Defauts_rtree VALUES (new.id, new.longitude, new.longitude, new.latitude, new.latitude);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS Defauts_rtree_update AFTER UPDATE OF id, latitude, longitude ON Defauts BEGIN
+        DELETE FROM Defauts_rtree WHERE id = old.id;
+        INSERT INTO Defauts_rtree VALUES (new.id, new.longitude, new.longitude, new.latitude, new.latitude);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS Defauts_rtree_delete AFTER DELETE ON Defauts BEGIN
+        DELETE FROM Defauts_rtree WHERE id = old.id;
+    END""",
+]
+
+# Index composites selon la variante de schéma (colonnes de la table Defauts)
+INDEXES = {
+    "routes_defauts": [
+        "CREATE INDEX IF NOT EXISTS idx_defauts_route_date ON Defauts (route, date)",
+        "CREATE INDEX IF NOT EXISTS idx_defauts_categorie_gravite ON Defauts (categorie, gravite)",
+    ],
+    "ageroute": [
+        "CREATE INDEX IF NOT EXISTS idx_missions_route_date ON Missions (route_id, date)",
+        "CREATE INDEX IF NOT EXISTS idx_defauts_mission_type ON Defauts (mission_id, type_defaut)",
+    ],
+}
+
+
+class DefectStore:
+    """Connexion partagée à une base de défauts, avec requêtes par emprise et ingestion par lots."""
+
+    def __init__(self, path=ROUTES_DEFAUTS_DB):
+        self.path = path
+        self.lock = threading.RLock()
+        self.connection = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.execute("PRAGMA temp_store=MEMORY")
+        self.connection.execute("PRAGMA cache_size=-65536")
+        self.ensure_schema()
+
+    def ensure_schema(self):
+        """Crée (une fois) la table R*Tree, ses déclencheurs et les index composites."""
+        with self.transaction() as cursor:
+            if not self.columns("Defauts"):
+                cursor.execute(DEFAUTS_SCHEMA)
+            self.defect_columns = self.columns("Defauts")
+            self.kind = "ageroute" if "mission_id" in self.defect_columns else "routes_defauts"
+            for statement in RTREE_STATEMENTS:
+                cursor.execute(statement)
+            for statement in INDEXES[self.kind]:
+                cursor.execute(statement)
+            # Rattrapage des défauts écrits avant la création de l'index spatial
+            cursor.execute(
+                "INSERT INTO Defauts_rtree SELECT id, longitude, longitude, latitude, latitude FROM Defauts "
+                "WHERE id > (SELECT COALESCE(MAX(id), 0) FROM Defauts_rtree)"
+            )
+
+    def columns(self, table):
+        """Retourne les noms des colonnes d'une table (liste vide si elle n'existe pas)."""
+        return [row["name"] for row in self.connection.execute(f'PRAGMA table_info("{table}")')]
+
+    @contextmanager
+    def transaction(self):
+        """Exécute un bloc dans une transaction (verrou partagé entre fils d'exécution)."""
+        with self.lock:
+            cursor = self.connection.cursor()
+            cursor.execute("BEGIN IMMEDIATE")
+            try:
+                yield cursor
+            except BaseException:
+                cursor.execute("ROLLBACK")
+                raise
+            cursor.execute("COMMIT")
+
+    def query(self, sql, parameters=()):
+        """Exécute une requête de lecture et retourne ses lignes sous forme de dictionnaires."""
+        with self.lock:
+            return [dict(row) for row in self.connection.execute(sql, parameters)]
+
+    def in_bbox(self, min_lon, min_lat, max_lon, max_lat, **filters):
+        """Retourne les défauts compris dans l'emprise, filtrés par colonne (égalité).
+
+        L'emprise est d'abord résolue par l'index R*Tree (coordonnées arrondies
+        en float32 vers l'extérieur), puis affinée sur les coordonnées exactes.
+        """
+        conditions = ["d.longitude BETWEEN ? AND ?", "d.latitude BETWEEN ? AND ?"]
+        parameters = [min_lon, min_lat, max_lon, max_lat, min_lon, max_lon, min_lat, max_lat]
+        for column, value in filters.items():
+            if column not in self.defect_columns:
+                raise ValueError(f"Colonne inconnue : {column}")
+            conditions.append(f'd."{column}" = ?')
+            parameters.append(value)
+        return self.query(
+            "SELECT d.* FROM Defauts_rtree r JOIN Defauts d ON d.id = r.id "
+            "WHERE r.max_lon >= ? AND r.max_lat >= ? AND r.min_lon <= ? AND r.min_lat <= ? AND "
+            + " AND ".join(conditions),
+            parameters,
+        )
+
+    def for_route(self, route, date_from=None, date_to=None):
+        """Retourne les défauts d'une route (nom ou identifiant), éventuellement entre deux dates."""
+        if self.kind == "ageroute":
+            sql = ("SELECT d.*, m.route_id, m.date FROM Missions m JOIN Defauts d ON d.mission_id = m.id "
+                   "WHERE m.route_id = ?")
+            date_column = "m.date"
+        else:
+            sql = "SELECT * FROM Defauts WHERE route = ?"
+            date_column = "date"
+        parameters = [route]
+        if date_from is not None:
+            sql += f" AND {date_column} >= ?"
+            parameters.append(date_from)
+        if date_to is not None:
+            sql += f" AND {date_column} <= ?"
+            parameters.append(date_to)
+        return self.query(sql + f" ORDER BY {date_column}", parameters)
+
+    def ingest(self, records, batch_size=DEFAULT_BATCH_SIZE, progress=None):
+        """Insère des défauts (dictionnaires ou tuples dans l'ordre des colonnes) par lots.
+
+        Chaque lot de ``batch_size`` lignes est inséré par un seul
+        ``executemany`` dans sa propre transaction, puis indexé dans le R*Tree
+        par ordre spatial. Retourne le nombre de lignes insérées.
+        """
+        columns = [column for column in self.defect_columns if column != "id"]
+        sql = f'INSERT INTO Defauts ({", ".join(columns)}) VALUES ({", ".join("?" * len(columns))})'
+        inserted = 0
+        batch = []
+
+        def flush():
+            # Le déclencheur d'insertion est suspendu le temps du lot (la transaction
+            # bloque les autres écrivains) : l'index R*Tree est complété en une requête.
+            with self.transaction() as cursor:
+                last_id = cursor.execute("SELECT COALESCE(MAX(id), 0) FROM Defauts").fetchone()[0]
+                cursor.execute("DROP TRIGGER IF EXISTS Defauts_rtree_insert")
+                cursor.executemany(sql, batch)
+                cursor.execute(
+                    "INSERT INTO Defauts_rtree SELECT id, longitude, longitude, latitude, latitude FROM Defauts "
+                    "WHERE id > ? ORDER BY CAST(latitude * 100 AS INTEGER), longitude", (last_id,)
+                )
+                cursor.execute(RTREE_STATEMENTS[1])
+            batch.clear()
+
+        for record in records:
+            batch.append(tuple(record[column] for column in columns) if isinstance(record, dict) else tuple(record))
+            if len(batch) >= batch_size:
+                inserted += len(batch)
+                flush()
+                if progress is not None:
+                    progress(inserted)
+        if batch:
+            inserted += len(batch)
+            flush()
+            if progress is not None:
+                progress(inserted)
+        return inserted
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+
+# Fonction pour obtenir la connexion partagée d'une base (une par processus)
+@lru_cache(maxsize=None)
+def defect_store(path=ROUTES_DEFAUTS_DB):
+    """Retourne le ``DefectStore`` partagé de la base."""
+    return DefectStore(os.path.abspath(path))
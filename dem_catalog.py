@@ -0,0 +1,166 @@
+"""Catalogue spatial des dalles MNT nationales de ``raster_files/``.
+
+Les emprises des dalles (N4W3.tif ... N10W9.tif) sont lues une fois puis
+enregistrées dans ``catalog.json`` à côté des dalles ; le catalogue est
+reconstruit si la liste des fichiers ou leurs dates changent. Un ``STRtree``
+sur ces emprises permet de n'ouvrir que les dalles qui recoupent une zone
+d'intérêt, assemblées dans une mosaïque virtuelle (VRT) limitée à cette zone.
+"""
+import json
+import math
+import os
+from functools import lru_cache
+from xml.sax.saxutils import escape
+
+import rasterio
+from rasterio.crs import CRS
+from rasterio.warp import transform_bounds
+from shapely import STRtree
+from shapely.geometry import box
+
+from raster_cache import RasterCache
+from raster_io import reprojection_cache
+
+DEFAULT_TILE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "raster_files")
+CATALOG_NAME = "catalog.json"
+CATALOG_VERSION = 1
+
+
+# Fonction pour lister les dalles d'un répertoire avec leur signature
+def tile_signatures(directory):
+    """Retourne {nom: [taille, date de modification]} des GeoTIFF du répertoire."""
+    signatures = {}
+    for entry in os.scandir(directory):
+        if entry.is_file() and entry.name.lower().endswith((".tif", ".tiff")):
+            stat = entry.stat()
+            signatures[entry.name] = [stat.st_size, stat.st_mtime_ns]
+    return signatures
+
+
+# Fonction pour lire les métadonnées des dalles
+def scan_tiles(directory):
+    """Lit emprise, CRS, résolution, type et nodata de chaque dalle du répertoire."""
+    tiles = []
+    for name in sorted(tile_signatures(directory)):
+        with rasterio.open(os.path.join(directory, name)) as src:
+            tiles.append({
+                "name": name,
+                "bounds": list(src.bounds),
+                "crs": src.crs.to_wkt(),
+                "width": src.width,
+                "height": src.height,
+                "res": list(src.res),
+                "dtype": src.dtypes[0],
+                "nodata": src.nodata,
+            })
+    return tiles
+
+
+class DemCatalog:
+    """Index spatial des dalles d'un répertoire de MNT."""
+
+    def __init__(self, directory, tiles):
+        self.directory = directory
+        self.tiles = tiles
+        self.tree = STRtree([box(*tile["bounds"]) for tile in tiles])
+
+    @classmethod
+    def load(cls, directory=DEFAULT_TILE_DIR):
+        """Charge le catalogue enregistré, ou le reconstruit s'il est absent ou périmé."""
+        catalog_path = os.path.join(directory, CATALOG_NAME)
+        signatures = tile_signatures(directory)
+        try:
+            with open(catalog_path, encoding="utf-8") as f:
+                saved = json.load(f)
+            if saved.get("version") == CATALOG_VERSION and saved.get("signatures") == signatures:
+                return cls(directory, saved["tiles"])
+        except (OSError, ValueError):
+            pass
+        tiles = scan_tiles(directory)
+        part_path = f"{catalog_path}.{os.getpid()}.part"
+        with open(part_path, "w", encoding="utf-8") as f:
+            json.dump({"version": CATALOG_VERSION, "signatures": signatures, "tiles": tiles}, f)
+        os.replace(part_path, catalog_path)
+        return cls(directory, tiles)
+
+    @property
+    def crs(self):
+        return self.tiles[0]["crs"]
+
+    def aoi_bounds(self, aoi, aoi_crs="EPSG:4326"):
+        """Retourne l'emprise (gauche, bas, droite, haut) d'une zone dans le CRS des dalles."""
+        bounds = aoi.bounds if hasattr(aoi, "bounds") else tuple(aoi)
+        if CRS.from_user_input(aoi_crs) != CRS.from_wkt(self.crs):
+            bounds = transform_bounds(aoi_crs, self.crs, *bounds)
+        return bounds
+
+    def intersecting(self, aoi, aoi_crs="EPSG:4326"):
+        """Retourne les dalles dont l'emprise recoupe la zone (géométrie ou emprise)."""
+        if not self.tiles:
+            return []
+        indices = self.tree.query(box(*self.aoi_bounds(aoi, aoi_crs)), predicate="intersects")
+        return [self.tiles[i] for i in sorted(indices)]
+
+    def vrt_document(self, aoi, aoi_crs="EPSG:4326"):
+        """Construit le XML d'une mosaïque VRT couvrant la zone, calée sur la grille des dalles."""
+        tiles = self.intersecting(aoi, aoi_crs)
+        if not tiles:
+            raise ValueError("La zone ne recoupe aucune dalle du MNT national")
+        left, bottom, right, top = self.aoi_bounds(aoi, aoi_crs)
+        res_x, res_y = tiles[0]["res"]
+        origin_x, origin_y = tiles[0]["bounds"][0], tiles[0]["bounds"][3]
+        col_min = math.floor((left - origin_x) / res_x)
+        col_max = math.ceil((right - origin_x) / res_x)
+        row_min = math.floor((origin_y - top) / res_y)
+        row_max = math.ceil((origin_y - bottom) / res_y)
+        nodata = tiles[0]["nodata"]
+        data_type = {"int16": "Int16", "uint16": "UInt16", "int32": "Int32", "float32": "Float32",
+                     "float64": "Float64", "uint8": "Byte"}[tiles[0]["dtype"]]
+        sources = []
+        for tile in tiles:
+            tile_col = round((tile["bounds"][0] - origin_x) / res_x)
+            tile_row = round((origin_y - tile["bounds"][3]) / res_y)
+            c0, c1 = max(col_min, tile_col), min(col_max, tile_col + tile["width"])
+            r0, r1 = max(row_min, tile_row), min(row_max, tile_row + tile["height"])
+            if c1 <= c0 or r1 <= r0:
+                continue
+            nodata_tag = f"<NODATA>{nodata}</NODATA>" if nodata is not None else ""
+            sources.append(
+                "<ComplexSource>"
+                f'<SourceFilename relativeToVRT="0">{escape(os.path.join(os.path.abspath(self.directory), tile["name"]))}</SourceFilename>'
+                "<SourceBand>1</SourceBand>"
+                f'<SrcRect xOff="{c0 - tile_col}" yOff="{r0 - tile_row}" xSize="{c1 - c0}" ySize="{r1 - r0}"/>'
+                f'<DstRect xOff="{c0 - col_min}" yOff="{r0 - row_min}" xSize="{c1 - c0}" ySize="{r1 - r0}"/>'
+                f"{nodata_tag}</ComplexSource>"
+            )
+        nodata_value = f"<NoDataValue>{nodata}</NoDataValue>" if nodata is not None else ""
+        return (
+            f'<VRTDataset rasterXSize="{col_max - col_min}" rasterYSize="{row_max - row_min}">'
+            f"<SRS>{escape(self.crs)}</SRS>"
+            f"<GeoTransform>{origin_x + col_min * res_x!r}, {res_x!r}, 0, {origin_y - row_min * res_y!r}, 0, {-res_y!r}</GeoTransform>"
+            f'<VRTRasterBand dataType="{data_type}" band="1">{nodata_value}{"".join(sources)}</VRTRasterBand>'
+            "</VRTDataset>"
+        )
+
+    def mosaic_path(self, aoi, aoi_crs="EPSG:4326", cache=None):
+        """Retourne le chemin d'une mosaïque VRT de la zone (mise en cache, réutilisable comme un GeoTIFF)."""
+        cache = cache or reprojection_cache()
+        document = self.vrt_document(aoi, aoi_crs)
+
+        def write_vrt(output_path):
+            with open(output_path, "w", encoding="utf-8") as f:
+                f.write(document)
+
+        return cache.get_or_create(RasterCache.make_key("dem-mosaic", document), write_vrt, suffix=".vrt")
+
+    def read(self, aoi, aoi_crs="EPSG:4326"):
+        """Lit la mosaïque de la zone : retourne (élévations masquées, transformation, CRS)."""
+        with rasterio.open(self.mosaic_path(aoi, aoi_crs)) as src:
+            return src.read(1, masked=True), src.transform, src.crs
+
+
+# Fonction pour obtenir le catalogue des dalles nationales (chargé une fois par processus)
+@lru_cache(maxsize=None)
+def national_dem_catalog(directory=DEFAULT_TILE_DIR):
+    """Retourne le ``DemCatalog`` du répertoire des dalles nationales."""
+    return DemCatalog.load(directory)
@@ -0,0 +1,345 @@
+"""Extraction automatique d'entités (bâtiments, bords de route, tas) par tuiles (sans Streamlit).
+
+L'analyse se fait sur une grille métrique (EPSG:32630) à la résolution
+demandée, calculée depuis l'orthophoto (à défaut, le MNS). Chaque source est
+lue à la volée sur cette grille par un ``WarpedVRT``, tuile par tuile avec une
+marge de recouvrement : la mémoire utilisée dépend de la taille des tuiles,
+pas de celle du site. Dans chaque tuile :
+
+- la végétation est écartée par l'indice ExG de l'orthophoto ;
+- les bâtiments sont les zones non végétales, sans teinte de chaussée (ou
+  plus hautes que ``BUILDING_HEIGHT`` si MNS et MNT sont fournis), de forme
+  proche de leur rectangle englobant ;
+- les routes sont les zones grises (saturation faible) de forme allongée ;
+  leurs contours donnent les bords de route ;
+- les tas sont les zones où MNS - MNT dépasse le seuil demandé (hors bâtiments).
+
+Les masques sont calculés sur la tuile et sa marge (les morphologies et les
+filtres de forme voient le voisinage), puis seul le cœur de la tuile est
+vectorisé. Les objets sont des zones 4-connexes (polygones valides) ; ceux
+qui touchent le bord d'un cœur sont fusionnés avec ceux des tuiles voisines,
+dont les contours coïncident au pixel près.
+"""
+import math
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import cv2
+import numpy as np
+import rasterio
+import shapely
+from pyproj import Transformer
+from rasterio import windows
+from rasterio.enums import ColorInterp, Resampling
+from rasterio.features import shapes
+from rasterio.vrt import WarpedVRT
+from rasterio.warp import calculate_default_transform
+from shapely.geometry import mapping, shape
+
+import instrumentation
+
+EXTRACTION_CRS = "EPSG:32630"
+DEFAULT_RESOLUTION = 0.5
+# Côté (pixels) du cœur des tuiles
+DEFAULT_TILE_SIZE = 1024
+# Marge lue autour du cœur (m) : les objets plus petits sont vus entiers par les tuiles qu'ils touchent
+DEFAULT_HALO = 40.0
+# Nombre de tuiles par lot confié à un processus de calcul
+TILES_PER_TASK = 2
+# En dessous de ce nombre de lots, le démarrage d'un pool coûte plus qu'il ne rapporte
+PARALLEL_MIN_TASKS = 4
+
+BUILDINGS = "Bâtiments (auto)"
+ROAD_EDGES = "Bords de route (auto)"
+STOCKPILES = "Tas (auto)"
+FEATURE_CLASSES = (BUILDINGS, ROAD_EDGES, STOCKPILES)
+
+# Seuils de classification
+VEGETATION_EXG = 0.05
+ROAD_MAX_SATURATION = 45
+ROAD_VALUE_RANGE = (70, 215)
+BUILDING_HEIGHT = 2.5
+# Rapport surface / rectangle englobant minimal d'un bâtiment, allongement minimal d'une route
+BUILDING_MIN_RECTANGULARITY = 0.8
+ROAD_MIN_ELONGATION = 4.0
+DEFAULT_MIN_AREA = 10.0
+DEFAULT_PILE_HEIGHT = 1.0
+
+
+# Fonction pour calculer la grille d'analyse d'un raster
+def analysis_grid(path, resolution=DEFAULT_RESOLUTION):
+    """Retourne (transform, largeur, hauteur) de la grille EPSG:32630 couvrant ``path`` à ``resolution`` m."""
+    with rasterio.open(path) as src:
+        return calculate_default_transform(src.crs, EXTRACTION_CRS, src.width, src.height, *src.bounds,
+                                           resolution=resolution)
+
+
+# Fonction pour découper la grille en tuiles avec marge
+def plan_tiles(width, height, tile_size, halo):
+    """Retourne les couples (cœur, fenêtre lue) : cœurs disjoints, fenêtres élargies de ``halo`` pixels."""
+    full = windows.Window(0, 0, width, height)
+    tiles = []
+    for row_off in range(0, height, tile_size):
+        for col_off in range(0, width, tile_size):
+            core = windows.Window(col_off, row_off, min(tile_size, width - col_off), min(tile_size, height - row_off))
+            read = windows.Window(col_off - halo, row_off - halo, core.width + 2 * halo, core.height + 2 * halo)
+            tiles.append((core, windows.intersection(read, full)))
+    return tiles
+
+
+# Fonction pour filtrer les composantes connexes d'un masque selon leur forme
+def filter_components(mask, min_pixels, keep):
+    """Retourne le masque réduit aux composantes d'au moins ``min_pixels`` pixels acceptées par ``keep``.
+
+    ``keep(surface, longueur, largeur)`` reçoit le nombre de pixels et les
+    côtés du rectangle d'aire minimale de la composante.
+    """
+    count, labels, stats, _ = cv2.connectedComponentsWithStats(mask.astype(np.uint8), connectivity=4)
+    kept = np.zeros(count, dtype=bool)
+    for label in np.flatnonzero(stats[:, cv2.CC_STAT_AREA] >= min_pixels):
+        if label == 0:
+            continue
+        x, y, w, h, area = stats[label]
+        rows, cols = np.nonzero(labels[y:y + h, x:x + w] == label)
+        (_, _), (side_a, side_b), _ = cv2.minAreaRect(np.column_stack([cols, rows]).astype(np.float32))
+        length, breadth = max(side_a, side_b) + 1, min(side_a, side_b) + 1
+        kept[label] = keep(area, length, breadth)
+    return kept[labels]
+
+
+# Fonction pour classer les pixels d'une tuile
+def classify_tile(rgb, height, valid, classes, resolution, min_area=DEFAULT_MIN_AREA, pile_height=DEFAULT_PILE_HEIGHT):
+    """Retourne {classe: masque booléen} pour une tuile.
+
+    ``rgb`` (3, h, w) uint8 et ``height`` (MNS - MNT, h, w) peuvent valoir None.
+    """
+    min_pixels = max(1, int(min_area / resolution ** 2))
+    kernel = np.ones((3, 3), np.uint8)
+    elevated = height >= BUILDING_HEIGHT if height is not None else None
+    vegetation = np.zeros_like(valid)
+    masks = {}
+    if rgb is not None:
+        r, g, b = rgb.astype(np.float32)
+        vegetation = (2 * g - r - b) / (r + g + b + 1) > VEGETATION_EXG
+        hsv = cv2.cvtColor(np.ascontiguousarray(rgb.transpose(1, 2, 0)), cv2.COLOR_RGB2HSV)
+        saturation, value = hsv[..., 1], hsv[..., 2]
+        gray = (saturation <= ROAD_MAX_SATURATION) & (value >= ROAD_VALUE_RANGE[0]) & (value <= ROAD_VALUE_RANGE[1])
+        if elevated is not None:
+            gray &= ~elevated
+        if BUILDINGS in classes or STOCKPILES in classes:
+            candidate = ~vegetation & (elevated if elevated is not None else ~gray)
+            candidate = cv2.morphologyEx((candidate & valid).astype(np.uint8), cv2.MORPH_OPEN, kernel) > 0
+            masks[BUILDINGS] = filter_components(
+                candidate, min_pixels, lambda area, length, breadth: area >= BUILDING_MIN_RECTANGULARITY * length * breadth)
+        if ROAD_EDGES in classes:
+            road = cv2.morphologyEx((gray & valid).astype(np.uint8), cv2.MORPH_CLOSE, np.ones((5, 5), np.uint8))
+            road = cv2.morphologyEx(road, cv2.MORPH_OPEN, kernel) > 0
+            masks[ROAD_EDGES] = filter_components(
+                road, min_pixels, lambda area, length, breadth: length >= ROAD_MIN_ELONGATION * area / length)
+    if STOCKPILES in classes and height is not None:
+        pile = (height >= pile_height) & valid & ~vegetation & ~masks.get(BUILDINGS, np.zeros_like(valid))
+        pile = cv2.morphologyEx(pile.astype(np.uint8), cv2.MORPH_OPEN, kernel) > 0
+        masks[STOCKPILES] = filter_components(pile, min_pixels, lambda area, length, breadth: True)
+    return {name: mask for name, mask in masks.items() if name in classes}
+
+
+# Fonction pour vectoriser le cœur d'un masque
+def vectorize_core(mask, transform):
+    """Retourne (polygones WKB, touche le bord) des zones vraies de ``mask`` (grille ``transform``)."""
+    height, width = mask.shape
+    left, top = transform * (0, 0)
+    right, bottom = transform * (width, height)
+    polygons, on_edge = [], []
+    for geometry, _ in shapes(mask.astype(np.uint8), mask=mask, connectivity=4, transform=transform):
+        polygon = shape(geometry)
+        minx, miny, maxx, maxy = polygon.bounds
+        polygons.append(shapely.to_wkb(polygon))
+        on_edge.append(minx <= left or maxx >= right or miny <= bottom or maxy >= top)
+    return polygons, on_edge
+
+
+class TileExtractor:
+    """Lit les sources sur la grille d'analyse et extrait les entités de lots de tuiles.
+
+    Chaque instance ouvre ses propres jeux de données : une instance par
+    processus de calcul.
+    """
+
+    def __init__(self, grid, ortho_path, mns_path, mnt_path, classes, resolution, min_area, pile_height):
+        transform, width, height = grid
+        self.transform = transform
+        self.classes = classes
+        self.options = {"resolution": resolution, "min_area": min_area, "pile_height": pile_height}
+        self.datasets = []
+        vrt_options = {"crs": EXTRACTION_CRS, "transform": transform, "width": width, "height": height}
+        self.ortho = self.open(ortho_path, vrt_options, Resampling.nearest, alpha=True) if ortho_path else None
+        self.mns = self.open(mns_path, vrt_options, Resampling.bilinear) if mns_path else None
+        self.mnt = self.open(mnt_path, vrt_options, Resampling.bilinear) if mnt_path else None
+
+    def open(self, path, vrt_options, resampling, alpha=False):
+        src = rasterio.open(path)
+        # Sans nodata ni bande alpha, une bande alpha distingue ce qui est hors du raster
+        add_alpha = alpha and src.nodata is None and ColorInterp.alpha not in src.colorinterp
+        vrt = WarpedVRT(src, resampling=resampling, add_alpha=add_alpha, **vrt_options)
+        self.datasets.extend([vrt, src])
+        return vrt
+
+    def read(self, window):
+        """Retourne (rgb, MNS - MNT, validité) d'une fenêtre de la grille."""
+        shape_ = (int(window.height), int(window.width))
+        valid = np.ones(shape_, dtype=bool)
+        rgb = height = None
+        if self.ortho is not None:
+            bands = min(self.ortho.count - (1 if self.ortho.colorinterp[-1] == ColorInterp.alpha else 0), 3)
+            rgb = self.ortho.read(list(range(1, bands + 1)), window=window)
+            if bands < 3:
+                rgb = np.repeat(rgb[:1], 3, axis=0)
+            valid &= self.ortho.read_masks(1, window=window) > 0
+            if self.ortho.colorinterp[-1] == ColorInterp.alpha:
+                valid &= self.ortho.read(self.ortho.count, window=window) > 0
+        if self.mns is not None and self.mnt is not None:
+            mns = self.mns.read(1, window=window, masked=True)
+            mnt = self.mnt.read(1, window=window, masked=True)
+            height = np.ma.getdata(mns).astype(np.float32) - np.ma.getdata(mnt).astype(np.float32)
+            dem_valid = ~np.ma.getmaskarray(mns) & ~np.ma.getmaskarray(mnt) & np.isfinite(height)
+            height = np.where(dem_valid, height, 0.0)
+            if self.ortho is None:
+                valid &= dem_valid
+        return rgb, height, valid
+
+    def process(self, tiles):
+        """Traite une liste de tuiles (cœur, fenêtre lue) et retourne {classe: (WKB, touche le bord)}."""
+        results = {name: ([], []) for name in self.classes}
+        for core, read in tiles:
+            rgb, height, valid = self.read(read)
+            if not valid.any():
+                continue
+            masks = classify_tile(rgb, height, valid, self.classes, **self.options)
+            rows = slice(int(core.row_off - read.row_off), int(core.row_off - read.row_off + core.height))
+            cols = slice(int(core.col_off - read.col_off), int(core.col_off - read.col_off + core.width))
+            core_transform = windows.transform(core, self.transform)
+            for name, mask in masks.items():
+                polygons, on_edge = vectorize_core(mask[rows, cols], core_transform)
+                results[name][0].extend(polygons)
+                results[name][1].extend(on_edge)
+        return results
+
+    def close(self):
+        for dataset in self.datasets:
+            if not dataset.closed:
+                dataset.close()
+
+
+# Extracteur propre à chaque processus du pool de calcul
+_worker_extractor = None
+
+
+def _init_worker(*args):
+    global _worker_extractor
+    _worker_extractor = TileExtractor(*args)
+
+
+def _run_worker_task(tiles):
+    return _worker_extractor.process(tiles)
+
+
+# Fonction pour fusionner les polygones de toutes les tuiles
+def merge_polygons(polygons, on_edge, resolution, min_area):
+    """Fusionne les polygones coupés par les jointures, simplifie et écarte les trop petits."""
+    geometries = shapely.from_wkb(np.asarray(polygons, dtype=object))
+    on_edge = np.asarray(on_edge, dtype=bool)
+    if on_edge.any():
+        merged = shapely.get_parts(shapely.union_all(geometries[on_edge]))
+        geometries = np.concatenate([geometries[~on_edge], merged])
+    geometries = shapely.simplify(geometries, resolution, preserve_topology=True)
+    return geometries[shapely.area(geometries) >= min_area]
+
+
+# Fonction pour convertir les géométries extraites en entités GeoJSON EPSG:4326
+def to_features(name, geometries, resolution):
+    """Retourne les entités GeoJSON (EPSG:4326) d'une classe : polygones, ou contours pour les routes."""
+    transformer = Transformer.from_crs(EXTRACTION_CRS, "EPSG:4326", always_xy=True)
+    if name == ROAD_EDGES:
+        geometries = shapely.get_parts(shapely.line_merge(shapely.boundary(geometries)))
+        geometries = geometries[shapely.length(geometries) >= 10 * resolution]
+    else:
+        geometries = shapely.get_parts(geometries)
+    surfaces = shapely.area(geometries)
+    lengths = shapely.length(geometries)
+    geometries = shapely.transform(geometries, lambda coords: np.column_stack(transformer.transform(coords[:, 0], coords[:, 1])))
+    label = name.replace(" (auto)", "")
+    features = []
+    for index, geometry in enumerate(geometries, 1):
+        properties = {"name": f"{label} {index}"}
+        if name == ROAD_EDGES:
+            properties["longueur_m"] = round(float(lengths[index - 1]), 1)
+        else:
+            properties["surface_m2"] = round(float(surfaces[index - 1]), 1)
+        features.append({"type": "Feature", "properties": properties, "geometry": mapping(geometry)})
+    return features
+
+
+# Fonction pour extraire les entités d'un site
+@instrumentation.traced()
+def extract_features(ortho_path=None, mns_path=None, mnt_path=None, classes=FEATURE_CLASSES, resolution=DEFAULT_RESOLUTION,
+                     min_area=DEFAULT_MIN_AREA, pile_height=DEFAULT_PILE_HEIGHT, workers=1, progress=None,
+                     tile_size=DEFAULT_TILE_SIZE, halo=DEFAULT_HALO):
+    """Retourne ({classe: [entités GeoJSON EPSG:4326]}, statistiques).
+
+    Les bâtiments et bords de route demandent l'orthophoto, les tas le MNS et
+    le MNT. ``halo`` (m) borne la taille des objets dont la détection ne
+    dépend pas du découpage en tuiles. Les tuiles sont traitées par lots, en série ou dans un pool de
+    processus ; ``progress(lots_traités, total)`` est appelé après chaque lot.
+    Les statistiques donnent le nombre de tuiles, la durée et le débit
+    (tuiles par seconde).
+    """
+    classes = tuple(name for name in classes if name in FEATURE_CLASSES)
+    if ortho_path is None:
+        classes = tuple(name for name in classes if name == STOCKPILES)
+    if mns_path is None or mnt_path is None:
+        classes = tuple(name for name in classes if name != STOCKPILES)
+    if not classes:
+        raise ValueError("Aucune entité ne peut être extraite avec les couches disponibles.")
+    start = time.perf_counter()
+    grid = analysis_grid(ortho_path or mns_path, resolution)
+    tiles = plan_tiles(grid[1], grid[2], tile_size, math.ceil(halo / resolution))
+    tasks = [tiles[i:i + TILES_PER_TASK] for i in range(0, len(tiles), TILES_PER_TASK)]
+    init_args = (grid, ortho_path, mns_path, mnt_path, classes, resolution, min_area, pile_height)
+    collected = {name: ([], []) for name in classes}
+
+    def collect(results):
+        for done, result in enumerate(results, 1):
+            for name, (polygons, on_edge) in result.items():
+                collected[name][0].extend(polygons)
+                collected[name][1].extend(on_edge)
+            if progress:
+                progress(done, len(tasks))
+
+    if workers <= 1 or len(tasks) < PARALLEL_MIN_TASKS:
+        extractor = TileExtractor(*init_args)
+        try:
+            collect(map(extractor.process, tasks))
+        finally:
+            extractor.close()
+    else:
+        with ProcessPoolExecutor(
+            max_workers=min(workers, len(tasks)),
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=init_args,
+        ) as pool:
+            try:
+                collect(pool.map(_run_worker_task, tasks))
+            except BaseException:
+                # Interruption (annulation levée par ``progress``...) : les lots non commencés sont abandonnés
+                pool.shutdown(wait=False, cancel_futures=True)
+                raise
+    tile_seconds = time.perf_counter() - start
+    features = {
+        name: to_features(name, merge_polygons(polygons, on_edge, resolution, min_area), resolution)
+        for name, (polygons, on_edge) in collected.items()
+    }
+    elapsed = time.perf_counter() - start
+    stats = {"tiles": len(tiles), "seconds": elapsed, "tiles_per_second": len(tiles) / tile_seconds if tile_seconds else 0.0}
+    return features, stats
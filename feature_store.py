@@ -0,0 +1,102 @@
+"""Couches d'entités dessinées par l'utilisateur, indexées par empreinte de géométrie (sans Streamlit).
+
+Une ``FeatureLayer`` range ses entités GeoJSON dans un dictionnaire dont la
+clé est l'empreinte de la géométrie canonique (type et coordonnées arrondies) :
+le test d'appartenance et l'ajout sans doublon coûtent O(1) au lieu d'une
+comparaison profonde avec chaque entité. Chaque modification incrémente le
+compteur ``version`` ; la liste ordonnée des entités et la FeatureCollection
+d'affichage sont mémorisées pour une version et recalculées seulement quand
+elle change.
+"""
+import hashlib
+import json
+
+# Décimales conservées dans la géométrie canonique (~0,1 mm en degrés)
+COORDINATE_DECIMALS = 9
+
+
+# Fonction pour arrondir récursivement des coordonnées GeoJSON
+def _rounded(coordinates):
+    if isinstance(coordinates, (int, float)):
+        return round(float(coordinates), COORDINATE_DECIMALS)
+    return [_rounded(value) for value in coordinates]
+
+
+# Fonction pour calculer l'empreinte canonique de la géométrie d'une entité
+def feature_key(feature):
+    """Retourne l'empreinte (hexadécimale) du type et des coordonnées arrondies de la géométrie."""
+    geometry = feature["geometry"]
+    canonical = json.dumps([geometry["type"], _rounded(geometry["coordinates"])], separators=(",", ":"))
+    return hashlib.blake2b(canonical.encode("utf-8"), digest_size=16).hexdigest()
+
+
+class FeatureLayer:
+    """Entités d'une couche, sans doublon de géométrie, avec compteur de version."""
+
+    def __init__(self, features=()):
+        self._features = {}
+        self.version = 0
+        self._memo = {}
+        self.extend(features)
+
+    def __len__(self):
+        return len(self._features)
+
+    def __iter__(self):
+        return iter(self.features())
+
+    def __contains__(self, feature):
+        return feature_key(feature) in self._features
+
+    def __getitem__(self, index):
+        return self.features()[index]
+
+    def touch(self):
+        """Signale une modification (propriétés d'une entité...) : incrémente la version."""
+        self.version += 1
+        self._memo = {}
+
+    def add(self, feature):
+        """Ajoute une entité si sa géométrie est absente ; retourne True si elle a été ajoutée."""
+        key = feature_key(feature)
+        if key in self._features:
+            return False
+        self._features[key] = feature
+        self.touch()
+        return True
+
+    def extend(self, features):
+        """Ajoute des entités (sans doublon) et retourne le nombre d'entités ajoutées."""
+        added = 0
+        for feature in features:
+            key = feature_key(feature)
+            if key not in self._features:
+                self._features[key] = feature
+                added += 1
+        if added:
+            self.touch()
+        return added
+
+    def pop(self, index):
+        """Retire et retourne l'entité de rang ``index``."""
+        feature = self.features()[index]
+        del self._features[feature_key(feature)]
+        self.touch()
+        return feature
+
+    def features(self):
+        """Liste des entités dans l'ordre d'ajout (mémorisée pour la version courante)."""
+        if "features" not in self._memo:
+            self._memo["features"] = list(self._features.values())
+        return self._memo["features"]
+
+    def geojson(self, default_name=""):
+        """FeatureCollection d'affichage : géométries et nom (``default_name`` à défaut), mémorisée par version."""
+        memo_key = ("geojson", default_name)
+        if memo_key not in self._memo:
+            self._memo[memo_key] = {"type": "FeatureCollection", "features": [
+                {"type": "Feature", "geometry": feature["geometry"],
+                 "properties": {"name": (feature.get("properties") or {}).get("name") or default_name}}
+                for feature in self._features.values()
+            ]}
+        return self._memo[memo_key]
@@ -0,0 +1,224 @@
+"""Mesures légères des étapes coûteuses : durées, mémoire et compteurs (sans Streamlit).
+
+Une ``Trace`` rassemble les mesures d'une exécution du script ou d'une tâche de
+fond : des intervalles (``span``) datés, avec la durée et la mémoire résidente
+du processus avant et après l'étape, et des compteurs (octets lus par raster,
+taille des données envoyées à la carte...). La trace courante est portée par
+une variable de contexte, propre à chaque fil d'exécution.
+
+Lorsque l'instrumentation est désactivée (par défaut, sauf si la variable
+d'environnement ``APP_INSTRUMENTATION`` vaut 1), ``start_trace`` ne crée pas
+de trace et ``span`` retourne un gestionnaire de contexte vide partagé : le
+coût d'un point de mesure se réduit à la lecture de la variable de contexte.
+Les étapes exécutées dans les processus de calcul (volumes, extraction) ne
+sont mesurées que globalement, depuis le processus principal.
+
+Les traces terminées sont conservées en mémoire (les plus récentes) et, si
+``APP_TRACE_FILE`` désigne un fichier, y sont ajoutées au format JSON lines
+(une ligne par intervalle et une ligne de compteurs par trace) pour être
+agrégées entre utilisateurs. L'activation concerne tout le processus :
+l'application ne propose de la changer que si ``APP_INSTRUMENTATION_ADMIN``
+vaut 1.
+"""
+import contextvars
+import functools
+import json
+import os
+import threading
+import time
+import uuid
+from collections import deque
+
+ENABLED_BY_DEFAULT = os.environ.get("APP_INSTRUMENTATION", "") not in ("", "0")
+TRACE_FILE = os.environ.get("APP_TRACE_FILE") or None
+# Activation modifiable depuis l'interface (réservée à l'administrateur du déploiement)
+ADMIN_TOGGLE = os.environ.get("APP_INSTRUMENTATION_ADMIN", "") not in ("", "0")
+# Nombre de traces terminées conservées en mémoire
+RECENT_TRACES = 20
+
+_PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+_enabled = ENABLED_BY_DEFAULT
+_current = contextvars.ContextVar("instrumentation_trace", default=None)
+_recent = deque(maxlen=RECENT_TRACES)
+_file_lock = threading.Lock()
+
+
+# Fonction pour lire la mémoire résidente du processus (en octets)
+def rss_bytes():
+    """Mémoire résidente courante (``/proc/self/statm``) ou maximale à défaut."""
+    try:
+        with open("/proc/self/statm", "rb") as f:
+            return int(f.read().split()[1]) * _PAGE_SIZE
+    except (OSError, IndexError, ValueError):
+        import resource
+
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+class Trace:
+    """Intervalles et compteurs mesurés pendant une exécution ou une tâche."""
+
+    def __init__(self, name, attributes=None):
+        self.id = uuid.uuid4().hex
+        self.name = name
+        self.attributes = attributes or {}
+        self.started = time.time()
+        self.origin = time.perf_counter()
+        self.finished = None
+        self.spans = []
+        self.counters = {}
+        self.depth = 0
+        self.lock = threading.Lock()
+
+    def count(self, name, value=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def records(self):
+        """Enregistrements (dictionnaires) de la trace : un par intervalle, puis les compteurs."""
+        base = {"trace": self.id, "trace_name": self.name, "timestamp": self.started, **self.attributes}
+        records = [{**base, "kind": "span", **span} for span in self.spans]
+        records.append({**base, "kind": "counters", "counters": dict(self.counters),
+                        "duration_ms": round(((self.finished or time.time()) - self.started) * 1000, 3)})
+        return records
+
+    def to_jsonl(self):
+        """Trace au format JSON lines."""
+        return "".join(json.dumps(record, ensure_ascii=False, default=str) + "\n" for record in self.records())
+
+
+class _Span:
+    """Intervalle mesuré : durée et mémoire résidente avant / après."""
+
+    __slots__ = ("trace", "name", "attributes", "start", "rss", "depth")
+
+    def __init__(self, trace, name, attributes):
+        self.trace = trace
+        self.name = name
+        self.attributes = attributes
+
+    def __enter__(self):
+        self.depth = self.trace.depth
+        self.trace.depth += 1
+        self.rss = rss_bytes()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        end = time.perf_counter()
+        rss = rss_bytes()
+        self.trace.depth -= 1
+        record = {
+            "name": self.name, "depth": self.depth,
+            "start_ms": round((self.start - self.trace.origin) * 1000, 3),
+            "duration_ms": round((end - self.start) * 1000, 3),
+            "rss_mb": round(rss / 1024 ** 2, 1), "rss_delta_mb": round((rss - self.rss) / 1024 ** 2, 1),
+        }
+        if exc_type is not None:
+            record["error"] = exc_type.__name__
+        if self.attributes:
+            record["attributes"] = self.attributes
+        with self.trace.lock:
+            self.trace.spans.append(record)
+        return False
+
+
+class _NullSpan:
+    """Intervalle vide (instrumentation désactivée)."""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_SPAN = _NullSpan()
+
+
+# Fonction pour activer ou désactiver l'instrumentation (pour les traces suivantes)
+def enable(flag=True):
+    global _enabled
+    _enabled = bool(flag)
+
+
+# Fonction pour savoir si les prochaines traces seront mesurées
+def enabled():
+    return _enabled
+
+
+# Fonction pour commencer la trace du fil d'exécution courant
+def start_trace(name, **attributes):
+    """Crée et rend courante une nouvelle trace ; retourne None (aucune mesure) si l'instrumentation est désactivée."""
+    trace = Trace(name, attributes) if _enabled else None
+    _current.set(trace)
+    return trace
+
+
+# Fonction pour obtenir la trace du fil d'exécution courant (None si aucune mesure)
+def current_trace():
+    return _current.get()
+
+
+# Fonction pour terminer une trace : conservée en mémoire et exportée au format JSON lines
+def finish_trace(trace, path=None, finished=None):
+    """Termine ``trace`` (sans effet si None) et l'ajoute au fichier ``path`` (``APP_TRACE_FILE`` par défaut)."""
+    if trace is None or trace.finished is not None:
+        return
+    trace.finished = finished or time.time()
+    _recent.append(trace)
+    path = path or TRACE_FILE
+    if path:
+        lines = trace.to_jsonl()
+        with _file_lock, open(path, "a", encoding="utf-8") as f:
+            f.write(lines)
+
+
+# Fonction pour terminer une trace interrompue avant son ``finish_trace`` (exécution arrêtée en cours de route)
+def finish_interrupted_trace(trace, path=None):
+    """Termine ``trace`` si elle ne l'est pas encore, datée de la fin de son dernier intervalle."""
+    if trace is None or trace.finished is not None:
+        return
+    with trace.lock:
+        last_ms = max((span["start_ms"] + span["duration_ms"] for span in trace.spans), default=0.0)
+        trace.attributes["interrupted"] = True
+    finish_trace(trace, path, finished=trace.started + last_ms / 1000)
+
+
+# Fonction pour lister les traces terminées (tâches de fond comprises), éventuellement d'une seule session
+def recent_traces(session=None):
+    """Traces terminées conservées, de la plus récente à la plus ancienne ; ``session`` filtre sur l'attribut de même nom."""
+    return [trace for trace in reversed(_recent) if session is None or trace.attributes.get("session") == session]
+
+
+# Fonction pour mesurer une étape : ``with span("reprojection", source=...):``
+def span(name, **attributes):
+    trace = _current.get()
+    if trace is None:
+        return _NULL_SPAN
+    return _Span(trace, name, attributes)
+
+
+# Fonction pour incrémenter un compteur de la trace courante
+def count(name, value=1):
+    trace = _current.get()
+    if trace is not None:
+        trace.count(name, value)
+
+
+# Décorateur mesurant chaque appel d'une fonction
+def traced(name=None):
+    def decorate(function):
+        label = name or function.__name__
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            trace = _current.get()
+            if trace is None:
+                return function(*args, **kwargs)
+            with _Span(trace, label, None):
+                return function(*args, **kwargs)
+        return wrapper
+    return decorate
@@ -0,0 +1,171 @@
+"""File de tâches longues (volumes, courbes de niveau, export) exécutées hors du script Streamlit.
+
+Chaque tâche est désignée par une clé calculée à partir de ses paramètres :
+soumettre une clé déjà connue retourne la tâche existante (en cours ou
+terminée) au lieu de relancer le calcul. Les tâches s'exécutent dans un pool
+de fils d'exécution (les calculs lourds y lancent leurs propres processus) ;
+la table des tâches vit aussi longtemps que l'objet ``JobQueue``, c'est-à-dire
+au-delà des réexécutions du script lorsqu'il est partagé par
+``st.cache_resource``.
+
+L'annulation est coopérative : la fonction d'une tâche reçoit la ``Job`` et
+appelle ``job.report(fait, total)`` (ou ``job.check()``) entre deux étapes,
+ce qui lève ``JobCancelled`` si l'annulation a été demandée. Lorsque
+l'instrumentation est active, chaque tâche est mesurée dans sa propre trace
+(``job.trace``). Ce module n'importe pas Streamlit.
+"""
+import threading
+import time
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+
+import instrumentation
+
+PENDING = "en attente"
+RUNNING = "en cours"
+DONE = "terminée"
+FAILED = "échec"
+CANCELLED = "annulée"
+FINISHED_STATUSES = (DONE, FAILED, CANCELLED)
+
+DEFAULT_MAX_WORKERS = 2
+# Nombre de tâches terminées conservées (les plus anciennes sont oubliées)
+DEFAULT_RETENTION = 20
+
+
+class JobCancelled(Exception):
+    """Levée dans une tâche dont l'annulation a été demandée."""
+
+
+class Job:
+    """État d'une tâche : statut, progression, résultat ou erreur."""
+
+    def __init__(self, key, label=None, session=None):
+        self.key = key
+        self.label = label or key
+        self.session = session
+        self.status = PENDING
+        self.progress = 0.0
+        self.message = ""
+        self.result = None
+        self.error = None
+        self.details = None
+        self.created = time.time()
+        self.started = None
+        self.finished = None
+        self.cancel_event = threading.Event()
+        self.future = None
+        self.trace = None
+
+    @property
+    def done(self):
+        return self.status in FINISHED_STATUSES
+
+    def elapsed(self):
+        """Durée d'exécution (en secondes) écoulée ou totale."""
+        if self.started is None:
+            return 0.0
+        return (self.finished or time.time()) - self.started
+
+    def check(self):
+        """Lève ``JobCancelled`` si l'annulation de la tâche a été demandée."""
+        if self.cancel_event.is_set():
+            raise JobCancelled(self.label)
+
+    def report(self, done, total, message=None):
+        """Met à jour la progression ; utilisable comme rappel ``progress(fait, total)``."""
+        self.progress = min(done / total, 1.0) if total else 1.0
+        if message is not None:
+            self.message = message
+        self.check()
+
+
+class JobQueue:
+    """Pool de fils d'exécution et table des tâches indexée par clé."""
+
+    def __init__(self, max_workers=DEFAULT_MAX_WORKERS, retention=DEFAULT_RETENTION):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self.retention = retention
+        self.lock = threading.Lock()
+        self._jobs = {}
+
+    def submit(self, key, function, *args, label=None, session=None, **kwargs):
+        """Lance ``function(job, *args, **kwargs)`` sous la clé ``key`` et retourne sa ``Job``.
+
+        Une tâche de même clé en attente, en cours ou terminée avec succès est
+        réutilisée ; une tâche échouée ou annulée est relancée. ``session``
+        identifie la session qui lance la tâche (attribut de sa trace).
+        """
+        with self.lock:
+            job = self._jobs.get(key)
+            if job is not None and job.status not in (FAILED, CANCELLED):
+                return job
+            job = Job(key, label, session)
+            self._jobs.pop(key, None)
+            self._jobs[key] = job
+            job.future = self.executor.submit(self._run, job, function, args, kwargs)
+            self.prune()
+        return job
+
+    def _run(self, job, function, args, kwargs):
+        if job.cancel_event.is_set():
+            job.status = CANCELLED
+            return
+        job.status = RUNNING
+        job.started = time.time()
+        attributes = {"job": job.key} if job.session is None else {"job": job.key, "session": job.session}
+        job.trace = instrumentation.start_trace(f"tâche : {job.label}", **attributes)
+        try:
+            with instrumentation.span(job.label):
+                job.result = function(job, *args, **kwargs)
+            job.progress = 1.0
+            job.status = DONE
+        except JobCancelled:
+            job.status = CANCELLED
+        except Exception as e:
+            job.error = str(e) or type(e).__name__
+            job.details = traceback.format_exc()
+            job.status = FAILED
+        finally:
+            job.finished = time.time()
+            instrumentation.finish_trace(job.trace)
+
+    def get(self, key):
+        """Retourne la tâche de clé ``key`` (ou None)."""
+        with self.lock:
+            return self._jobs.get(key)
+
+    def jobs(self):
+        """Retourne les tâches connues, de la plus récente à la plus ancienne."""
+        with self.lock:
+            return list(reversed(self._jobs.values()))
+
+    def cancel(self, key):
+        """Demande l'annulation d'une tâche ; retourne False si elle est inconnue ou déjà terminée."""
+        job = self.get(key)
+        if job is None or job.done:
+            return False
+        job.cancel_event.set()
+        if job.future is not None and job.future.cancel():
+            job.status = CANCELLED
+            job.finished = time.time()
+        return True
+
+    def forget(self, key):
+        """Oublie une tâche terminée (son résultat n'est plus conservé)."""
+        with self.lock:
+            job = self._jobs.get(key)
+            if job is not None and job.done:
+                del self._jobs[key]
+
+    def prune(self):
+        """Oublie les tâches terminées les plus anciennes au-delà de ``retention``."""
+        finished = [key for key, job in self._jobs.items() if job.done]
+        for key in finished[:max(len(finished) - self.retention, 0)]:
+            del self._jobs[key]
+
+    def shutdown(self):
+        """Annule les tâches en cours et arrête le pool."""
+        for job in self.jobs():
+            job.cancel_event.set()
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,238 @@
+"""Recherche de points sur le réseau routier : coordonnée -> route/PK et PK -> coordonnée.
+
+Les routes (``routeQSD.txt`` et couches GeoJSON téléversées) sont reprojetées
+en UTM et regroupées par identifiant. Une route est découpée en nombreux
+tronçons (échangeurs, chaussées séparées, lacunes de numérisation) : son axe
+de chaînage est le plus court chemin entre ses deux extrémités les plus
+éloignées, les composantes disjointes étant reliées par leurs nœuds les plus
+proches.
+Chaque segment élémentaire connaît le PK de ses deux sommets projetés sur cet
+axe ; un ``STRtree`` sur les segments répond à la requête du plus proche
+voisin, et le chaînage inverse est une recherche dichotomique sur l'axe.
+"""
+import json
+import os
+from collections import defaultdict
+
+import numpy as np
+import shapely
+from pyproj import Transformer
+from shapely import STRtree
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components, dijkstra, minimum_spanning_tree
+from shapely.geometry import MultiLineString, Point, shape
+from shapely.ops import linemerge
+
+from vector_cache import VectorLayer
+
+ROUTE_NETWORK_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "routeQSD.txt")
+# Projection métrique des chaînages (UTM 30N, Côte d'Ivoire)
+METRIC_CRS = "EPSG:32630"
+
+_to_metric = Transformer.from_crs("EPSG:4326", METRIC_CRS, always_xy=True)
+_to_wgs84 = Transformer.from_crs(METRIC_CRS, "EPSG:4326", always_xy=True)
+# Précision (m) à laquelle deux extrémités de tronçons sont considérées confondues
+NODE_DECIMALS = 1
+
+
+# Fonction pour formater un chaînage en PK
+def format_pk(distance):
+    """Formate une distance en mètres sous la forme « PK 12+345 »."""
+    kilometres, metres = divmod(int(round(distance)), 1000)
+    return f"PK {kilometres}+{metres:03d}"
+
+
+# Fonction pour extraire les lignes (identifiant, géométrie) d'une FeatureCollection
+def line_features(geojson_data, default_name):
+    """Retourne les couples (identifiant, LineString) des entités linéaires ou surfaciques."""
+    lines = []
+    for index, feature in enumerate(geojson_data.get("features", [])):
+        geometry = feature.get("geometry")
+        if not geometry:
+            continue
+        properties = feature.get("properties") or {}
+        name = properties.get("ID") or properties.get("name") or properties.get("nom") or f"{default_name} #{index + 1}"
+        geometry = shape(geometry)
+        if geometry.geom_type in ("Polygon", "MultiPolygon"):
+            geometry = geometry.boundary
+        for part in getattr(geometry, "geoms", [geometry]):
+            if part.geom_type in ("LineString", "LinearRing") and len(part.coords) >= 2:
+                lines.append((str(name), part))
+    return lines
+
+
+# Fonction pour charger le réseau routier de référence
+def load_route_network(path=ROUTE_NETWORK_PATH):
+    """Charge le réseau ``routeQSD.txt`` (FeatureCollection GeoJSON de LineString)."""
+    with open(path, encoding="utf-8") as f:
+        return line_features(json.load(f), "Route")
+
+
+# Fonction pour calculer l'axe de chaînage d'une route découpée en tronçons
+def route_axis(sections):
+    """Retourne les sommets (n, 2) de l'axe d'une route à partir de ses tronçons métriques.
+
+    Les tronçons forment un graphe dont les nœuds sont leurs extrémités ; les
+    composantes disjointes sont reliées par leurs nœuds les plus proches (arbre
+    couvrant minimal), puis l'axe est le plus court chemin (Dijkstra) entre les
+    deux extrémités pendantes les plus éloignées à vol d'oiseau.
+    """
+    ends = np.array([[section.coords[0][:2], section.coords[-1][:2]] for section in sections]).reshape(-1, 2)
+    nodes, node_of = np.unique(np.round(ends, NODE_DECIMALS), axis=0, return_inverse=True)
+    node_of = node_of.ravel()
+    # Arête la plus courte entre deux nœuds : (longueur, tronçon ou None pour une liaison directe)
+    edges = {}
+    for index, section in enumerate(sections):
+        a, b = node_of[2 * index], node_of[2 * index + 1]
+        if a != b and section.length < edges.get((min(a, b), max(a, b)), (np.inf,))[0]:
+            edges[(min(a, b), max(a, b))] = (section.length, index)
+    if not edges:
+        # Tronçons fermés (boucles) uniquement : l'axe est la plus longue boucle
+        return np.asarray(max(sections, key=lambda section: section.length).coords)[:, :2]
+
+    def graph():
+        pairs = np.array(list(edges), dtype=int).reshape(-1, 2)
+        weights = [max(length, 1e-9) for length, _ in edges.values()]
+        return coo_matrix((weights, (pairs[:, 0], pairs[:, 1])), shape=(len(nodes), len(nodes))).tocsr()
+
+    count, component = connected_components(graph(), directed=False)
+    if count > 1:
+        # Liaison des composantes par leurs nœuds les plus proches
+        gaps = np.hypot(*(nodes[:, None] - nodes[None]).transpose(2, 0, 1))
+        members = [np.flatnonzero(component == c) for c in range(count)]
+        closest = np.full((count, count), np.inf)
+        closest_pair = {}
+        for ca in range(count):
+            for cb in range(ca + 1, count):
+                block = gaps[np.ix_(members[ca], members[cb])]
+                i, j = np.unravel_index(block.argmin(), block.shape)
+                closest[ca, cb] = block[i, j]
+                closest_pair[(ca, cb)] = (members[ca][i], members[cb][j])
+        spanning = minimum_spanning_tree(np.where(np.isfinite(closest), np.maximum(closest, 1e-9), 0)).tocoo()
+        for ca, cb in zip(spanning.row, spanning.col):
+            a, b = closest_pair[(ca, cb)]
+            edges[(min(a, b), max(a, b))] = (gaps[a, b], None)
+    matrix = graph()
+    # Extrémités de la route : les deux nœuds pendants les plus éloignés à vol d'oiseau
+    degree = np.bincount(np.array(list(edges), dtype=int).ravel(), minlength=len(nodes))
+    candidates = np.flatnonzero(degree == 1)
+    if len(candidates) < 2:
+        candidates = np.arange(len(nodes))
+    spread = np.hypot(*(nodes[candidates][:, None] - nodes[candidates][None]).transpose(2, 0, 1))
+    i, j = np.unravel_index(spread.argmax(), spread.shape)
+    first, last = candidates[i], candidates[j]
+    _, predecessors = dijkstra(matrix, directed=False, indices=first, return_predecessors=True)
+    path = [last]
+    while path[-1] != first:
+        path.append(predecessors[path[-1]])
+    path.reverse()
+    coords = [nodes[first]]
+    for a, b in zip(path[:-1], path[1:]):
+        _, index = edges[(min(a, b), max(a, b))]
+        if index is None:
+            coords.append(nodes[b])
+            continue
+        part = np.asarray(sections[index].coords)[:, :2]
+        if node_of[2 * index] != a:
+            part = part[::-1]
+        coords.extend(part[1:])
+    return np.array(coords)
+
+
+# Fonction pour projeter des points sur un axe
+def chainage_of(axis, chainage, points):
+    """Retourne le chaînage (m) de la projection de chaque point (n, 2) sur l'axe."""
+    if len(axis) == 1:
+        return np.zeros(len(points))
+    tree = STRtree(shapely.linestrings(np.stack([axis[:-1], axis[1:]], axis=1)))
+    _, segment = tree.query_nearest(shapely.points(points), all_matches=False)
+    start, direction = axis[segment], axis[segment + 1] - axis[segment]
+    length_sq = np.einsum("ij,ij->i", direction, direction)
+    t = np.clip(np.einsum("ij,ij->i", points - start, direction) / np.where(length_sq == 0, 1, length_sq), 0, 1)
+    return chainage[segment] + t * np.sqrt(length_sq)
+
+
+class PointFinder:
+    """Index des routes pour les requêtes coordonnée -> PK et PK -> coordonnée."""
+
+    def __init__(self, lines):
+        by_route = defaultdict(list)
+        for name, line in lines:
+            by_route[name].append(shapely.transform(line, lambda c: np.column_stack(_to_metric.transform(c[:, 0], c[:, 1]))))
+        self.routes = sorted(by_route)
+        # Axe de chaque route : (sommets (n, 2), chaînages cumulés (n,))
+        self.axes = {}
+        starts, ends, owners, start_pk, end_pk = [], [], [], [], []
+        for route_index, name in enumerate(self.routes):
+            merged = linemerge(MultiLineString(by_route[name])) if len(by_route[name]) > 1 else by_route[name][0]
+            sections = list(getattr(merged, "geoms", [merged]))
+            axis = route_axis(sections)
+            # PK 0 à l'extrémité la plus proche du début du premier tronçon numérisé
+            origin = np.asarray(by_route[name][0].coords[0][:2])
+            if np.hypot(*(axis[-1] - origin)) < np.hypot(*(axis[0] - origin)):
+                axis = axis[::-1]
+            chainage = np.concatenate([[0.0], np.cumsum(np.hypot(*np.diff(axis, axis=0).T))])
+            self.axes[name] = (axis, chainage)
+            vertices = [np.asarray(section.coords)[:, :2] for section in sections]
+            all_pk = np.split(chainage_of(axis, chainage, np.concatenate(vertices)), np.cumsum([len(v) for v in vertices])[:-1])
+            for coords, pk in zip(vertices, all_pk):
+                starts.append(coords[:-1])
+                ends.append(coords[1:])
+                owners.append(np.full(len(coords) - 1, route_index))
+                start_pk.append(pk[:-1])
+                end_pk.append(pk[1:])
+        self.segment_starts = np.concatenate(starts) if starts else np.empty((0, 2))
+        self.segment_ends = np.concatenate(ends) if ends else np.empty((0, 2))
+        self.segment_route = np.concatenate(owners) if owners else np.empty(0, dtype=int)
+        self.segment_start_pk = np.concatenate(start_pk) if start_pk else np.empty(0)
+        self.segment_end_pk = np.concatenate(end_pk) if end_pk else np.empty(0)
+        self.tree = STRtree(shapely.linestrings(np.stack([self.segment_starts, self.segment_ends], axis=1)))
+
+    @classmethod
+    def from_layers(cls, uploaded_layers=(), include_network=True):
+        """Construit l'index à partir du réseau de référence et des couches GeoJSON téléversées."""
+        lines = load_route_network() if include_network else []
+        for layer in uploaded_layers:
+            if layer["type"] == "GeoJSON":
+                lines.extend(line_features(VectorLayer(layer["vector"]).features(), layer["name"]))
+        return cls(lines)
+
+    def route_length(self, route):
+        """Retourne la longueur (m) de l'axe de chaînage d'une route."""
+        return float(self.axes[route][1][-1])
+
+    def nearest(self, lon, lat):
+        """Retourne la route, le PK (m), la distance (m) et le point projeté (lon, lat) le plus proche."""
+        if not len(self.segment_route):
+            return None
+        x, y = _to_metric.transform(lon, lat)
+        segment = int(self.tree.query_nearest(Point(x, y))[0])
+        start, end = self.segment_starts[segment], self.segment_ends[segment]
+        direction = end - start
+        length_sq = float(direction @ direction)
+        t = 0.0 if length_sq == 0 else min(1.0, max(0.0, float((np.array([x, y]) - start) @ direction) / length_sq))
+        projected = start + t * direction
+        proj_lon, proj_lat = _to_wgs84.transform(*projected)
+        start_pk, end_pk = self.segment_start_pk[segment], self.segment_end_pk[segment]
+        return {
+            "route": self.routes[self.segment_route[segment]],
+            "pk": float(start_pk + t * (end_pk - start_pk)),
+            "distance": float(np.hypot(x - projected[0], y - projected[1])),
+            "lon": proj_lon,
+            "lat": proj_lat,
+        }
+
+    def locate(self, route, pk):
+        """Retourne (lon, lat) du point situé à ``pk`` mètres sur l'axe d'une route."""
+        if route not in self.axes:
+            raise ValueError(f"Route inconnue : {route}")
+        coords, chainage = self.axes[route]
+        if not 0 <= pk <= chainage[-1]:
+            raise ValueError(f"{format_pk(pk)} hors de la route ({format_pk(chainage[-1])} au maximum)")
+        if len(coords) == 1:
+            return _to_wgs84.transform(*coords[0])
+        index = min(int(np.searchsorted(chainage, pk, side="right")) - 1, len(chainage) - 2)
+        span = chainage[index + 1] - chainage[index]
+        t = 0.0 if span == 0 else (pk - chainage[index]) / span
+        x, y = coords[index] + t * (coords[index + 1] - coords[index])
+        return _to_wgs84.transform(x, y)
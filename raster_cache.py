@@ -0,0 +1,174 @@
+"""Cache disque adressé par contenu pour les rasters dérivés (reprojections...).
+
+Chaque entrée est un fichier nommé d'après le hachage de sa clé. Les écritures
+passent par un fichier temporaire du même répertoire renommé atomiquement, de
+sorte qu'une interruption ne laisse jamais d'entrée partielle. La taille totale
+est bornée : les entrées les moins récemment utilisées sont supprimées, sauf
+celles que leurs utilisateurs (sessions de l'application...) ont épinglées.
+"""
+import hashlib
+import os
+import threading
+import time
+import uuid
+
+DEFAULT_CACHE_DIR = os.environ.get("RASTER_CACHE_DIR", ".raster_cache")
+DEFAULT_MAX_BYTES = int(os.environ.get("RASTER_CACHE_MAX_BYTES", 5 * 1024 ** 3))
+# Les fichiers temporaires plus anciens que ce délai proviennent d'écritures interrompues
+STALE_PART_SECONDS = 3600
+PART_SUFFIX = ".part"
+# Un épinglage non renouvelé pendant ce délai (session fermée...) expire
+PIN_SECONDS = 12 * 3600
+
+# Empreintes déjà calculées, indexées par (chemin, taille, date de modification)
+_digest_memo = {}
+
+
+# Fonction pour reconnaître un fichier temporaire (``.part``, éventuellement suivi de l'extension exigée par un pilote)
+def is_part_name(name):
+    root, extension = os.path.splitext(name)
+    return extension == PART_SUFFIX or os.path.splitext(root)[1] == PART_SUFFIX
+
+
+# Fonction pour calculer l'empreinte SHA-256 d'un fichier par blocs
+def file_digest(path, chunk_size=1024 * 1024):
+    """Retourne l'empreinte SHA-256 du contenu d'un fichier (mémorisée par version)."""
+    stat = os.stat(path)
+    memo_key = (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+    digest = _digest_memo.get(memo_key)
+    if digest is None:
+        sha = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(chunk_size), b""):
+                sha.update(chunk)
+        digest = sha.hexdigest()
+        _digest_memo[memo_key] = digest
+    return digest
+
+
+# Fonction pour enregistrer l'empreinte d'un fichier calculée pendant son écriture
+def remember_digest(path, digest):
+    """Mémorise ``digest`` comme empreinte de la version actuelle de ``path`` (pas de relecture)."""
+    stat = os.stat(path)
+    _digest_memo[(os.path.abspath(path), stat.st_size, stat.st_mtime_ns)] = digest
+
+
+class RasterCache:
+    """Répertoire de fichiers dérivés avec éviction LRU bornée en taille."""
+
+    def __init__(self, directory=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._pins = {}
+        self._pins_lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def make_key(*parts):
+        """Construit une clé stable à partir des paramètres qui déterminent le résultat."""
+        return hashlib.sha256("|".join(str(part) for part in parts).encode("utf-8")).hexdigest()
+
+    def path_for(self, key, suffix=".tif"):
+        """Chemin de l'entrée associée à une clé (qu'elle existe ou non)."""
+        return os.path.join(self.directory, f"{key}{suffix}")
+
+    def get(self, key, suffix=".tif"):
+        """Retourne le chemin de l'entrée si elle existe, en la marquant comme utilisée."""
+        path = self.path_for(key, suffix)
+        try:
+            stat = os.stat(path)
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        # Le contenu d'une entrée ne change pas : son empreinte reste valable après os.utime
+        digest = _digest_memo.get((os.path.abspath(path), stat.st_size, stat.st_mtime_ns))
+        if digest is not None:
+            remember_digest(path, digest)
+        return path
+
+    def part_path(self, key, suffix=".tif"):
+        """Chemin temporaire unique (dans le répertoire du cache) d'une entrée en cours d'écriture."""
+        return os.path.join(self.directory, f"{key}.{uuid.uuid4().hex[:8]}{suffix}{PART_SUFFIX}")
+
+    def publish(self, part_path, key, suffix=".tif"):
+        """Publie atomiquement le fichier temporaire complet ``part_path`` sous l'entrée ``key``."""
+        path = self.path_for(key, suffix)
+        with open(part_path, "rb+") as f:
+            os.fsync(f.fileno())
+        os.replace(part_path, path)
+        self.evict(keep=path)
+        return path
+
+    def get_or_create(self, key, producer, suffix=".tif"):
+        """Retourne l'entrée de ``key``, en la produisant avec ``producer(chemin)`` si absente.
+
+        ``producer`` écrit le résultat dans le chemin temporaire qui lui est fourni ;
+        celui-ci n'est publié sous le nom définitif qu'une fois complet.
+        """
+        path = self.get(key, suffix)
+        if path is not None:
+            return path
+        part_path = self.part_path(key, suffix)
+        try:
+            producer(part_path)
+            return self.publish(part_path, key, suffix)
+        finally:
+            if os.path.exists(part_path):
+                os.remove(part_path)
+
+    def entries(self):
+        """Liste les entrées publiées sous forme (date d'accès, taille, chemin)."""
+        entries = []
+        for entry in os.scandir(self.directory):
+            if not entry.is_file() or is_part_name(entry.name):
+                continue
+            stat = entry.stat()
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def pin(self, owner, paths):
+        """Protège de l'éviction les entrées ``paths`` utilisées par ``owner`` (remplace son épinglage précédent).
+
+        L'épinglage expire s'il n'est pas renouvelé pendant ``PIN_SECONDS`` ;
+        les entrées épinglées peuvent faire dépasser ``max_bytes``.
+        """
+        with self._pins_lock:
+            self._pins[owner] = (time.time(), frozenset(os.path.abspath(path) for path in paths))
+
+    def unpin(self, owner):
+        """Retire l'épinglage de ``owner``."""
+        with self._pins_lock:
+            self._pins.pop(owner, None)
+
+    def pinned(self):
+        """Chemins absolus des entrées épinglées (épinglages expirés oubliés)."""
+        now = time.time()
+        with self._pins_lock:
+            for owner in [owner for owner, (pinned_at, _) in self._pins.items() if now - pinned_at > PIN_SECONDS]:
+                del self._pins[owner]
+            return set().union(*(paths for _, paths in self._pins.values()))
+
+    def evict(self, keep=None, protected=()):
+        """Supprime les entrées les moins récemment utilisées au-delà de ``max_bytes``.
+
+        Les entrées ``keep``, ``protected`` et épinglées ne sont jamais supprimées.
+        """
+        protected = self.pinned() | {os.path.abspath(path) for path in protected}
+        if keep is not None:
+            protected.add(os.path.abspath(keep))
+        now = time.time()
+        for entry in os.scandir(self.directory):
+            if is_part_name(entry.name) and now - entry.stat().st_mtime > STALE_PART_SECONDS:
+                os.remove(entry.path)
+        entries = sorted(self.entries())
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in entries:
+            if total <= self.max_bytes:
+                break
+            if os.path.abspath(path) in protected:
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
@@ -0,0 +1,270 @@
+"""Reprojection des rasters par blocs, en parallèle et avec mise en cache disque.
+
+La reprojection passe par un ``WarpedVRT`` lu fenêtre par fenêtre : seule une
+poignée de blocs est en mémoire à un instant donné, quelle que soit la taille
+de l'image source. Le résultat est un GeoTIFF tuilé et compressé.
+
+Les fichiers téléversés sont copiés par blocs dans le cache, sous le nom de
+l'empreinte de leur contenu calculée pendant la copie : un même fichier
+téléversé deux fois n'est ni validé ni reprojeté à nouveau.
+"""
+import hashlib
+import os
+import threading
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from functools import lru_cache
+
+import numpy as np
+import rasterio
+import rasterio.shutil
+from rasterio.enums import Resampling
+from rasterio.vrt import WarpedVRT
+from rasterio.warp import calculate_default_transform
+
+import instrumentation
+from raster_cache import RasterCache, file_digest, remember_digest
+
+# Taille des tuiles du GeoTIFF produit (et des fenêtres de reprojection)
+DEFAULT_BLOCK_SIZE = 512
+DEFAULT_NUM_THREADS = min(4, os.cpu_count() or 1)
+
+# Méthodes de rééchantillonnage proposées à l'utilisateur
+RESAMPLING_METHODS = {
+    "Plus proche voisin": Resampling.nearest,
+    "Bilinéaire": Resampling.bilinear,
+    "Cubique": Resampling.cubic,
+}
+
+# Rééchantillonnage par défaut selon le type de raster (interpolation pour les modèles d'élévation)
+DEFAULT_RESAMPLING = {
+    "MNT": Resampling.bilinear,
+    "MNS": Resampling.bilinear,
+    "Orthophoto": Resampling.nearest,
+}
+
+# Options de création des Cloud-Optimized GeoTIFF (aperçus en puissances de deux)
+COG_OPTIONS = {
+    "BLOCKSIZE": DEFAULT_BLOCK_SIZE,
+    "COMPRESS": "DEFLATE",
+    "PREDICTOR": "YES",
+    "OVERVIEWS": "AUTO",
+    "BIGTIFF": "IF_SAFER",
+}
+
+# Taille des blocs copiés lors de l'enregistrement d'un fichier téléversé
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+# Signatures d'en-tête TIFF et BigTIFF (petit et grand boutiste)
+TIFF_SIGNATURES = (b"II*\x00", b"MM\x00*", b"II+\x00", b"MM\x00+")
+
+# Taille maximale (pixels) d'un raster lu pour l'affichage
+DEFAULT_DISPLAY_SIZE = 2048
+
+
+# Fonction pour obtenir le cache disque partagé des rasters reprojetés (créé au premier appel)
+@lru_cache(maxsize=None)
+def reprojection_cache():
+    """Retourne le ``RasterCache`` partagé ; son répertoire n'est créé qu'au premier usage."""
+    return RasterCache()
+
+
+# Fonction pour construire le profil d'un GeoTIFF tuilé et compressé
+def tiled_profile(profile, block_size=DEFAULT_BLOCK_SIZE):
+    """Complète un profil rasterio pour écrire un GeoTIFF tuilé compressé en DEFLATE."""
+    profile = dict(profile)
+    profile.update({
+        "driver": "GTiff",
+        "tiled": True,
+        "blockxsize": block_size,
+        "blockysize": block_size,
+        "compress": "deflate",
+        "predictor": 3 if np.dtype(profile["dtype"]).kind == "f" else 2,
+        "BIGTIFF": "IF_SAFER",
+    })
+    return profile
+
+
+# Fonction pour exécuter des tâches en limitant le nombre de résultats en mémoire
+def bounded_map(pool, function, items, max_in_flight):
+    """Comme ``pool.map`` mais sans jamais dépasser ``max_in_flight`` tâches en cours.
+
+    Les résultats sont produits dans l'ordre d'achèvement.
+    """
+    pending = set()
+    for item in items:
+        if len(pending) >= max_in_flight:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                yield future.result()
+        pending.add(pool.submit(function, item))
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            yield future.result()
+
+
+# Fonction pour reprojeter un fichier TIFF avec un nom unique
+@instrumentation.traced()
+def reproject_tiff(input_tiff, target_crs, resampling=Resampling.nearest, resolution=None, output_path=None,
+                   num_threads=DEFAULT_NUM_THREADS, block_size=DEFAULT_BLOCK_SIZE, progress=None):
+    """Reprojette un TIFF vers ``target_crs`` bloc par bloc et retourne le chemin produit.
+
+    Chaque fil de travail ouvre sa propre vue ``WarpedVRT`` de la source (les
+    jeux de données rasterio ne sont pas partagés entre fils) ; l'écriture se
+    fait dans le fil appelant. ``progress(blocs_écrits, total)`` est appelé
+    après chaque bloc : une exception qu'il lève interrompt la reprojection.
+    """
+    with rasterio.open(input_tiff) as src:
+        transform, width, height = calculate_default_transform(
+            src.crs, target_crs, src.width, src.height, *src.bounds, resolution=resolution
+        )
+        profile = tiled_profile(src.profile, block_size)
+        profile.update({
+            "crs": target_crs,
+            "transform": transform,
+            "width": width,
+            "height": height,
+        })
+    vrt_options = {"crs": target_crs, "transform": transform, "width": width, "height": height, "resampling": resampling}
+
+    # Générer un nom de fichier unique
+    if output_path is None:
+        unique_id = str(uuid.uuid4())[:8]
+        output_path = f"reprojected_{unique_id}.tiff"
+
+    local = threading.local()
+    opened = []
+    opened_lock = threading.Lock()
+
+    def warp_window(window):
+        vrt = getattr(local, "vrt", None)
+        if vrt is None:
+            source = rasterio.open(input_tiff)
+            vrt = local.vrt = WarpedVRT(source, **vrt_options)
+            with opened_lock:
+                opened.extend([vrt, source])
+        return window, vrt.read(window=window)
+
+    counter = f"bytes_read:{os.path.basename(input_tiff)}"
+    try:
+        with rasterio.open(output_path, "w", **profile) as dst, ThreadPoolExecutor(max_workers=num_threads) as pool:
+            block_windows = [window for _, window in dst.block_windows(1)]
+            for done, (window, data) in enumerate(bounded_map(pool, warp_window, block_windows, 2 * num_threads), 1):
+                instrumentation.count(counter, data.nbytes)
+                dst.write(data, window=window)
+                if progress:
+                    progress(done, len(block_windows))
+    finally:
+        for dataset in opened:
+            dataset.close()
+    return output_path
+
+
+# Fonction pour reprojeter un fichier TIFF en réutilisant le cache disque
+def cached_reproject_tiff(input_tiff, target_crs, resampling=Resampling.nearest, resolution=None, progress=None):
+    """Retourne la reprojection mise en cache (clé : contenu, CRS, rééchantillonnage, résolution)."""
+    key = RasterCache.make_key("reproject", file_digest(input_tiff), target_crs, resampling.name, resolution)
+    return reprojection_cache().get_or_create(
+        key,
+        lambda output_path: reproject_tiff(input_tiff, target_crs, resampling=resampling, resolution=resolution,
+                                           output_path=output_path, progress=progress),
+    )
+
+
+# Fonction pour vérifier qu'un fichier est un GeoTIFF géoréférencé
+def check_geotiff(path):
+    """Lit l'en-tête de ``path`` et lève ``ValueError`` s'il ne s'agit pas d'un GeoTIFF géoréférencé."""
+    try:
+        with rasterio.open(path) as src:
+            driver, crs, transform = src.driver, src.crs, src.transform
+    except rasterio.errors.RasterioIOError as e:
+        raise ValueError(f"Fichier illisible : {e}") from e
+    if driver != "GTiff":
+        raise ValueError(f"Format {driver} non pris en charge (GeoTIFF attendu).")
+    if crs is None:
+        raise ValueError("Le fichier n'a pas de système de coordonnées.")
+    if transform.is_identity:
+        raise ValueError("Le fichier n'est pas géoréférencé.")
+
+
+# Fonction pour enregistrer un fichier téléversé dans le cache
+def ingest_upload(fileobj, cache=None, chunk_size=UPLOAD_CHUNK_SIZE):
+    """Copie ``fileobj`` par blocs dans le cache et retourne (chemin, empreinte, déjà présent).
+
+    L'empreinte SHA-256 est calculée pendant la copie : la mémoire utilisée
+    est celle d'un bloc. La signature TIFF est vérifiée sur le premier bloc,
+    l'en-tête GeoTIFF (format, CRS) avant publication ; un contenu déjà
+    présent dans le cache n'est pas publié une seconde fois.
+    """
+    cache = cache or reprojection_cache()
+    fileobj.seek(0)
+    chunk = fileobj.read(chunk_size)
+    if chunk[:4] not in TIFF_SIGNATURES:
+        raise ValueError("Le fichier n'est pas un TIFF.")
+    sha = hashlib.sha256()
+    part_path = cache.part_path("upload")
+    try:
+        with open(part_path, "wb") as f:
+            while chunk:
+                sha.update(chunk)
+                f.write(chunk)
+                chunk = fileobj.read(chunk_size)
+        digest = sha.hexdigest()
+        key = RasterCache.make_key("upload", digest)
+        path = cache.get(key)
+        duplicate = path is not None
+        if not duplicate:
+            check_geotiff(part_path)
+            path = cache.publish(part_path, key)
+    finally:
+        if os.path.exists(part_path):
+            os.remove(part_path)
+    remember_digest(path, digest)
+    return path, digest, duplicate
+
+
+# Fonction pour convertir un GeoTIFF en Cloud-Optimized GeoTIFF
+@instrumentation.traced()
+def convert_to_cog(input_tiff, output_path, overview_resampling="AVERAGE"):
+    """Écrit un COG tuilé avec aperçus internes (facteurs 2, 4, 8... jusqu'à une tuile).
+
+    La copie est faite en un seul appel GDAL : elle ne peut pas être interrompue.
+    """
+    rasterio.shutil.copy(input_tiff, output_path, driver="COG", OVERVIEW_RESAMPLING=overview_resampling, **COG_OPTIONS)
+    return output_path
+
+
+# Fonction pour convertir en COG en réutilisant le cache disque
+def cached_cog(input_tiff, overview_resampling="AVERAGE"):
+    """Retourne la version COG mise en cache d'un GeoTIFF."""
+    key = RasterCache.make_key("cog", file_digest(input_tiff), overview_resampling)
+    return reprojection_cache().get_or_create(
+        key,
+        lambda output_path: convert_to_cog(input_tiff, output_path, overview_resampling=overview_resampling),
+    )
+
+
+# Fonction pour calculer la taille de lecture adaptée à une sortie
+def fit_shape(width, height, max_size):
+    """Retourne (hauteur, largeur) réduites pour tenir dans ``max_size`` pixels (sans agrandir)."""
+    scale = min(1.0, max_size / max(width, height))
+    return max(1, round(height * scale)), max(1, round(width * scale))
+
+
+# Fonction pour lire un raster à la résolution de l'affichage
+def read_downsampled(src, max_size=DEFAULT_DISPLAY_SIZE, indexes=None, masked=False, resampling=Resampling.average):
+    """Lit un raster réduit à ``max_size`` pixels au plus sur son plus grand côté.
+
+    Avec ``out_shape``, GDAL sert la lecture depuis l'aperçu interne le plus
+    proche : le coût dépend de la taille de sortie, pas de la taille source.
+    """
+    out_height, out_width = fit_shape(src.width, src.height, max_size)
+    if indexes is None:
+        indexes = list(range(1, src.count + 1))
+    if isinstance(indexes, int):
+        out_shape = (out_height, out_width)
+    else:
+        out_shape = (len(indexes), out_height, out_width)
+    data = src.read(indexes, out_shape=out_shape, masked=masked, resampling=resampling)
+    instrumentation.count(f"bytes_read:{os.path.basename(src.name)}", data.nbytes)
+    return data
@@ -0,0 +1,171 @@
+"""Rendu des rasters en images PNG légères pour la carte.
+
+Les rasters sont lus décimés (``out_shape``) puis colorés avec une table de
+correspondance uint8 de 256 couleurs : pas de tableau RGBA en float64. Les
+rendus sont mis en cache par (fichier, palette, taille cible) et réutilisés
+d'une exécution du script à l'autre.
+
+``render_warped`` produit l'image d'une emprise quelconque (tuile, page
+d'export...) reprojetée sur sa grille de sortie, en lisant l'aperçu interne
+adapté à la résolution de cette grille.
+"""
+import base64
+import os
+from functools import lru_cache
+from io import BytesIO
+
+import numpy as np
+import rasterio
+from PIL import Image
+from rasterio.enums import ColorInterp, Resampling
+from rasterio.transform import from_bounds
+from rasterio.vrt import WarpedVRT
+from rasterio.warp import transform_bounds
+
+import instrumentation
+from raster_io import read_downsampled
+
+# Taille maximale (pixels) des images superposées à la carte interactive
+OVERLAY_MAX_SIZE = 1024
+
+
+# Fonction pour construire la table de couleurs d'une palette matplotlib
+@lru_cache(maxsize=None)
+def colormap_lut(name="terrain", size=256):
+    """Retourne une table (size, 4) de couleurs RGBA uint8 pour la palette ``name``."""
+    from matplotlib import colormaps
+
+    return (colormaps[name](np.linspace(0.0, 1.0, size)) * 255).round().astype(np.uint8)
+
+
+# Fonction pour colorer une grille d'élévations avec une table de couleurs
+def colorize(data, valid, lut, vmin=None, vmax=None):
+    """Convertit une grille en image RGBA uint8 ; les pixels invalides sont transparents."""
+    if vmin is None or vmax is None:
+        if valid.any():
+            vmin, vmax = float(data[valid].min()), float(data[valid].max())
+        else:
+            vmin, vmax = 0.0, 1.0
+    scale = (len(lut) - 1) / (vmax - vmin) if vmax > vmin else 0.0
+    indices = np.clip((data - vmin) * scale, 0, len(lut) - 1)
+    image = lut[np.nan_to_num(indices).astype(np.uint8)]
+    image[~valid, 3] = 0
+    return image
+
+
+# Fonction pour convertir des bandes quelconques en image uint8 affichable
+def to_display_image(bands, value_range=None):
+    """Met des bandes (count, h, w) au format image uint8 (h, w, count).
+
+    Les bandes non uint8 sont étirées sur ``value_range`` (par défaut les
+    percentiles 2-98 des valeurs lues).
+    """
+    image = np.moveaxis(bands, 0, -1)
+    if image.dtype != np.uint8:
+        low, high = value_range if value_range is not None else np.nanpercentile(image, (2, 98))
+        scale = 255.0 / (high - low) if high > low else 0.0
+        image = np.clip((image - low) * scale, 0, 255).astype(np.uint8)
+    if image.shape[-1] == 1:
+        image = image[..., 0]
+    elif image.shape[-1] > 4:
+        image = image[..., :3]
+    return image
+
+
+# Fonction pour lire et colorer un raster à la taille voulue
+@instrumentation.traced()
+def render_raster(tiff_path, colormap=None, max_size=OVERLAY_MAX_SIZE):
+    """Retourne l'image uint8 d'un raster : palette sur la bande 1, ou bandes brutes."""
+    with rasterio.open(tiff_path) as src:
+        if colormap is None:
+            return to_display_image(read_downsampled(src, max_size))
+        data = read_downsampled(src, max_size, indexes=1, masked=True)
+    values = np.ma.getdata(data).astype(np.float32, copy=False)
+    valid = ~np.ma.getmaskarray(data) & np.isfinite(values)
+    return colorize(values, valid, colormap_lut(colormap))
+
+
+# Fonction pour encoder une image en PNG
+def encode_png(image):
+    """Encode une image uint8 en PNG et retourne les octets."""
+    buf = BytesIO()
+    Image.fromarray(image).save(buf, format="PNG", compress_level=6)
+    return buf.getvalue()
+
+
+@lru_cache(maxsize=32)
+def _rendered_png(tiff_path, mtime_ns, colormap, max_size):
+    return encode_png(render_raster(tiff_path, colormap, max_size))
+
+
+# Fonction pour obtenir le rendu PNG mis en cache d'un raster
+def rendered_png(tiff_path, colormap=None, max_size=OVERLAY_MAX_SIZE):
+    """Retourne le PNG d'un raster, recalculé seulement si le fichier a changé."""
+    return _rendered_png(tiff_path, os.stat(tiff_path).st_mtime_ns, colormap, max_size)
+
+
+# Fonction pour obtenir le rendu d'un raster sous forme d'URL data:
+def rendered_data_url(tiff_path, colormap=None, max_size=OVERLAY_MAX_SIZE):
+    """Retourne le PNG mis en cache encodé en URL ``data:image/png;base64``."""
+    return "data:image/png;base64," + base64.b64encode(rendered_png(tiff_path, colormap, max_size)).decode("ascii")
+
+
+# Fonction pour choisir l'aperçu adapté à une résolution cible
+def overview_level_for(src, target_resolution, crs="EPSG:3857"):
+    """Retourne l'indice de l'aperçu le plus grossier encore plus fin que la cible (en unités de ``crs``), ou None."""
+    left, bottom, right, top = transform_bounds(src.crs, crs, *src.bounds)
+    source_resolution = (right - left) / src.width
+    level = None
+    for index, factor in enumerate(src.overviews(1)):
+        if source_resolution * factor <= target_resolution:
+            level = index
+    return level
+
+
+# Fonction pour calculer la plage de valeurs d'un raster à partir de son plus petit aperçu
+@lru_cache(maxsize=64)
+def value_range(path, mtime_ns):
+    """Retourne (min, max) des valeurs valides de la bande 1, lues sur l'aperçu le plus grossier."""
+    with rasterio.open(path) as src:
+        overviews = src.overviews(1)
+    with rasterio.open(path, overview_level=len(overviews) - 1 if overviews else None) as src:
+        data = src.read(1, masked=True)
+    values = np.ma.getdata(data).astype(np.float64)
+    valid = ~np.ma.getmaskarray(data) & np.isfinite(values)
+    if not valid.any():
+        return 0.0, 1.0
+    return float(values[valid].min()), float(values[valid].max())
+
+
+# Fonction pour reprojeter et colorer un raster sur une grille de sortie
+@instrumentation.traced()
+def render_warped(path, colormap, crs, bounds, width, height, resampling=Resampling.bilinear):
+    """Retourne l'image RGBA uint8 (height, width) du raster sur la grille ``bounds`` de ``crs``.
+
+    ``colormap`` vaut ``rgb`` pour les bandes brutes (3 premières), sinon une
+    palette appliquée à la bande 1 sur la plage de valeurs de tout le raster.
+    Seuls l'aperçu adapté et la zone utile du raster sont lus.
+    """
+    mtime_ns = os.stat(path).st_mtime_ns
+    with rasterio.open(path) as src:
+        level = overview_level_for(src, (bounds[2] - bounds[0]) / width, crs)
+    with rasterio.open(path, overview_level=level) as src:
+        # Sans nodata ni bande alpha, une bande alpha rend transparent ce qui est hors du raster
+        add_alpha = src.nodata is None and ColorInterp.alpha not in src.colorinterp
+        with WarpedVRT(src, crs=crs, transform=from_bounds(*bounds, width, height),
+                       width=width, height=height, resampling=resampling, add_alpha=add_alpha) as vrt:
+            alpha = (vrt.read(vrt.count) if add_alpha else vrt.dataset_mask()) > 0
+            counter = f"bytes_read:{os.path.basename(path)}"
+            if colormap == "rgb":
+                bands = vrt.read(indexes=list(range(1, min(src.count, 3) + 1)))
+                instrumentation.count(counter, bands.nbytes)
+                image = to_display_image(bands, value_range=None if src.dtypes[0] == "uint8" else value_range(path, mtime_ns))
+                if image.ndim == 2:
+                    image = np.repeat(image[..., None], 3, axis=-1)
+                return np.dstack([image, np.where(alpha, 255, 0).astype(np.uint8)])
+            data = vrt.read(1, masked=True)
+            instrumentation.count(counter, data.nbytes)
+            values = np.ma.getdata(data).astype(np.float32)
+            valid = alpha & ~np.ma.getmaskarray(data) & np.isfinite(values)
+            vmin, vmax = value_range(path, mtime_ns)
+            return colorize(values, valid, colormap_lut(colormap), vmin, vmax)
@@ -0,0 +1,193 @@
+"""Export de la carte statique (PNG) sur une grille calculée depuis la page et la résolution.
+
+Le format de page (pouces) et la résolution (points par pouce) fixent la
+grille de pixels de la zone cartographique, en EPSG:32630. Chaque raster est
+reprojeté directement sur cette grille (``WarpedVRT`` sur l'aperçu interne
+adapté) : le temps et la mémoire dépendent de la taille de la page, pas de
+celle du raster. Les couches vectorielles sont lues dans la version
+simplifiée adaptée à la résolution, reprojetées en EPSG:32630 (comme les
+rasters) et tracées en une collection matplotlib par couche.
+
+Ce module n'importe pas Streamlit.
+"""
+import math
+from io import BytesIO
+
+import numpy as np
+import shapely
+from matplotlib.collections import LineCollection
+from matplotlib.figure import Figure
+from pyproj import Transformer
+from rasterio.warp import transform_bounds
+from shapely.geometry import shape
+
+import instrumentation
+from rendering import render_warped
+from vector_cache import VECTOR_CRS, VectorLayer
+
+EXPORT_CRS = "EPSG:32630"
+# Formats de page (largeur, hauteur) en pouces
+PAGE_SIZES = {
+    "A4 paysage": (11.69, 8.27),
+    "A4 portrait": (8.27, 11.69),
+    "A3 paysage": (16.54, 11.69),
+    "A3 portrait": (11.69, 16.54),
+}
+DEFAULT_PAGE = "A4 paysage"
+DEFAULT_DPI = 150
+# Marges de la page autour de la zone cartographique (fractions) : gauche, bas, droite, haut
+MAP_MARGINS = (0.1, 0.08, 0.03, 0.06)
+# Marge ajoutée autour de l'emprise exportée (fraction de l'emprise)
+EXTENT_PADDING = 0.05
+# Mètres par degré à l'équateur (choix du niveau de simplification des vecteurs)
+METERS_PER_DEGREE = 111320.0
+
+_to_export = Transformer.from_crs(VECTOR_CRS, EXPORT_CRS, always_xy=True)
+
+
+class ExportGrid:
+    """Grille de pixels de la zone cartographique : emprise (EPSG:32630) et taille."""
+
+    def __init__(self, bounds, width, height):
+        self.bounds = bounds
+        self.width = width
+        self.height = height
+
+    @property
+    def resolution(self):
+        """Taille d'un pixel de sortie, en mètres."""
+        return (self.bounds[2] - self.bounds[0]) / self.width
+
+    @property
+    def zoom(self):
+        """Niveau de zoom web dont le pixel est aussi fin que celui de la grille."""
+        return math.floor(math.log2(360.0 * METERS_PER_DEGREE / (256 * self.resolution)))
+
+    def geographic_bounds(self):
+        """Emprise de la grille en EPSG:4326 (ouest, sud, est, nord)."""
+        return transform_bounds(EXPORT_CRS, VECTOR_CRS, *self.bounds)
+
+
+# Fonction pour calculer la grille de sortie d'une emprise
+def export_grid(bounds, page=DEFAULT_PAGE, dpi=DEFAULT_DPI, padding=EXTENT_PADDING):
+    """Retourne l'``ExportGrid`` de ``bounds`` (EPSG:32630) pour la page et la résolution.
+
+    L'emprise est élargie de ``padding`` puis, dans sa direction la plus
+    courte, jusqu'au rapport de la zone cartographique (même échelle en x et y).
+    """
+    page_width, page_height = PAGE_SIZES[page]
+    left, bottom, right, top = MAP_MARGINS
+    width = round(page_width * (1 - left - right) * dpi)
+    height = round(page_height * (1 - bottom - top) * dpi)
+    minx, miny, maxx, maxy = bounds
+    resolution = max(max(maxx - minx, 1.0) * (1 + 2 * padding) / width,
+                     max(maxy - miny, 1.0) * (1 + 2 * padding) / height)
+    cx, cy = (minx + maxx) / 2, (miny + maxy) / 2
+    half_width, half_height = width * resolution / 2, height * resolution / 2
+    return ExportGrid((cx - half_width, cy - half_height, cx + half_width, cy + half_height), width, height)
+
+
+# Fonction pour reprojeter des géométries EPSG:4326 dans la projection d'export
+def to_export_crs(geometries):
+    """Reprojette un tableau de géométries EPSG:4326 en EPSG:32630 (un seul appel à pyproj)."""
+    return shapely.transform(np.asarray(geometries, dtype=object),
+                             lambda coords: np.column_stack(_to_export.transform(coords[:, 0], coords[:, 1])))
+
+
+# Fonction pour tracer des géométries en collections
+def draw_geometries(ax, geometries, color, linewidth=1.5, markersize=5):
+    """Trace des géométries : une ``LineCollection`` (lignes et contours) et un nuage de points."""
+    parts = shapely.get_parts(np.asarray(geometries, dtype=object))
+    kinds = shapely.get_type_id(parts)
+    points = parts[kinds == 0]
+    if len(points):
+        coords = shapely.get_coordinates(points)
+        ax.scatter(coords[:, 0], coords[:, 1], s=markersize ** 2, color=color, zorder=3)
+    lines = np.concatenate([parts[(kinds == 1) | (kinds == 2)], shapely.get_parts(shapely.boundary(parts[kinds == 3]))])
+    if len(lines):
+        coords, index = shapely.get_coordinates(lines, return_index=True)
+        segments = np.split(coords, np.flatnonzero(np.diff(index)) + 1)
+        ax.add_collection(LineCollection(segments, colors=color, linewidths=linewidth, zorder=2))
+
+
+# Fonction pour calculer l'emprise (EPSG:32630) des couches exportées
+def layers_bounds(layers, user_geometries):
+    """Union des emprises des rasters, des couches vectorielles et des entités dessinées, ou None."""
+    boxes = []
+    for layer in layers:
+        if layer["type"] == "TIFF":
+            boxes.append(tuple(layer["bounds"]))
+        elif layer["type"] == "GeoJSON":
+            try:
+                boxes.append(VectorLayer(layer["vector"]).bounds())
+            except FileNotFoundError:
+                # Couche absente du cache : signalée lors de son tracé
+                continue
+    if len(user_geometries):
+        boxes.append(tuple(shapely.total_bounds(user_geometries)))
+    boxes = [transform_bounds(VECTOR_CRS, EXPORT_CRS, *box) for box in boxes if np.all(np.isfinite(box))]
+    if not boxes:
+        return None
+    boxes = np.array(boxes)
+    return boxes[:, 0].min(), boxes[:, 1].min(), boxes[:, 2].max(), boxes[:, 3].max()
+
+
+# Fonction pour produire la carte statique
+@instrumentation.traced()
+def render_static_map(layers, user_layers, polygons, page=DEFAULT_PAGE, dpi=DEFAULT_DPI, colors=None, progress=None):
+    """Retourne (PNG, avertissements) de la carte statique.
+
+    ``layers`` : couches téléversées (TIFF ou GeoJSON) ; ``user_layers`` :
+    {nom: [entités GeoJSON]} ; ``polygons`` : entités dont l'emprise cadre la
+    carte (à défaut, l'emprise de toutes les couches). ``colors`` associe une
+    couleur aux couches GeoJSON par nom ; ``progress(fait, total)`` est appelé
+    après chaque couche.
+    """
+    colors = colors or {}
+    warnings = []
+    user_features = [feature for features in user_layers.values() for feature in features]
+    user_geometries = np.array([shape(feature["geometry"]) for feature in user_features], dtype=object)
+    if polygons:
+        polygon_geometries = [shape(polygon["geometry"]) for polygon in polygons]
+        bounds = transform_bounds(VECTOR_CRS, EXPORT_CRS, *shapely.total_bounds(polygon_geometries))
+    else:
+        warnings.append("Aucune polygonale trouvée pour recadrer la carte : emprise de toutes les couches affichées.")
+        bounds = layers_bounds(layers, user_geometries)
+        if bounds is None:
+            raise ValueError("Aucune couche à exporter.")
+    grid = export_grid(bounds, page, dpi)
+    geographic_bounds = grid.geographic_bounds()
+    left, bottom, right, top = grid.bounds
+
+    fig = Figure(figsize=PAGE_SIZES[page], dpi=dpi)
+    margin_left, margin_bottom, margin_right, margin_top = MAP_MARGINS
+    ax = fig.add_axes([margin_left, margin_bottom, 1 - margin_left - margin_right, 1 - margin_bottom - margin_top])
+    total = len(layers) + 2
+    for position, layer in enumerate(layers):
+        if layer["type"] == "TIFF":
+            colormap = "terrain" if layer["name"] in ("MNT", "MNS") else "rgb"
+            image = render_warped(layer["path"], colormap, EXPORT_CRS, grid.bounds, grid.width, grid.height)
+            ax.imshow(image, extent=[left, right, bottom, top], origin="upper", interpolation="nearest", zorder=1)
+        elif layer["type"] == "GeoJSON":
+            try:
+                gdf = VectorLayer(layer["vector"]).read(geographic_bounds, grid.zoom)
+                draw_geometries(ax, to_export_crs(gdf.geometry.values), colors.get(layer["name"], "blue"), linewidth=2)
+            except Exception as e:
+                warnings.append(f"Erreur lors du tracé de la couche {layer['name']} : {e}")
+        if progress is not None:
+            progress(position + 1, total)
+    user_kinds = np.array([feature["geometry"]["type"] for feature in user_features])
+    for kind, color in (("Polygon", "green"), ("LineString", "blue"), ("Point", "red")):
+        if (user_kinds == kind).any():
+            draw_geometries(ax, to_export_crs(user_geometries[user_kinds == kind]), color, linewidth=2)
+    ax.set_xlim(left, right)
+    ax.set_ylim(bottom, top)
+    ax.set_xlabel("UTM X")
+    ax.set_ylabel("UTM Y")
+    ax.set_title("Carte Statique")
+    ax.grid(True)
+    if progress is not None:
+        progress(total - 1, total)
+    buf = BytesIO()
+    fig.savefig(buf, format="png", dpi=dpi)
+    return buf.getvalue(), warnings
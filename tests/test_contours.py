@@ -0,0 +1,20 @@
+"""Tests de l'extraction des courbes de niveau."""
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from contours import interval_decimals, tile_contours  # noqa: E402
+
+
+def test_interval_decimals():
+    assert [interval_decimals(value) for value in (10, 1.0, 0.5, 0.25, 0.1)] == [0, 0, 1, 2, 1]
+
+
+def test_levels_are_rounded_to_interval():
+    # Pente régulière de 0 à 1.05 m : cotes 0.1, 0.2... sans bruit d'arrondi flottant (0.30000000000000004)
+    data = np.tile(np.linspace(0.0, 1.05, 64), (16, 1))
+    levels = sorted(tile_contours(data, np.ones(data.shape, dtype=bool), 0.1))
+    assert levels == [0.0, 0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0]
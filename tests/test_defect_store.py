@@ -0,0 +1,57 @@
+"""Tests de la base de défauts : requête par emprise (index R*Tree) comparée à un parcours complet."""
+import os
+import random
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from defect_store import DefectStore  # noqa: E402
+
+CATEGORIES = ("Nid de poule", "Fissure", "Orniérage")
+
+
+@pytest.fixture
+def store(tmp_path):
+    rng = random.Random(0)
+    records = [
+        ("A1", rng.choice(CATEGORIES), rng.randint(1, 3), rng.uniform(5.0, 6.0), rng.uniform(-5.0, -4.0),
+         "2024-01-01", "08:00", "Abidjan")
+        for _ in range(2000)
+    ]
+    # Défauts exactement sur les bords de l'emprise testée
+    records += [("A1", "Fissure", 2, 5.25, -4.75, "2024-01-01", "08:00", "Abidjan"),
+                ("A1", "Fissure", 2, 5.75, -4.25, "2024-01-01", "08:00", "Abidjan")]
+    store = DefectStore(str(tmp_path / "defauts.db"))
+    store.ingest(records[:1500], batch_size=400)
+    # Le reste est écrit ligne à ligne : indexé par le déclencheur d'insertion
+    columns = [column for column in store.defect_columns if column != "id"]
+    with store.transaction() as cursor:
+        cursor.executemany(f'INSERT INTO Defauts ({", ".join(columns)}) VALUES ({", ".join("?" * len(columns))})',
+                           records[1500:])
+    yield store
+    store.close()
+
+
+# Fonction pour sélectionner les défauts d'une emprise par un parcours complet de la table
+def brute_force(store, min_lon, min_lat, max_lon, max_lat, **filters):
+    return sorted(
+        row["id"] for row in store.query("SELECT * FROM Defauts")
+        if min_lon <= row["longitude"] <= max_lon and min_lat <= row["latitude"] <= max_lat
+        and all(row[column] == value for column, value in filters.items())
+    )
+
+
+@pytest.mark.parametrize("bbox", [(-4.75, 5.25, -4.25, 5.75), (-5.0, 5.0, -4.0, 6.0), (-4.1, 5.9, -4.0999, 5.9001)])
+def test_in_bbox_matches_brute_force(store, bbox):
+    found = sorted(row["id"] for row in store.in_bbox(*bbox))
+    assert found == brute_force(store, *bbox)
+
+
+def test_in_bbox_with_filter(store):
+    bbox = (-4.75, 5.25, -4.25, 5.75)
+    found = sorted(row["id"] for row in store.in_bbox(*bbox, categorie="Fissure", gravite=2))
+    assert found and found == brute_force(store, *bbox, categorie="Fissure", gravite=2)
+    with pytest.raises(ValueError):
+        store.in_bbox(*bbox, inconnue=1)
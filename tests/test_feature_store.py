@@ -0,0 +1,39 @@
+"""Tests des couches d'entités (déduplication par géométrie, version)."""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from feature_store import FeatureLayer  # noqa: E402
+
+
+# Fonction pour construire une entité ponctuelle
+def point(lon, lat, name=None):
+    return {"type": "Feature", "properties": {"name": name} if name else {},
+            "geometry": {"type": "Point", "coordinates": [lon, lat]}}
+
+
+def test_duplicate_geometries_are_ignored():
+    layer = FeatureLayer([point(-4.0, 5.3, "a"), point(-3.9, 5.4)])
+    # Même géométrie (à l'arrondi près), propriétés différentes : pas de nouvelle entité
+    assert not layer.add(point(-4.0 + 1e-12, 5.3, "b"))
+    assert layer.extend([point(-4.0, 5.3), point(-3.8, 5.5)]) == 1
+    assert len(layer) == 3
+    assert point(-3.8, 5.5) in layer
+    assert [feature["properties"].get("name") for feature in layer] == ["a", None, None]
+
+
+def test_version_changes_only_on_modification():
+    layer = FeatureLayer([point(-4.0, 5.3)])
+    version = layer.version
+    data = layer.geojson("Relevés")
+    assert layer.geojson("Relevés") is data
+    layer.add(point(-4.0, 5.3))
+    layer.extend([point(-4.0, 5.3)])
+    assert layer.version == version and layer.geojson("Relevés") is data
+    layer.add(point(-3.9, 5.4))
+    assert layer.version > version
+    assert len(layer.geojson("Relevés")["features"]) == 2
+    layer.pop(0)
+    assert [feature["geometry"]["coordinates"] for feature in layer] == [[-3.9, 5.4]]
+    assert layer.geojson("Relevés")["features"][0]["properties"] == {"name": "Relevés"}
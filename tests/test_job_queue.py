@@ -0,0 +1,66 @@
+"""Tests de la file de tâches (réutilisation, relance, annulation)."""
+import os
+import sys
+import threading
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from job_queue import CANCELLED, DONE, FAILED, JobQueue  # noqa: E402
+
+
+@pytest.fixture
+def jobs():
+    queue = JobQueue(max_workers=1)
+    yield queue
+    queue.shutdown()
+
+
+# Fonction pour attendre la fin d'une tâche
+def wait(job):
+    job.future.result(timeout=10)
+    return job
+
+
+def test_done_key_is_reused(jobs):
+    calls = []
+    job = wait(jobs.submit("clé", lambda job: calls.append(1) or len(calls)))
+    assert job.status == DONE and job.result == 1
+    again = jobs.submit("clé", lambda job: calls.append(1) or len(calls))
+    assert again is job
+    assert calls == [1]
+
+
+def test_failed_key_is_relaunched(jobs):
+    attempts = []
+
+    def flaky(job):
+        attempts.append(1)
+        if len(attempts) == 1:
+            raise ValueError("première tentative")
+        return "ok"
+
+    job = wait(jobs.submit("clé", flaky))
+    assert job.status == FAILED and job.error == "première tentative"
+    retry = wait(jobs.submit("clé", flaky))
+    assert retry is not job
+    assert retry.status == DONE and retry.result == "ok"
+
+
+def test_cancel_stops_job_at_next_report(jobs):
+    started, resume = threading.Event(), threading.Event()
+
+    def long_task(job):
+        started.set()
+        resume.wait(10)
+        job.report(1, 2)
+        return "terminée"
+
+    job = jobs.submit("clé", long_task)
+    assert started.wait(10)
+    assert jobs.cancel("clé")
+    resume.set()
+    wait(job)
+    assert job.status == CANCELLED and job.result is None
+    assert not jobs.cancel("clé")
@@ -0,0 +1,48 @@
+"""Tests du moteur de volumes (découpage en tuiles)."""
+import os
+import sys
+
+import numpy as np
+import rasterio
+from rasterio.transform import from_origin
+from shapely.geometry import box
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from volume_engine import compute_polygon_volumes  # noqa: E402
+
+SIZE = 2048
+RESOLUTION = 0.5
+ORIGIN = (500000.0, 4000000.0)
+
+
+# Fonction pour écrire un MNT plat et un MNS surélevé de 2 m
+def write_flat_pair(directory):
+    transform = from_origin(ORIGIN[0], ORIGIN[1], RESOLUTION, RESOLUTION)
+    profile = {"driver": "GTiff", "dtype": "float32", "count": 1, "width": SIZE, "height": SIZE,
+               "crs": "EPSG:32630", "transform": transform, "nodata": -9999.0}
+    paths = []
+    for name, value in (("mns.tif", 102.0), ("mnt.tif", 100.0)):
+        path = os.path.join(directory, name)
+        with rasterio.open(path, "w", **profile) as dst:
+            dst.write(np.full((SIZE, SIZE), value, dtype=np.float32), 1)
+        paths.append(path)
+    return paths
+
+
+# Fonction pour construire un rectangle aligné sur les pixels (colonnes et lignes de début / fin)
+def pixel_box(col_start, col_stop, row_start, row_stop):
+    return box(ORIGIN[0] + col_start * RESOLUTION, ORIGIN[1] - row_stop * RESOLUTION,
+               ORIGIN[0] + col_stop * RESOLUTION, ORIGIN[1] - row_start * RESOLUTION)
+
+
+def test_polygon_touching_next_tile(tmp_path):
+    # Le premier rectangle se termine exactement au début de la tuile voisine (colonne 10 + 1024),
+    # qu'il touche sans la recouvrir ; le second, plus à droite et plus bas, étend l'emprise
+    mns_path, mnt_path = write_flat_pair(str(tmp_path))
+    polygons = [pixel_box(10, 1034, 100, 200), pixel_box(1500, 1600, 1500, 1600)]
+    volumes, areas, inside = compute_polygon_volumes(mns_path, mnt_path, polygons)
+    pixel_area = RESOLUTION ** 2
+    assert inside.all()
+    np.testing.assert_allclose(areas, [1024 * 100 * pixel_area, 100 * 100 * pixel_area])
+    np.testing.assert_allclose(volumes, 2.0 * areas)
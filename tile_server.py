@@ -0,0 +1,183 @@
+"""Serveur de tuiles XYZ pour les rasters téléversés.
+
+Les tuiles ``/{palette}/{couche}/{z}/{x}/{y}.png`` sont produites à la demande
+depuis les COG du cache disque (``couche`` est le nom de fichier de l'entrée,
+sans extension ; ``palette`` vaut ``rgb`` pour afficher les bandes brutes). La
+lecture passe par l'aperçu interne adapté au niveau de zoom et les tuiles
+rendues sont gardées dans un cache LRU en mémoire.
+
+Le serveur tourne dans un fil du processus Streamlit (``start_tile_server``)
+ou comme processus séparé :
+
+    python tile_server.py --port 8765 --root .raster_cache
+
+L'adresse d'écoute se règle avec ``TILE_SERVER_HOST`` et ``TILE_SERVER_PORT``
+(par défaut 127.0.0.1 et un port libre choisi au démarrage). Une page ouverte
+depuis une autre machine n'atteint le serveur que si ``TILE_SERVER_PUBLIC_URL``
+donne l'URL sous laquelle le navigateur le voit (proxy inverse, conteneur...) ;
+à défaut, l'application superpose des images au lieu des tuiles.
+"""
+import argparse
+import math
+import os
+import re
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import rasterio
+from rasterio.warp import transform_bounds
+
+from raster_cache import DEFAULT_CACHE_DIR
+from rendering import encode_png, render_warped
+
+# Adresse d'écoute par défaut (port 0 : port libre choisi par le système)
+DEFAULT_HOST = os.environ.get("TILE_SERVER_HOST", "127.0.0.1")
+DEFAULT_PORT = int(os.environ.get("TILE_SERVER_PORT", "0"))
+
+TILE_SIZE = 256
+# Demi-circonférence terrestre en Web Mercator (EPSG:3857)
+ORIGIN_SHIFT = math.pi * 6378137.0
+DEFAULT_TILE_CACHE_SIZE = 4096
+ALLOWED_COLORMAPS = {"terrain", "viridis", "gist_earth", "gray"}
+
+TILE_PATH = re.compile(r"^/(?P<colormap>[a-z_]+)/(?P<layer>[0-9a-f]{64})/(?P<z>\d+)/(?P<x>\d+)/(?P<y>\d+)\.png$")
+
+
+# Fonction pour calculer l'emprise Web Mercator d'une tuile XYZ
+def tile_bounds(z, x, y):
+    """Retourne (gauche, bas, droite, haut) de la tuile en EPSG:3857."""
+    size = 2 * ORIGIN_SHIFT / 2 ** z
+    left = -ORIGIN_SHIFT + x * size
+    top = ORIGIN_SHIFT - y * size
+    return left, top - size, left + size, top
+
+
+# Fonction pour calculer l'emprise Web Mercator d'un raster
+@lru_cache(maxsize=64)
+def mercator_bounds(path, mtime_ns):
+    """Retourne l'emprise EPSG:3857 d'un raster."""
+    with rasterio.open(path) as src:
+        return transform_bounds(src.crs, "EPSG:3857", *src.bounds)
+
+
+# Fonction pour produire une tuile PNG à partir d'un raster
+def render_tile(path, colormap, z, x, y):
+    """Reprojette la zone de la tuile sur une grille 256x256 et retourne le PNG."""
+    mtime_ns = os.stat(path).st_mtime_ns
+    bounds = tile_bounds(z, x, y)
+    left, bottom, right, top = mercator_bounds(path, mtime_ns)
+    if bounds[0] >= right or bounds[2] <= left or bounds[1] >= top or bounds[3] <= bottom:
+        return None
+    return encode_png(render_warped(path, colormap, "EPSG:3857", bounds, TILE_SIZE, TILE_SIZE))
+
+
+class TileCache:
+    """Cache LRU en mémoire des tuiles PNG rendues, partagé entre fils."""
+
+    def __init__(self, max_entries=DEFAULT_TILE_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            if key not in self.entries:
+                return None
+            self.entries.move_to_end(key)
+            return self.entries[key]
+
+    def put(self, key, value):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+
+# Tuile transparente renvoyée en dehors de l'emprise d'une couche
+EMPTY_TILE = encode_png(np.zeros((TILE_SIZE, TILE_SIZE, 4), dtype=np.uint8))
+
+
+class TileRequestHandler(BaseHTTPRequestHandler):
+    """Répond aux requêtes ``/{palette}/{couche}/{z}/{x}/{y}.png``."""
+
+    def do_GET(self):
+        match = TILE_PATH.match(self.path.split("?", 1)[0])
+        if not match or (match["colormap"] != "rgb" and match["colormap"] not in ALLOWED_COLORMAPS):
+            self.send_error(404)
+            return
+        path = os.path.join(self.server.root, f"{match['layer']}.tif")
+        if not os.path.exists(path):
+            self.send_error(404)
+            return
+        z, x, y = int(match["z"]), int(match["x"]), int(match["y"])
+        key = (match["layer"], match["colormap"], z, x, y)
+        body = self.server.tiles.get(key)
+        if body is None:
+            try:
+                body = render_tile(path, match["colormap"], z, x, y) or EMPTY_TILE
+            except Exception as e:
+                # Le détail de l'erreur reste dans le journal du serveur
+                BaseHTTPRequestHandler.log_message(self, "Rendu de la tuile %s impossible : %r", self.path, e)
+                self.send_error(500)
+                return
+            self.server.tiles.put(key, body)
+        self.send_response(200)
+        self.send_header("Content-Type", "image/png")
+        self.send_header("Content-Length", str(len(body)))
+        self.send_header("Cache-Control", "public, max-age=86400")
+        self.send_header("Access-Control-Allow-Origin", "*")
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TileServer(ThreadingHTTPServer):
+    """Serveur HTTP multi-fils servant les tuiles des rasters d'un répertoire."""
+
+    daemon_threads = True
+
+    def __init__(self, root=DEFAULT_CACHE_DIR, host=DEFAULT_HOST, port=DEFAULT_PORT, public_url=None,
+                 max_tiles=DEFAULT_TILE_CACHE_SIZE):
+        super().__init__((host, port), TileRequestHandler)
+        self.root = root
+        self.tiles = TileCache(max_tiles)
+        public_url = public_url or os.environ.get("TILE_SERVER_PUBLIC_URL")
+        # Sans URL publique, seul un navigateur sur la machine du serveur atteint les tuiles
+        self.public = bool(public_url)
+        # Écoute sur toutes les interfaces : le navigateur local passe par la boucle locale
+        local_host = "127.0.0.1" if host in ("", "0.0.0.0", "::") else host
+        self.public_url = (public_url or f"http://{local_host}:{self.server_address[1]}").rstrip("/")
+
+    def tile_url(self, tiff_path, colormap=None):
+        """Retourne le modèle d'URL ``{z}/{x}/{y}`` d'un raster du répertoire servi."""
+        layer = os.path.splitext(os.path.basename(tiff_path))[0]
+        return f"{self.public_url}/{colormap or 'rgb'}/{layer}/{{z}}/{{x}}/{{y}}.png"
+
+
+# Fonction pour démarrer le serveur de tuiles dans un fil d'arrière-plan
+def start_tile_server(root=DEFAULT_CACHE_DIR, host=DEFAULT_HOST, port=DEFAULT_PORT, public_url=None):
+    """Démarre un ``TileServer`` dans un fil démon et le retourne."""
+    server = TileServer(root, host, port, public_url)
+    threading.Thread(target=server.serve_forever, name="tile-server", daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serveur de tuiles XYZ pour les rasters du cache.")
+    parser.add_argument("--root", default=DEFAULT_CACHE_DIR)
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT or 8765)
+    args = parser.parse_args()
+    server = TileServer(args.root, args.host, args.port)
+    print(f"Tuiles servies sur {server.public_url}")
+    server.serve_forever()
+
+
+if __name__ == "__main__":
+    main()
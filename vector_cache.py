@@ -0,0 +1,189 @@
+"""Cache binaire des couches vectorielles (FlatGeobuf) avec géométries simplifiées par zoom.
+
+Chaque couche (GeoJSON téléversé, ``routeQSD.txt``, courbes de niveau) est lue
+une seule fois par pyogrio, reprojetée en EPSG:4326 et enregistrée dans le
+cache disque au format FlatGeobuf, accompagnée d'une version simplifiée par
+niveau de ``SIMPLIFIED_ZOOMS`` (entités de mêmes attributs réunies,
+tolérance d'un pixel, coordonnées arrondies à la précision utile). Les
+fichiers FlatGeobuf portent un index spatial : la carte ne lit que les entités
+qui recoupent l'emprise affichée, dans la version adaptée au zoom courant.
+"""
+import hashlib
+import math
+import os
+from functools import lru_cache
+
+import numpy as np
+import pyogrio
+import shapely
+
+from raster_cache import RasterCache, file_digest
+from raster_io import reprojection_cache
+
+VECTOR_CRS = "EPSG:4326"
+# Niveaux pré-simplifiés ; au-delà du dernier, les géométries complètes sont lues
+SIMPLIFIED_ZOOMS = (6, 9, 12, 15)
+# Marge (fraction de l'emprise) conservée autour de la vue lors du découpage des géométries
+CLIP_MARGIN = 0.1
+
+
+# Fonction pour calculer la taille d'un pixel (en degrés) à un niveau de zoom
+def pixel_size(zoom):
+    """Retourne la largeur en degrés d'un pixel de tuile 256 px au niveau ``zoom``."""
+    return 360.0 / (256 * 2 ** zoom)
+
+
+# Fonction pour choisir la version simplifiée adaptée à un zoom
+def level_for_zoom(zoom):
+    """Retourne le plus petit niveau pré-simplifié >= ``zoom``, ou None (géométries complètes)."""
+    if zoom is None:
+        return None
+    return next((level for level in SIMPLIFIED_ZOOMS if zoom <= level), None)
+
+
+# Fonction pour regrouper les entités de mêmes attributs
+def collected(gdf):
+    """Regroupe en une entité multi-partie les entités de mêmes attributs (tronçons d'une route...).
+
+    Les géométries ne sont pas fusionnées (pas d'union), seulement réunies ;
+    les lignes sont raccordées. Les couches de types mixtes sont laissées telles quelles.
+    """
+    columns = [column for column in gdf.columns if column != gdf.geometry.name]
+    if not columns or not gdf.duplicated(columns).any():
+        return gdf
+    parts, part_index = shapely.get_parts(gdf.geometry.values, return_index=True)
+    kinds = set(shapely.get_type_id(parts).tolist())
+    builders = {0: shapely.multipoints, 1: shapely.multilinestrings, 3: shapely.multipolygons}
+    if len(kinds) != 1 or kinds.pop() not in builders:
+        return gdf
+    group = gdf.groupby(columns, dropna=False, sort=False).ngroup().to_numpy()[part_index]
+    order = np.argsort(group, kind="stable")
+    geometries = builders[shapely.get_type_id(parts[0])](parts[order], indices=group[order])
+    if shapely.get_type_id(parts[0]) == 1:
+        geometries = shapely.line_merge(geometries)
+    return gdf[~gdf.duplicated(columns)].set_geometry(geometries)
+
+
+# Fonction pour simplifier une couche pour un niveau de zoom
+def simplified(gdf, level):
+    """Retourne ``gdf`` regroupé, simplifié à un pixel près et arrondi à la précision utile au niveau ``level``."""
+    gdf = collected(gdf)
+    grid = 10 ** math.floor(math.log10(pixel_size(level) / 2))
+    geometries = shapely.simplify(gdf.geometry.values, pixel_size(level), preserve_topology=True)
+    gdf = gdf.set_geometry(shapely.set_precision(geometries, grid))
+    return gdf[~gdf.geometry.is_empty]
+
+
+# Fonction pour écrire un GeoDataFrame en FlatGeobuf
+def write_flatgeobuf(gdf, output_path):
+    """Écrit ``gdf`` en FlatGeobuf indexé dans ``output_path`` (quelle que soit son extension).
+
+    ``output_path`` est le fichier temporaire fourni par ``RasterCache.get_or_create`` :
+    le fichier intermédiaire en garde le nom ``.part`` et reste reconnu comme temporaire.
+    """
+    # Le pilote FlatGeobuf traite un chemin sans extension .fgb comme un répertoire
+    fgb_path = f"{output_path}.fgb"
+    try:
+        pyogrio.write_dataframe(gdf, fgb_path, driver="FlatGeobuf")
+        os.replace(fgb_path, output_path)
+    finally:
+        if os.path.exists(fgb_path):
+            os.remove(fgb_path)
+
+
+class VectorLayer:
+    """Couche vectorielle du cache, désignée par l'empreinte de son contenu source."""
+
+    def __init__(self, key, cache=None):
+        self.key = key
+        self.cache = cache or reprojection_cache()
+
+    def path(self, level=None):
+        """Retourne le FlatGeobuf complet (``level`` None) ou simplifié pour un niveau."""
+        if level is None:
+            path = self.cache.get(self.key, suffix=".fgb")
+            if path is None:
+                raise FileNotFoundError("Couche vectorielle absente du cache : veuillez la téléverser à nouveau.")
+            return path
+        full_path = self.path()
+
+        def write_level(output_path):
+            write_flatgeobuf(simplified(pyogrio.read_dataframe(full_path), level), output_path)
+
+        return self.cache.get_or_create(self.key, write_level, suffix=f".z{level}.fgb")
+
+    def paths(self):
+        """Chemins des fichiers de la couche dans le cache (complet puis simplifiés), qu'ils existent ou non."""
+        return [self.cache.path_for(self.key, ".fgb")] + [
+            self.cache.path_for(self.key, f".z{level}.fgb") for level in SIMPLIFIED_ZOOMS
+        ]
+
+    def read(self, bounds=None, zoom=None):
+        """Lit les entités (GeoDataFrame) qui recoupent ``bounds`` (ouest, sud, est, nord), simplifiées pour ``zoom``.
+
+        Les versions simplifiées réunissant des entités étendues, leurs
+        géométries sont découpées à l'emprise (avec une marge).
+        """
+        level = level_for_zoom(zoom)
+        gdf = pyogrio.read_dataframe(self.path(level), bbox=tuple(bounds) if bounds else None)
+        if level is None or not bounds:
+            return gdf
+        west, south, east, north = bounds
+        dx, dy = (east - west) * CLIP_MARGIN, (north - south) * CLIP_MARGIN
+        gdf = gdf.set_geometry(shapely.clip_by_rect(gdf.geometry.values, west - dx, south - dy, east + dx, north + dy))
+        return gdf[~gdf.geometry.is_empty]
+
+    def bounds(self):
+        """Retourne l'emprise (ouest, sud, est, nord) de la couche."""
+        return tuple(pyogrio.read_info(self.path())["total_bounds"])
+
+    def geojson(self, bounds=None, zoom=None):
+        """Retourne la FeatureCollection des entités de l'emprise, simplifiées pour ``zoom``."""
+        return self.read(bounds, zoom).to_geo_dict(na="drop", drop_id=True)
+
+    def features(self):
+        """Retourne la FeatureCollection complète (géométries d'origine), mémorisée."""
+        return _full_geojson(self.path())
+
+
+# Fonction pour lire (une fois par fichier) la FeatureCollection complète d'une couche
+@lru_cache(maxsize=16)
+def _full_geojson(path):
+    return pyogrio.read_dataframe(path).to_geo_dict(na="drop", drop_id=True)
+
+
+# Fonction pour convertir un fichier vectoriel en couche du cache
+def ingest_vector(source_path, cache=None, progress=None):
+    """Convertit un fichier vectoriel (GeoJSON, GeoPackage...) en ``VectorLayer`` (une seule fois par contenu).
+
+    ``progress(niveaux_prêts, total)`` est appelé après chaque version simplifiée.
+    """
+    cache = cache or reprojection_cache()
+    key = RasterCache.make_key("vector", file_digest(source_path))
+
+    def write_full(output_path):
+        gdf = pyogrio.read_dataframe(source_path)
+        gdf = gdf.set_crs(VECTOR_CRS) if gdf.crs is None else gdf.to_crs(VECTOR_CRS)
+        gdf = gdf[gdf.geometry.notna() & ~gdf.geometry.is_empty]
+        write_flatgeobuf(gdf, output_path)
+
+    cache.get_or_create(key, write_full, suffix=".fgb")
+    layer = VectorLayer(key, cache)
+    for done, level in enumerate(SIMPLIFIED_ZOOMS, 1):
+        layer.path(level)
+        if progress:
+            progress(done, len(SIMPLIFIED_ZOOMS))
+    return layer
+
+
+# Fonction pour convertir un GeoJSON téléversé en couche du cache
+def ingest_geojson_bytes(data, cache=None):
+    """Enregistre le contenu GeoJSON dans le cache puis le convertit en ``VectorLayer``."""
+    cache = cache or reprojection_cache()
+    key = RasterCache.make_key("geojson", hashlib.sha256(data).hexdigest())
+
+    def write_source(output_path):
+        with open(output_path, "wb") as f:
+            f.write(data)
+
+    return ingest_vector(cache.get_or_create(key, write_source, suffix=".geojson"), cache)
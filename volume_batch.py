@@ -0,0 +1,159 @@
+"""Calcul des volumes et surfaces d'un site sans interface : API et ligne de commande.
+
+Ce module n'importe ni Streamlit, ni folium, ni matplotlib : il peut être
+appelé depuis un script ou une tâche planifiée.
+
+    python volume_batch.py --mns mns.tif --mnt mnt.tif --polygons stocks.geojson -o volumes.csv
+    python volume_batch.py --mns mns.tif --polygons stocks.geojson --reference-altitude 52.5 -o volumes.geojson
+    python volume_batch.py --sites sites.csv -o volumes.csv
+
+Le fichier ``--sites`` est un CSV avec les colonnes ``site``, ``mns``, ``mnt``
+(facultative) et ``polygons`` ; les résultats de tous les sites sont réunis.
+"""
+import argparse
+import csv
+import os
+import sys
+
+import geopandas as gpd
+import numpy as np
+import pandas as pd
+import rasterio
+from rasterio.crs import CRS
+
+from raster_io import RESAMPLING_METHODS, DEFAULT_RESAMPLING, cached_reproject_tiff
+from volume_engine import compute_polygon_volumes, compute_polygon_volumes_mns_only
+
+# Projection de travail des calculs de volumes (UTM 30N, Côte d'Ivoire)
+DEFAULT_WORK_CRS = "EPSG:32630"
+
+RESULT_COLUMNS = ["name", "volume_m3", "area_m2", "reference_m", "error"]
+
+
+# Fonction pour obtenir le nom de chaque polygone
+def polygon_names(polygons_gdf):
+    """Retourne le nom de chaque polygone (propriété ``name``, sinon « Polygone n »)."""
+    names = []
+    for position, idx in enumerate(polygons_gdf.index):
+        name = None
+        if "properties" in polygons_gdf.columns and isinstance(polygons_gdf["properties"].iloc[position], dict):
+            name = polygons_gdf["properties"].iloc[position].get("name")
+        elif "name" in polygons_gdf.columns:
+            name = polygons_gdf["name"].iloc[position]
+        if name is None or (isinstance(name, float) and np.isnan(name)):
+            name = f"Polygone {idx + 1 if isinstance(idx, (int, np.integer)) else idx}"
+        names.append(name)
+    return names
+
+
+# Fonction pour calculer les volumes de tous les polygones d'un site
+def compute_site_volumes(mns_path, polygons_gdf, mnt_path=None, reference_altitude=None, workers=1, progress=None):
+    """Calcule volume et surface de chaque polygone et retourne un GeoDataFrame de résultats.
+
+    Avec ``mnt_path`` : volume MNS - MNT. Sans : volume du MNS au-dessus de
+    ``reference_altitude``, ou de la cote moyenne du contour si elle vaut None.
+    Les rasters doivent partager un CRS métrique ; les polygones y sont
+    reprojetés. La colonne ``error`` décrit les polygones non calculés.
+    """
+    with rasterio.open(mns_path) as src:
+        polygons = polygons_gdf.to_crs(src.crs)
+    geometries = polygons.geometry.values
+    if mnt_path is not None:
+        volumes, areas, inside = compute_polygon_volumes(mns_path, mnt_path, geometries, workers=workers, progress=progress)
+        references = np.full(len(polygons), np.nan)
+    else:
+        volumes, areas, references, inside = compute_polygon_volumes_mns_only(
+            mns_path, geometries, reference_altitude=reference_altitude, workers=workers, progress=progress
+        )
+    errors = [None] * len(polygons)
+    for position in range(len(polygons)):
+        if not inside[position]:
+            errors[position] = "le polygone est en dehors de l'emprise du raster"
+        elif mnt_path is None and np.isnan(references[position]):
+            errors[position] = "aucune élévation valide sur le contour du polygone"
+    failed = np.array([error is not None for error in errors], dtype=bool)
+    return gpd.GeoDataFrame({
+        "name": polygon_names(polygons_gdf),
+        "volume_m3": np.where(failed, np.nan, volumes),
+        "area_m2": np.where(failed, np.nan, areas),
+        "reference_m": references,
+        "error": errors,
+    }, geometry=polygons_gdf.geometry.values, crs=polygons_gdf.crs, index=polygons_gdf.index)
+
+
+# Fonction pour reprojeter un raster dans la projection de travail si nécessaire
+def to_work_crs(path, work_crs, resampling):
+    """Retourne un chemin vers le raster dans ``work_crs`` (reprojection mise en cache)."""
+    with rasterio.open(path) as src:
+        if src.crs == CRS.from_user_input(work_crs):
+            return path
+    return cached_reproject_tiff(path, work_crs, resampling=resampling)
+
+
+# Fonction pour traiter un site décrit par ses fichiers
+def process_site(mns, polygons, mnt=None, reference_altitude=None, work_crs=DEFAULT_WORK_CRS,
+                 resampling=DEFAULT_RESAMPLING["MNS"], workers=1):
+    """Lit les polygones, reprojette les rasters et retourne les résultats du site."""
+    polygons_gdf = gpd.read_file(polygons)
+    mns_path = to_work_crs(mns, work_crs, resampling)
+    mnt_path = to_work_crs(mnt, work_crs, resampling) if mnt else None
+    return compute_site_volumes(mns_path, polygons_gdf, mnt_path=mnt_path,
+                                reference_altitude=reference_altitude, workers=workers)
+
+
+# Fonction pour écrire les résultats en CSV ou en GeoJSON
+def write_results(results, output):
+    """Écrit les résultats selon l'extension de ``output`` (.geojson ou .csv, ``-`` pour la sortie standard)."""
+    if output != "-" and os.path.splitext(output)[1].lower() in (".geojson", ".json"):
+        results.to_crs("EPSG:4326").to_file(output, driver="GeoJSON")
+        return
+    columns = [column for column in ["site"] + RESULT_COLUMNS if column in results.columns]
+    table = results[columns]
+    if output == "-":
+        table.to_csv(sys.stdout, index=False, float_format="%.3f")
+    else:
+        table.to_csv(output, index=False, float_format="%.3f")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Calcul des volumes et surfaces par polygone.")
+    parser.add_argument("--mns", help="MNS (GeoTIFF)")
+    parser.add_argument("--mnt", help="MNT (GeoTIFF) ; sans MNT, méthode MNS seul")
+    parser.add_argument("--polygons", help="polygones (GeoJSON, GeoPackage, Shapefile...)")
+    parser.add_argument("--sites", help="CSV de sites : colonnes site, mns, mnt, polygons")
+    parser.add_argument("--reference-altitude", type=float,
+                        help="cote de référence (MNS seul) ; par défaut, cote moyenne du contour")
+    parser.add_argument("--crs", default=DEFAULT_WORK_CRS, help="projection métrique de calcul")
+    parser.add_argument("--resampling", choices=[method.name for method in RESAMPLING_METHODS.values()],
+                        default=DEFAULT_RESAMPLING["MNS"].name)
+    parser.add_argument("--workers", type=int, default=1, help="nombre de processus de calcul")
+    parser.add_argument("-o", "--output", default="-", help="fichier .csv ou .geojson (défaut : CSV sur la sortie standard)")
+    args = parser.parse_args(argv)
+
+    resampling = next(method for method in RESAMPLING_METHODS.values() if method.name == args.resampling)
+    options = {"reference_altitude": args.reference_altitude, "work_crs": args.crs,
+               "resampling": resampling, "workers": args.workers}
+    if args.sites:
+        frames = []
+        with open(args.sites, newline="", encoding="utf-8") as f:
+            for row in csv.DictReader(f):
+                try:
+                    results = process_site(row["mns"], row["polygons"], mnt=row.get("mnt") or None, **options)
+                except Exception as e:
+                    print(f"Site {row['site']} : {e}", file=sys.stderr)
+                    continue
+                results.insert(0, "site", row["site"])
+                frames.append(results.to_crs("EPSG:4326"))
+        if not frames:
+            parser.error("aucun site n'a pu être calculé")
+        results = gpd.GeoDataFrame(pd.concat(frames, ignore_index=True), crs="EPSG:4326")
+    elif args.mns and args.polygons:
+        results = process_site(args.mns, args.polygons, mnt=args.mnt, **options)
+    else:
+        parser.error("indiquer --mns et --polygons, ou --sites")
+    write_results(results, args.output)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,378 @@
+"""Moteur de calcul des volumes et surfaces par polygone (sans Streamlit).
+
+Les rasters sont ouverts une seule fois : tous les polygones sont rasterisés
+dans des grilles d'étiquettes couvrant l'emprise de leur union, découpée en
+tuiles ; la différence MNS - MNT est lue une fois par tuile, puis les volumes
+et surfaces de chaque polygone sont obtenus par des réductions ``np.bincount``.
+Les lots de tuiles peuvent être répartis sur un pool de processus.
+"""
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import rasterio
+from rasterio import windows
+from rasterio.enums import Resampling
+from rasterio.features import geometry_window, rasterize
+from rasterio.vrt import WarpedVRT
+import shapely
+from shapely import STRtree, bounds as shapely_bounds
+from shapely.geometry import box
+
+import instrumentation
+
+# Côté (pixels) des tuiles traitées à la fois (borne la mémoire utilisée)
+DEFAULT_TILE_SIZE = 1024
+# Nombre de tuiles par lot confié à un processus de calcul
+TILES_PER_TASK = 4
+# En dessous de ce nombre de lots, le démarrage d'un pool coûte plus qu'il ne rapporte
+PARALLEL_MIN_TASKS = 8
+
+
+# Fonction pour vérifier si deux rasters partagent la même grille
+def same_grid(src_a, src_b):
+    """Indique si deux jeux de données ont même CRS, transformation et taille."""
+    return (
+        src_a.crs == src_b.crs
+        and src_a.transform.almost_equals(src_b.transform)
+        and src_a.width == src_b.width
+        and src_a.height == src_b.height
+    )
+
+
+# Fonction pour répartir les polygones en groupes sans recouvrement
+def assign_disjoint_groups(geometries):
+    """Attribue à chaque polygone un groupe dont les membres ne se touchent pas.
+
+    Une grille d'étiquettes ne stocke qu'un polygone par pixel : les polygones
+    qui se chevauchent sont donc rasterisés dans des passes distinctes afin que
+    chacun conserve tous ses pixels, comme avec un découpage individuel.
+    """
+    tree = STRtree(geometries)
+    group_of = np.full(len(geometries), -1, dtype=np.int64)
+    for position, geometry in enumerate(geometries):
+        neighbours = tree.query(geometry, predicate="intersects")
+        taken = set(group_of[neighbours[neighbours != position]].tolist())
+        group = 0
+        while group in taken:
+            group += 1
+        group_of[position] = group
+    return group_of
+
+
+# Fonction pour identifier les polygones qui recouvrent l'emprise du raster
+def polygons_overlapping_raster(src, geometries):
+    """Retourne un masque booléen des polygones qui recouvrent le raster."""
+    raster_box = box(*src.bounds)
+    return np.array([
+        not geometry.is_empty and geometry.intersects(raster_box)
+        for geometry in geometries
+    ], dtype=bool)
+
+
+# Fonction pour lire une fenêtre en float64 avec masque des pixels invalides
+def read_valid_band(src, window, band=1):
+    """Lit une bande sur une fenêtre et retourne les valeurs et leur validité."""
+    data = src.read(band, window=window, masked=True)
+    values = np.ma.getdata(data).astype(np.float64, copy=False)
+    valid = ~np.ma.getmaskarray(data) & ~np.isnan(values)
+    return values, valid
+
+
+# Fonction pour densifier le contour extérieur d'un polygone à la résolution du raster
+def densified_boundary(polygon, spacing):
+    """Retourne les coordonnées (x, y) du contour extérieur avec un point tous les ``spacing``."""
+    ring = shapely.segmentize(polygon.exterior, max_segment_length=spacing)
+    coords = shapely.get_coordinates(ring)
+    return coords[:, 0], coords[:, 1]
+
+
+# Fonction pour échantillonner un raster en un lot de points
+def sample_points(src, xs, ys, interpolation="bilinear", band=1):
+    """Échantillonne la bande ``band`` aux points (xs, ys) dans le CRS du raster.
+
+    Seuls les blocs du raster qui contiennent des points sont lus. Les points
+    hors emprise ou sur des pixels nodata/NaN valent NaN ; en bilinéaire, les
+    voisins invalides sont écartés et les poids renormalisés.
+    """
+    inverse = ~src.transform
+    cols, rows = inverse * (np.asarray(xs, dtype=np.float64), np.asarray(ys, dtype=np.float64))
+    if interpolation == "nearest":
+        pixel_rows = np.floor(rows).astype(np.int64)[:, None]
+        pixel_cols = np.floor(cols).astype(np.int64)[:, None]
+        weights = np.ones_like(pixel_rows, dtype=np.float64)
+    elif interpolation == "bilinear":
+        # Coordonnées relatives aux centres des pixels
+        rows, cols = rows - 0.5, cols - 0.5
+        row0, col0 = np.floor(rows), np.floor(cols)
+        dr, dc = rows - row0, cols - col0
+        pixel_rows = (row0[:, None] + np.array([0, 0, 1, 1])).astype(np.int64)
+        pixel_cols = (col0[:, None] + np.array([0, 1, 0, 1])).astype(np.int64)
+        weights = np.column_stack([(1 - dr) * (1 - dc), (1 - dr) * dc, dr * (1 - dc), dr * dc])
+    else:
+        raise ValueError(f"Interpolation inconnue : {interpolation}")
+
+    values = np.full(pixel_rows.shape, np.nan)
+    inside = (pixel_rows >= 0) & (pixel_rows < src.height) & (pixel_cols >= 0) & (pixel_cols < src.width)
+    block_height, block_width = src.block_shapes[band - 1]
+    block_ids = (pixel_rows // block_height) * ((src.width + block_width - 1) // block_width) + pixel_cols // block_width
+    for block_id in np.unique(block_ids[inside]):
+        in_block = inside & (block_ids == block_id)
+        block_row = pixel_rows[in_block].min() // block_height * block_height
+        block_col = pixel_cols[in_block].min() // block_width * block_width
+        window = windows.Window(block_col, block_row, min(block_width, src.width - block_col),
+                                min(block_height, src.height - block_row))
+        data, valid = read_valid_band(src, window, band)
+        local_rows = pixel_rows[in_block] - block_row
+        local_cols = pixel_cols[in_block] - block_col
+        values[in_block] = np.where(valid[local_rows, local_cols], data[local_rows, local_cols], np.nan)
+
+    usable = ~np.isnan(values)
+    weights = np.where(usable, weights, 0.0)
+    total = weights.sum(axis=1)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        return np.where(total > 0, (np.where(usable, values, 0.0) * weights).sum(axis=1) / total, np.nan)
+
+
+# Fonction pour calculer la cote moyenne sur le contour d'un polygone
+def average_boundary_elevation(src, polygon, interpolation="bilinear"):
+    """Moyenne des élévations échantillonnées le long du contour densifié du polygone."""
+    spacing = min(abs(src.transform.a), abs(src.transform.e))
+    xs, ys = densified_boundary(polygon, spacing)
+    elevations = sample_points(src, xs, ys, interpolation=interpolation)
+    elevations = elevations[~np.isnan(elevations)]
+    if not len(elevations):
+        raise ValueError("Aucune élévation valide sur le contour du polygone")
+    return float(elevations.mean())
+
+
+# Fonction pour accumuler les sommes par polygone sur une fenêtre
+def accumulate_window(labels, diff, valid, sums, counts):
+    """Ajoute les sommes de différences et les nombres de pixels par étiquette."""
+    selected = valid & (labels > 0)
+    if not selected.any():
+        return
+    label_values = labels[selected]
+    sums += np.bincount(label_values, weights=diff[selected], minlength=len(sums))
+    counts += np.bincount(label_values, minlength=len(counts))
+
+
+# Fonction pour découper l'emprise des polygones en tuiles de calcul
+def plan_tiles(src, geometries, positions, tile_size=DEFAULT_TILE_SIZE):
+    """Découpe l'emprise de l'union des polygones en tuiles et liste les polygones de chacune.
+
+    Retourne une liste de couples (fenêtre, positions des polygones qui la
+    recouvrent) ; les tuiles qu'aucun polygone ne recouvre (même s'il en
+    touche le bord) sont écartées.
+    """
+    union_window = geometry_window(src, list(geometries[positions]))
+    row_stop = union_window.row_off + union_window.height
+    col_stop = union_window.col_off + union_window.width
+    tiles = [
+        windows.Window(col_off, row_off, min(tile_size, col_stop - col_off), min(tile_size, row_stop - row_off))
+        for row_off in range(union_window.row_off, row_stop, tile_size)
+        for col_off in range(union_window.col_off, col_stop, tile_size)
+    ]
+    tile_boxes = [box(*windows.bounds(tile, src.transform)) for tile in tiles]
+    tile_index, geometry_index = STRtree(geometries[positions]).query(tile_boxes, predicate="intersects")
+    order = np.argsort(tile_index, kind="stable")
+    tile_index, geometry_index = tile_index[order], positions[geometry_index[order]]
+    starts = np.searchsorted(tile_index, np.arange(len(tiles) + 1))
+    geometry_bounds = shapely_bounds(geometries)
+    planned = []
+    for t, tile in enumerate(tiles):
+        hits = geometry_index[starts[t]:starts[t + 1]]
+        if not len(hits):
+            continue
+        # La lecture est limitée à la partie de la tuile couverte par ses polygones
+        b = geometry_bounds[hits]
+        hits_window = windows.from_bounds(b[:, 0].min(), b[:, 1].min(), b[:, 2].max(), b[:, 3].max(), src.transform)
+        hits_window = hits_window.round_offsets(op="floor").round_lengths(op="ceil")
+        # Des polygones qui ne font que toucher le bord de la tuile n'y couvrent aucun pixel
+        if not windows.intersect(tile, hits_window):
+            continue
+        planned.append((windows.intersection(tile, hits_window), hits))
+    return planned
+
+
+class TileAccumulator:
+    """Accumule par polygone la somme de MNS - MNT (ou du MNS seul) et le nombre de pixels valides.
+
+    Chaque instance ouvre ses propres jeux de données : une instance par
+    processus de calcul.
+    """
+
+    def __init__(self, mns_path, mnt_path, geometries, group_of):
+        self.geometries = geometries
+        self.group_of = group_of
+        self.mns_src = rasterio.open(mns_path)
+        self.mnt_file = self.mnt_src = None
+        if mnt_path is not None:
+            self.mnt_file = self.mnt_src = rasterio.open(mnt_path)
+            if not same_grid(self.mns_src, self.mnt_file):
+                # Le MNT est rééchantillonné à la volée sur la grille du MNS
+                self.mnt_src = WarpedVRT(
+                    self.mnt_file, crs=self.mns_src.crs, transform=self.mns_src.transform,
+                    width=self.mns_src.width, height=self.mns_src.height, resampling=Resampling.nearest,
+                )
+
+    def process(self, tiles):
+        """Traite une liste de tuiles (fenêtre, polygones) et retourne (sommes, nombres de pixels)."""
+        sums = np.zeros(len(self.geometries) + 1, dtype=np.float64)
+        counts = np.zeros(len(self.geometries) + 1, dtype=np.int64)
+        for tile, hits in tiles:
+            tile_transform = windows.transform(tile, self.mns_src.transform)
+            out_shape = (int(tile.height), int(tile.width))
+            mns_data, valid = read_valid_band(self.mns_src, tile)
+            if self.mnt_src is not None:
+                mnt_data, mnt_valid = read_valid_band(self.mnt_src, tile)
+                valid &= mnt_valid
+                diff = np.where(valid, mns_data - mnt_data, 0.0)
+            else:
+                diff = np.where(valid, mns_data, 0.0)
+            hit_groups = self.group_of[hits]
+            for group in np.unique(hit_groups):
+                labels = rasterize(
+                    ((self.geometries[p], p + 1) for p in hits[hit_groups == group]),
+                    out_shape=out_shape, transform=tile_transform, fill=0, dtype="int32",
+                )
+                accumulate_window(labels, diff, valid, sums, counts)
+        return sums, counts
+
+    def close(self):
+        for dataset in (self.mnt_src, self.mnt_file, self.mns_src):
+            if dataset is not None and not dataset.closed:
+                dataset.close()
+
+
+# Accumulateur propre à chaque processus du pool de calcul
+_worker_accumulator = None
+
+
+def _init_worker(mns_path, mnt_path, geometries, group_of):
+    global _worker_accumulator
+    _worker_accumulator = TileAccumulator(mns_path, mnt_path, geometries, group_of)
+
+
+def _run_worker_task(tiles):
+    return _worker_accumulator.process(tiles)
+
+
+# Fonction pour obtenir la taille d'un pixel (octets) de chaque raster lu (mesures)
+def raster_item_sizes(mns_path, mnt_path):
+    sizes = {}
+    for path in (mns_path, mnt_path):
+        if path is not None:
+            with rasterio.open(path) as src:
+                sizes[f"bytes_read:{os.path.basename(path)}"] = np.dtype(src.dtypes[0]).itemsize
+    return sizes
+
+
+# Fonction pour compter les octets lus par un lot de tuiles (depuis le processus principal, en série comme en parallèle)
+def count_bytes_read(item_sizes, task):
+    if item_sizes:
+        pixels = sum(int(tile.width) * int(tile.height) for tile, _ in task)
+        for counter, item_size in item_sizes.items():
+            instrumentation.count(counter, pixels * item_size)
+
+
+# Fonction pour accumuler les sommes par polygone, en série ou dans un pool de processus
+@instrumentation.traced()
+def accumulate_polygon_sums(mns_path, mnt_path, geometries, workers=1, progress=None, tile_size=DEFAULT_TILE_SIZE):
+    """Retourne (sommes, nombres de pixels, polygones recouvrant le raster, aire d'un pixel).
+
+    ``sommes`` est la somme par polygone de MNS - MNT, ou du MNS seul si
+    ``mnt_path`` vaut None. Le travail est découpé en lots de tuiles fixes,
+    indépendants du nombre de processus, et les résultats partiels sont
+    additionnés dans l'ordre des lots : le résultat est identique en série et
+    en parallèle. ``progress(lots_traités, total)`` est appelé après chaque lot.
+    """
+    geometries = np.asarray(list(geometries), dtype=object)
+    count = len(geometries)
+    sums = np.zeros(count + 1, dtype=np.float64)
+    counts = np.zeros(count + 1, dtype=np.int64)
+    with rasterio.open(mns_path) as src:
+        inside = polygons_overlapping_raster(src, geometries)
+        cell_area = abs(src.transform.a * src.transform.e)
+        if not inside.any():
+            return sums[1:], counts[1:], inside, cell_area
+        positions = np.flatnonzero(inside)
+        tiles = plan_tiles(src, geometries, positions, tile_size)
+    group_of = np.full(count, -1, dtype=np.int64)
+    group_of[positions] = assign_disjoint_groups(geometries[positions])
+    tasks = [tiles[i:i + TILES_PER_TASK] for i in range(0, len(tiles), TILES_PER_TASK)]
+    read_sizes = raster_item_sizes(mns_path, mnt_path) if instrumentation.current_trace() is not None else {}
+
+    if workers <= 1 or len(tasks) < PARALLEL_MIN_TASKS:
+        accumulator = TileAccumulator(mns_path, mnt_path, geometries, group_of)
+        try:
+            results = map(accumulator.process, tasks)
+            for done, (task_sums, task_counts) in enumerate(results, 1):
+                sums += task_sums
+                counts += task_counts
+                count_bytes_read(read_sizes, tasks[done - 1])
+                if progress:
+                    progress(done, len(tasks))
+        finally:
+            accumulator.close()
+    else:
+        with ProcessPoolExecutor(
+            max_workers=min(workers, len(tasks)),
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(mns_path, mnt_path, geometries, group_of),
+        ) as pool:
+            try:
+                for done, (task_sums, task_counts) in enumerate(pool.map(_run_worker_task, tasks), 1):
+                    sums += task_sums
+                    counts += task_counts
+                    count_bytes_read(read_sizes, tasks[done - 1])
+                    if progress:
+                        progress(done, len(tasks))
+            except BaseException:
+                # Interruption (annulation levée par ``progress``...) : les lots non commencés sont abandonnés
+                pool.shutdown(wait=False, cancel_futures=True)
+                raise
+    return sums[1:], counts[1:], inside, cell_area
+
+
+# Fonction pour calculer les volumes de tous les polygones en une passe
+def compute_polygon_volumes(mns_path, mnt_path, geometries, workers=1, progress=None, tile_size=DEFAULT_TILE_SIZE):
+    """Calcule volume (m³) et surface (m²) de chaque polygone à partir de MNS - MNT.
+
+    Les géométries doivent être dans le CRS du MNS. Retourne trois tableaux
+    alignés sur ``geometries`` : volumes, surfaces et un masque indiquant les
+    polygones qui recouvrent le raster (les autres ont un volume nul).
+    """
+    sums, counts, inside, cell_area = accumulate_polygon_sums(
+        mns_path, mnt_path, geometries, workers=workers, progress=progress, tile_size=tile_size
+    )
+    return sums * cell_area, counts * cell_area, inside
+
+
+# Fonction pour calculer les volumes de tous les polygones à partir du MNS seul
+def compute_polygon_volumes_mns_only(mns_path, geometries, reference_altitude=None, interpolation="bilinear",
+                                     workers=1, progress=None, tile_size=DEFAULT_TILE_SIZE):
+    """Calcule volume (m³) et surface (m²) de chaque polygone au-dessus d'une cote de référence.
+
+    Si ``reference_altitude`` vaut None, la référence de chaque polygone est la
+    cote moyenne de son contour. Retourne volumes, surfaces, cotes de référence
+    (NaN si aucune élévation valide sur le contour) et le masque des polygones
+    qui recouvrent le raster.
+    """
+    geometries = np.asarray(list(geometries), dtype=object)
+    sums, counts, inside, cell_area = accumulate_polygon_sums(
+        mns_path, None, geometries, workers=workers, progress=progress, tile_size=tile_size
+    )
+    if reference_altitude is None:
+        references = np.full(len(geometries), np.nan)
+        with rasterio.open(mns_path) as src:
+            for position in np.flatnonzero(inside):
+                try:
+                    references[position] = average_boundary_elevation(src, geometries[position], interpolation)
+                except ValueError:
+                    pass
+    else:
+        references = np.full(len(geometries), float(reference_altitude))
+    return (sums - references * counts) * cell_area, counts * cell_area, references, inside